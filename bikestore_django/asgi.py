@@ -2,6 +2,13 @@
 ASGI config for bikestore_django project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+It is optional: the Procfile serves wsgi.py, where /api/events/ answers each
+reconnect with the latest figures. Serving this module instead keeps the
+live dashboard stream open and pushes every change:
+
+    gunicorn bikestore_django.asgi:application -k uvicorn_worker.UvicornWorker
+
+or ``uvicorn bikestore_django.asgi:application`` for local use.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
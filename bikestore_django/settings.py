@@ -52,6 +52,8 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
+    'store.nplusone.QueryInspectionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,6 +91,18 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts so concurrent
+            # sales queue on the busy timeout instead of failing mid-way.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            # A file-backed test database honours the busy timeout, which the
+            # shared-cache in-memory default does not (needed by the
+            # concurrent sale tests).
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -142,7 +156,98 @@ import dj_database_url
 import os
 
 if 'DATABASE_URL' in os.environ:
-    DATABASES['default'] = dj_database_url.config(conn_max_age=600, ssl_require=True)
+    DATABASES['default'] = dj_database_url.config(conn_max_age=600, conn_health_checks=True, ssl_require=True)
+
+# Connection pooling (store.pooling), on unless DB_POOL=0. PostgreSQL uses
+# Django's pool (needs psycopg 3 and psycopg_pool) and SQLite the pooled
+# store.backends.sqlite3 engine; other databases keep persistent
+# connections. Each process holds at most DB_POOL_MAX_SIZE connections, and
+# a request waits up to DB_POOL_TIMEOUT seconds for a free one. Idle
+# connections above DB_POOL_MIN_SIZE are closed after DB_POOL_MAX_IDLE
+# seconds.
+from store.pooling import configure_pool
+
+DB_POOL = os.environ.get('DB_POOL', '1') != '0'
+DB_POOL_OPTIONS = {
+    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+}
+if DB_POOL:
+    configure_pool(DATABASES['default'], DB_POOL_OPTIONS)
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# CACHE_URL picks the backend: locmem:// (one cache per process),
+# file:///path/to/dir (shared by the workers on one host) or
+# redis://host:6379/0 (any Redis-compatible server, shared by every host;
+# needs the redis package). Cache invalidations and ETags must reach every
+# worker, so without CACHE_URL a server running more than one worker
+# (WEB_CONCURRENCY, which gunicorn reads for its worker count) shares a file
+# cache in the temporary directory; a single process, as in development and
+# tests, uses the local-memory cache. check --deploy warns about locmem.
+from urllib.parse import urlsplit
+import tempfile
+
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+if WEB_CONCURRENCY > 1:
+    DEFAULT_CACHE_URL = f'file://{os.path.join(tempfile.gettempdir(), "bikestore-cache")}'
+else:
+    DEFAULT_CACHE_URL = 'locmem://'
+CACHE_URL = urlsplit(os.environ.get('CACHE_URL', DEFAULT_CACHE_URL))
+if CACHE_URL.scheme in ('redis', 'rediss'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL.geturl(),
+    }}
+elif CACHE_URL.scheme == 'file':
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_URL.path,
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': CACHE_URL.netloc or 'bikestore',
+    }}
+CACHES['default']['KEY_PREFIX'] = 'bikestore'
+
+# Seconds each cached response is kept, overriding store.caching.DEFAULT_TTLS
+STORE_CACHE_TTLS = {}
+
+# Request metrics (store.metrics), served at /metrics. STORE_METRICS_TOKEN,
+# when set, is the bearer token scrapers must send; STORE_METRICS_LOG=1 also
+# logs every request's timings as a JSON line to the store.metrics logger.
+STORE_METRICS_TOKEN = os.environ.get('STORE_METRICS_TOKEN')
+STORE_METRICS_LOG = os.environ.get('STORE_METRICS_LOG') == '1'
+
+# N+1 and slow-query detection (store.nplusone) for development and CI, off
+# by default. 'warn' logs every query shape run STORE_NPLUSONE_THRESHOLD times
+# in one request, and every query over STORE_SLOW_QUERY_MS; 'strict' also
+# fails the request, so STORE_QUERY_INSPECTION=strict python manage.py test
+# fails on new N+1s. STORE_NPLUSONE_ALLOW lists known findings by location.
+STORE_QUERY_INSPECTION = os.environ.get('STORE_QUERY_INSPECTION', '')
+STORE_NPLUSONE_THRESHOLD = 5
+STORE_SLOW_QUERY_MS = 100
+STORE_NPLUSONE_ALLOW = []
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'metrics': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'store.metrics': {'handlers': ['metrics'], 'level': 'INFO', 'propagate': False},
+        'store.nplusone': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
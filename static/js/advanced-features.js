@@ -376,12 +376,30 @@ class AdvancedFeaturesManager {
     setupRealTimeUpdates() {
         if (!this.options.enableRealTimeUpdates) return;
         
+        if (window.EventSource) {
+            // Animate when main.js relays a change pushed by the server
+            this.stopRealTimeUpdates();
+            this.liveHandler = () => this.updateRealTimeData();
+            document.addEventListener('store:live', this.liveHandler);
+            return;
+        }
+        
         // Simulate real-time data updates
         this.realTimeInterval = setInterval(() => {
             this.updateRealTimeData();
         }, 5000);
     }
     
+    stopRealTimeUpdates() {
+        if (this.realTimeInterval) {
+            clearInterval(this.realTimeInterval);
+        }
+        if (this.liveHandler) {
+            document.removeEventListener('store:live', this.liveHandler);
+            this.liveHandler = null;
+        }
+    }
+    
     updateRealTimeData() {
         // Update statistics with animation
         const statNumbers = document.querySelectorAll('.stat-number');
@@ -1035,9 +1053,7 @@ class AdvancedFeaturesManager {
     
     pauseAnimations() {
         document.body.style.animationPlayState = 'paused';
-        if (this.realTimeInterval) {
-            clearInterval(this.realTimeInterval);
-        }
+        this.stopRealTimeUpdates();
     }
     
     resumeAnimations() {
@@ -1104,9 +1120,7 @@ class AdvancedFeaturesManager {
     
     destroy() {
         // Cleanup
-        if (this.realTimeInterval) {
-            clearInterval(this.realTimeInterval);
-        }
+        this.stopRealTimeUpdates();
         
         const particleContainer = document.getElementById('particle-system');
         if (particleContainer) {
@@ -563,19 +563,37 @@ class DashboardManager {
     }
     
     setupRealTimeUpdates() {
-        if (this.isRealTimeEnabled) {
+        if (!this.isRealTimeEnabled) return;
+        
+        if (window.EventSource) {
+            // main.js relays the changes the server pushes
+            this.liveHandler = (event) => {
+                if (event.detail.type !== 'snapshot') {
+                    this.refreshAllCharts();
+                }
+            };
+            document.addEventListener('store:live', this.liveHandler);
+        } else {
             this.updateInterval = setInterval(() => {
                 this.refreshAllCharts();
             }, this.refreshRate);
         }
     }
     
+    stopRealTimeUpdates() {
+        clearInterval(this.updateInterval);
+        if (this.liveHandler) {
+            document.removeEventListener('store:live', this.liveHandler);
+            this.liveHandler = null;
+        }
+    }
+    
     toggleRealTime() {
         const button = document.getElementById('toggleRealTime');
         
         if (this.isRealTimeEnabled) {
             this.isRealTimeEnabled = false;
-            clearInterval(this.updateInterval);
+            this.stopRealTimeUpdates();
             button.innerHTML = '<i class="fas fa-pause"></i> Real-time: OFF';
             button.classList.remove('btn-outline-info');
             button.classList.add('btn-outline-secondary');
@@ -770,9 +788,7 @@ class DashboardManager {
         this.charts.forEach(chart => chart.destroy());
         this.charts.clear();
         
-        if (this.updateInterval) {
-            clearInterval(this.updateInterval);
-        }
+        this.stopRealTimeUpdates();
     }
 }
 
@@ -108,8 +108,11 @@ $(document).ready(function() {
         $('.loading-indicator').hide();
     });
 
-    // Auto-refresh for dashboard (every 5 minutes)
-    if (window.location.pathname === '/') {
+    // Live dashboard: the server pushes changes over /api/events/; browsers
+    // without EventSource fall back to refreshing every 5 minutes
+    if (window.location.pathname === '/' && window.EventSource) {
+        connectLiveUpdates();
+    } else if (window.location.pathname === '/') {
         setInterval(function() {
             $.ajax({
                 url: '/api/dashboard/',
@@ -122,6 +125,27 @@ $(document).ready(function() {
     }
 });
 
+// Apply the dashboard events pushed by the server and relay each one to the
+// other scripts as a 'store:live' DOM event
+function connectLiveUpdates() {
+    var source = new EventSource('/api/events/');
+    ['snapshot', 'sale', 'stock', 'low_stock'].forEach(function(type) {
+        source.addEventListener(type, function(event) {
+            var data = JSON.parse(event.data);
+            if (type === 'snapshot' || type === 'sale') {
+                updateDashboardStats(data);
+            }
+            if (type === 'low_stock' && window.notify) {
+                data.bikes.forEach(function(bike) {
+                    window.notify.warning('Low stock', bike.name + ': ' + bike.stock + ' left');
+                });
+            }
+            document.dispatchEvent(new CustomEvent('store:live', {detail: {type: type, data: data}}));
+        });
+    });
+    return source;
+}
+
 // Function to update dashboard statistics
 function updateDashboardStats(data) {
     if (data.total_bikes !== undefined) {
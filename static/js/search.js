@@ -261,19 +261,25 @@ class SearchManager {
             }
         }
         
+        const pattern = term.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+        
         textNodes.forEach(textNode => {
             const parent = textNode.parentNode;
             if (parent.classList.contains(this.options.highlightClass)) return;
             
-            const text = textNode.textContent;
-            const regex = new RegExp(`(${term})`, 'gi');
-            const highlightedText = text.replace(regex, `<mark class="${this.options.highlightClass}">$1</mark>`);
-            
-            if (highlightedText !== text) {
-                const span = document.createElement('span');
-                span.innerHTML = highlightedText;
-                parent.replaceChild(span, textNode);
-            }
+            // Build nodes rather than markup: the text is already unescaped
+            const span = document.createElement('span');
+            textNode.textContent.split(new RegExp(`(${pattern})`, 'gi')).forEach((part, index) => {
+                if (index % 2 === 1) {
+                    const mark = document.createElement('mark');
+                    mark.className = this.options.highlightClass;
+                    mark.textContent = part;
+                    span.appendChild(mark);
+                } else if (part) {
+                    span.appendChild(document.createTextNode(part));
+                }
+            });
+            parent.replaceChild(span, textNode);
         });
     }
     
@@ -349,7 +355,8 @@ class SearchManager {
             const suggestion = document.createElement('button');
             suggestion.type = 'button';
             suggestion.className = 'dropdown-item';
-            suggestion.innerHTML = `<i class="fas fa-history me-2"></i>${term}`;
+            suggestion.innerHTML = '<i class="fas fa-history me-2"></i>';
+            suggestion.appendChild(document.createTextNode(term));
             
             suggestion.addEventListener('click', () => {
                 input.value = term;
@@ -388,12 +395,13 @@ class SearchManager {
             <div class="no-results text-center py-5">
                 <i class="fas fa-search fa-3x text-muted mb-3"></i>
                 <h5 class="text-muted">No results found</h5>
-                <p class="text-muted">No items match your search for "<strong>${query}</strong>"</p>
+                <p class="text-muted">No items match your search for "<strong class="no-results-query"></strong>"</p>
                 <button class="btn btn-outline-primary" onclick="searchManager.clearSearch()">
                     Clear Search
                 </button>
             </div>
         `;
+        container.querySelector('.no-results-query').textContent = query;
     }
     
     showSearchError(message) {
@@ -409,11 +417,13 @@ class SearchManager {
         toast.innerHTML = `
             <div class="d-flex">
                 <div class="toast-body">
-                    <strong>${title}</strong><br>${message}
+                    <strong></strong><br>
                 </div>
                 <button type="button" class="btn-close btn-close-white me-2 m-auto" data-bs-dismiss="toast"></button>
             </div>
         `;
+        toast.querySelector('.toast-body strong').textContent = title;
+        toast.querySelector('.toast-body').appendChild(document.createTextNode(message));
         
         return toast;
     }
@@ -498,7 +508,8 @@ class SearchManager {
     addResultsCount(container, count, query) {
         const countElement = document.createElement('div');
         countElement.className = 'search-results-count text-muted mb-3';
-        countElement.innerHTML = `Found <strong>${count}</strong> results for "<strong>${query}</strong>"`;
+        countElement.innerHTML = `Found <strong>${count}</strong> results for "<strong></strong>"`;
+        countElement.querySelector('strong:last-child').textContent = query;
         container.insertBefore(countElement, container.firstChild);
     }
     
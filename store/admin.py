@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Bike, Customer, Sale, Supplier, Inventory
+from .models import Bike, Customer, Sale, Supplier, Inventory, StockMovement, StockSnapshot
 
 
 @admin.register(Supplier)
@@ -14,12 +14,16 @@ class SupplierAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
     def bike_count(self, obj):
-        count = obj.bike_set.count()
+        count = obj.bike_count
         if count > 0:
             url = reverse('admin:store_bike_changelist') + f'?supplier__id__exact={obj.id}'
             return format_html('<a href="{}">{} bikes</a>', url, count)
         return '0 bikes'
     bike_count.short_description = 'Bikes Supplied'
+    bike_count.admin_order_field = 'bike_count'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_bike_counts()
 
 
 @admin.register(Bike)
@@ -28,7 +32,7 @@ class BikeAdmin(admin.ModelAdmin):
     list_filter = ['type', 'supplier', 'created_at']
     search_fields = ['brand', 'model', 'color']
     ordering = ['brand', 'model']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['units_sold', 'revenue', 'created_at', 'updated_at']
     list_editable = ['price', 'stock_quantity']
     
     fieldsets = (
@@ -41,6 +45,10 @@ class BikeAdmin(admin.ModelAdmin):
         ('Description', {
             'fields': ('description',)
         }),
+        ('Sales', {
+            'fields': ('units_sold', 'revenue'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -66,14 +74,15 @@ class CustomerAdmin(admin.ModelAdmin):
     list_filter = ['created_at']
     search_fields = ['name', 'email', 'phone']
     ordering = ['name']
-    readonly_fields = ['created_at', 'updated_at', 'total_purchases_display', 'purchase_count_display']
+    readonly_fields = ['created_at', 'updated_at', 'total_purchases_display', 'purchase_count_display',
+                       'last_purchase_at']
 
     fieldsets = (
         ('Personal Information', {
             'fields': ('name', 'email', 'phone', 'address')
         }),
         ('Purchase Statistics', {
-            'fields': ('total_purchases_display', 'purchase_count_display'),
+            'fields': ('total_purchases_display', 'purchase_count_display', 'last_purchase_at'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -86,6 +95,7 @@ class CustomerAdmin(admin.ModelAdmin):
         total = obj.total_purchases
         return f'₹{total:,.2f}'
     total_purchases_display.short_description = 'Total Spent'
+    total_purchases_display.admin_order_field = 'lifetime_spend'
 
     def purchase_count_display(self, obj):
         count = obj.purchase_count
@@ -94,6 +104,7 @@ class CustomerAdmin(admin.ModelAdmin):
             return format_html('<a href="{}">{} purchases</a>', url, count)
         return '0 purchases'
     purchase_count_display.short_description = 'Number of Purchases'
+    purchase_count_display.admin_order_field = 'purchase_count'
 
 
 @admin.register(Sale)
@@ -157,6 +168,37 @@ class InventoryAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('bike')
 
 
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """Browse rows that are only ever written by the application"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(ReadOnlyAdmin):
+    list_display = ['created_at', 'bike', 'kind', 'quantity', 'sale', 'note']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['bike__brand', 'bike__model', 'note']
+    ordering = ['-created_at', '-id']
+    list_select_related = ['bike', 'sale__customer', 'sale__bike']
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(ReadOnlyAdmin):
+    list_display = ['taken_at', 'bike', 'quantity']
+    list_filter = ['taken_at']
+    search_fields = ['bike__brand', 'bike__model']
+    ordering = ['-taken_at']
+    list_select_related = ['bike']
+
+
 # Admin site customization
 admin.site.site_header = "Bike Store Management System"
 admin.site.site_title = "Bike Store Admin"
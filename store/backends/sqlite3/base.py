@@ -0,0 +1,58 @@
+"""
+The SQLite backend with pooled connections.
+
+Set ``OPTIONS['pool']`` to a dict of ``store.pooling.ConnectionPool``
+options (``min_size``, ``max_size``, ``timeout``, ``max_idle`` and
+``max_lifetime``), or to True for the defaults; with ``CONN_HEALTH_CHECKS``
+connections are tested with ``SELECT 1`` before they are handed out, as
+Django's PostgreSQL pool does. Closing a connection, which Django does at
+the end of every request, returns it to the pool open. In-memory databases
+are never pooled.
+"""
+from django.db.backends.sqlite3 import base
+from django.utils.asyncio import async_unsafe
+
+from store.pooling import DEFAULT_OPTIONS, ConnectionPool, PoolTimeout, get_pool
+
+
+def check_connection(connection):
+    connection.execute('SELECT 1').fetchone()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        options = params.pop('pool', True)
+        self.pool_options = {**DEFAULT_OPTIONS, **(options if isinstance(options, dict) else {})}
+        return params
+
+    @property
+    def pool(self):
+        if self.is_in_memory_db():
+            return None
+        # The test runner renames the database on the same wrapper
+        return get_pool((self.alias, str(self.settings_dict['NAME'])), self._create_pool)
+
+    def _create_pool(self):
+        params = self.get_connection_params()
+        check = check_connection if self.settings_dict['CONN_HEALTH_CHECKS'] else None
+        # Opening a connection only reads the settings, which every thread's wrapper shares
+        return ConnectionPool(lambda: super(DatabaseWrapper, self).get_new_connection(params), check=check,
+                              **self.pool_options)
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            return pool.getconn()
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        pool = self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
@@ -0,0 +1,149 @@
+"""
+Versioned caching for the dashboard, chart and JSON API responses.
+
+Every cached value depends on one or more topics: a model name (``'bike'``)
+for anything computed over a whole table, a model name and primary key
+(``'bike:7'``) for a single row, or ``'rollups'`` for the sales rollups.
+Each topic has a version number in the cache and a value's key contains the
+versions of its topics, so ``invalidate(topic)`` makes exactly the
+dependent entries unreachable with one increment; the orphaned entries
+expire on their own.
+
+The model signals in ``signals.py`` invalidate the affected topics on every
+save and delete, and ``rollups.py`` invalidates ``'rollups'`` whenever it
+writes. Code that writes with ``bulk_create`` or ``update()`` calls
+``invalidate`` itself.
+
+``etag`` turns the same versions into an HTTP validator, so a client polling
+an unchanged endpoint can be answered with 304 Not Modified from the version
+counters alone.
+
+Entries live for ``STORE_CACHE_TTLS[name]`` seconds (a setting merged over
+``DEFAULT_TTLS``) in the ``default`` cache, which ``CACHE_URL`` selects.
+"""
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Seconds each kind of entry is kept, by name
+DEFAULT_TTLS = {
+    'dashboard': 60,
+    'api_dashboard': 60,
+    'sales_by_bike_type': 300,
+    'bike_inventory': 300,
+    'bike_price': 300,
+    'sales_series': 60,
+    'search': 30,
+    'count': 300,
+}
+
+# Every whole-table topic
+TABLES = ('supplier', 'bike', 'customer', 'sale')
+
+
+def ttl(name):
+    return getattr(settings, 'STORE_CACHE_TTLS', {}).get(name, DEFAULT_TTLS[name])
+
+
+def _version_key(topic):
+    return f'store:version:{topic}'
+
+
+def _start(key):
+    # A clock-based start cannot repeat a version an evicted counter reached
+    cache.add(key, time.time_ns(), None)
+
+
+def versions(topics):
+    """Current version of each topic, starting any that are not set"""
+    keys = [_version_key(topic) for topic in topics]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            _start(key)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+async def aversions(topics):
+    """versions() for async code"""
+    keys = [_version_key(topic) for topic in topics]
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, time.time_ns(), None)
+            found[key] = await cache.aget(key)
+    return [found[key] for key in keys]
+
+
+def _key(name, topics, versions, parts):
+    stamp = ','.join(f'{topic}.{version}' for topic, version in zip(topics, versions))
+    key = f'store:{name}:{stamp}'
+    if parts:
+        key += ':' + hashlib.sha1(repr(parts).encode()).hexdigest()
+    return key
+
+
+def make_key(name, topics, *parts):
+    """Cache key for name over the current versions of topics"""
+    return _key(name, topics, versions(topics), parts)
+
+
+def etag(name, topics, *parts):
+    """Strong validator for name that changes whenever one of topics is invalidated"""
+    return hashlib.sha1(make_key(name, topics, *parts).encode()).hexdigest()
+
+
+def cached(name, topics, compute, *parts, timeout=None):
+    """compute(), kept until its TTL passes or one of topics is invalidated.
+
+    parts distinguish entries of the same name, such as different queries.
+    """
+    return cache.get_or_set(
+        make_key(name, topics, *parts), compute, ttl(name) if timeout is None else timeout
+    )
+
+
+async def acached(name, topics, compute, *parts, timeout=None):
+    """cached() for async views; compute is an async callable"""
+    key = _key(name, topics, await aversions(topics), parts)
+    value = await cache.aget(key)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value, ttl(name) if timeout is None else timeout)
+    return value
+
+
+def _bump(topics):
+    for topic in topics:
+        key = _version_key(topic)
+        try:
+            cache.incr(key)
+        except ValueError:
+            _start(key)
+
+
+def invalidate(*topics, using=None):
+    """Make every entry that depends on any of topics stale.
+
+    Inside a transaction the versions are bumped again on commit, so a
+    request that cached the old rows in between cannot leave them behind.
+    """
+    _bump(topics)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: _bump(topics), using=using, robust=True)
+
+
+def table_topics(queryset):
+    """Topics of the store tables a queryset reads, joins included"""
+    tables = {queryset.model._meta.db_table}
+    tables.update(join.table_name for join in queryset.query.alias_map.values())
+    return sorted(
+        model._meta.model_name
+        for model in apps.get_app_config('store').get_models()
+        if model._meta.db_table in tables
+    )
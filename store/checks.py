@@ -0,0 +1,18 @@
+"""
+System checks for the deployment settings the store relies on.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Cache versions must be shared by every worker process"""
+    if settings.CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+        return [Warning(
+            'The default cache is local to each process, so cache invalidations and ETags made '
+            'in one worker are not seen by the others.',
+            hint='Set CACHE_URL to a file:// or redis:// cache, or WEB_CONCURRENCY to the number of workers.',
+            id='store.W001',
+        )]
+    return []
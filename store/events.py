@@ -0,0 +1,260 @@
+"""
+In-process publish/subscribe for live dashboard updates.
+
+Writes publish small delta events once, after their transaction commits:
+
+* ``sale``: the new sales and the overall totals they leave behind
+* ``stock``: the new stock level of each bike that changed
+* ``low_stock``: bikes that just fell below ``LOW_STOCK_LEVEL``, with the
+  new low-stock count
+
+The figures are absolute rather than increments, so a client that sees an
+event twice (or after a snapshot that already includes it) stays correct.
+Each event is computed and encoded once and the same bytes are handed to
+every subscriber, one per open ``/api/events/`` stream, through a bounded
+queue, so the cost of a write does not grow with the number of open
+dashboards. A subscriber that falls a full queue behind gets a fresh
+snapshot instead of the events it missed.
+
+Subscribers wait in the ASGI event loop while writes usually run in worker
+threads, so events cross over with ``call_soon_threadsafe``. Only writes
+made in the same process reach its subscribers, and event IDs only count
+within it: serve the event stream and the writes from one ASGI process.
+
+Under WSGI a stream would hold a worker for as long as it stays open, and
+the workers share nothing but the database and the cache. There ``poll``
+answers each reconnect on its own: the event ID is the version of the
+dashboard's cache topics, which every worker sees, and a client whose ID is
+out of date gets a snapshot, whichever worker served it before.
+"""
+from collections import deque
+from functools import partial
+import asyncio
+import itertools
+import json
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Bike
+from .rollups import sales_totals
+from .stats import LOW_STOCK_LEVEL
+
+# Events kept for clients reconnecting with Last-Event-ID
+HISTORY = 100
+# Events a slow subscriber may fall behind by before it is resynced
+QUEUE_SIZE = 100
+# Idle seconds between comments that keep proxies from closing the stream
+KEEPALIVE_SECONDS = 15
+
+
+class Event:
+    """A published event, encoded once in the text/event-stream format"""
+    __slots__ = ('id', 'type', 'data', 'encoded')
+
+    def __init__(self, id, type, data):
+        self.id = id
+        self.type = type
+        self.data = data
+        payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+        self.encoded = f'id: {id}\nevent: {type}\ndata: {payload}\n\n'.encode()
+
+    def __repr__(self):
+        return f'<Event {self.id} {self.type}>'
+
+
+class Subscription:
+    """One subscriber's queue, fed from any thread"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def _deliver(self, event):
+        # Runs in the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        """The next event, or None when events were dropped and a snapshot is due"""
+        event = await self.queue.get()
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return None
+        return event
+
+
+class Broker:
+    """Fan published events out to every subscription"""
+
+    def __init__(self, history=HISTORY):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self.last_id = 0
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def subscribe(self, last_event_id=None, loop=None):
+        """Register a subscription in loop (default: the running loop).
+
+        Returns (subscription, missed events); missed is None when the events
+        after last_event_id are no longer all known and a snapshot is due.
+        """
+        subscription = Subscription(loop or asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+            missed = None
+            if last_event_id is not None and last_event_id <= self.last_id:
+                missed = [event for event in self._history if event.id > last_event_id]
+                if (missed[0].id if missed else self.last_id + 1) != last_event_id + 1:
+                    missed = None
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, type, data):
+        with self._lock:
+            self.last_id = next(self._ids)
+            event = Event(self.last_id, type, data)
+            self._history.append(event)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # The loop has shut down without unsubscribing
+                self.unsubscribe(subscription)
+        return event
+
+    def skip(self):
+        """Note a change nobody was listening for.
+
+        Clients reconnecting from before it cannot catch up from the history
+        and get a snapshot instead.
+        """
+        with self._lock:
+            self.last_id = next(self._ids)
+            self._history.clear()
+
+
+broker = Broker()
+
+
+def _low_stock(bikes, previous):
+    crossed = [
+        bike for bike in bikes
+        if bike['stock'] < LOW_STOCK_LEVEL
+        and (previous.get(bike['id']) is None or previous[bike['id']] >= LOW_STOCK_LEVEL)
+    ]
+    if crossed:
+        broker.publish('low_stock', {
+            'bikes': crossed,
+            'low_stock_count': Bike.objects.filter(stock_quantity__lt=LOW_STOCK_LEVEL).count(),
+        })
+
+
+def _bikes(pks):
+    return [
+        {'id': bike.pk, 'name': str(bike), 'stock': bike.stock_quantity}
+        for bike in Bike.objects.only('id', 'brand', 'model', 'color', 'stock_quantity')
+        .filter(pk__in=pks).order_by('pk')
+    ]
+
+
+def publish_sales(sales):
+    """Announce committed sales, the totals and the stock they left behind"""
+    if not broker.has_subscribers():
+        broker.skip()
+        return
+    totals = sales_totals()
+    broker.publish('sale', {
+        'sales': [
+            {
+                'id': sale.pk,
+                'bike_id': sale.bike_id,
+                'customer_id': sale.customer_id,
+                'quantity': sale.quantity,
+                'amount': float(sale.total_amount),
+            }
+            for sale in sales
+        ],
+        'total_sales': totals['total_sales'],
+        'total_revenue': float(totals['total_revenue']),
+    })
+
+    sold = {}
+    for sale in sales:
+        sold[sale.bike_id] = sold.get(sale.bike_id, 0) + sale.quantity
+    bikes = _bikes(sold)
+    broker.publish('stock', {'bikes': bikes})
+    _low_stock(bikes, {bike['id']: bike['stock'] + sold[bike['id']] for bike in bikes})
+
+
+def publish_stock(previous):
+    """Announce new stock levels; previous maps bike id to its old stock (None if new)"""
+    if not broker.has_subscribers():
+        broker.skip()
+        return
+    bikes = _bikes(previous)
+    broker.publish('stock', {'bikes': bikes})
+    _low_stock(bikes, previous)
+
+
+def on_commit(publish, *args):
+    """Run publish(*args) once the current transaction commits"""
+    transaction.on_commit(partial(publish, *args), robust=True)
+
+
+async def stream(snapshot, last_event_id=None):
+    """The text/event-stream for one subscriber.
+
+    snapshot is an async callable returning the full dashboard figures. They
+    are sent first, unless the client can catch up from the history, and
+    again whenever the subscriber falls behind.
+    """
+    subscription, missed = broker.subscribe(last_event_id)
+    try:
+        yield b'retry: 5000\n\n'
+        if missed is None:
+            last_id = broker.last_id
+            yield Event(last_id, 'snapshot', await snapshot()).encoded
+        else:
+            for event in missed:
+                yield event.encoded
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if event is None:
+                last_id = broker.last_id
+                yield Event(last_id, 'snapshot', await snapshot()).encoded
+            else:
+                yield event.encoded
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def poll(snapshot, version, last_event_id=None):
+    """The body for one reconnect of a client that cannot hold a stream open.
+
+    version names the current figures in every process and is sent as the
+    event ID; the client gets a snapshot unless it already has that version,
+    and reconnects after the retry delay.
+    """
+    body = b'retry: 5000\n\n'
+    if last_event_id != version:
+        body += Event(version, 'snapshot', await snapshot()).encoded
+    return body
@@ -0,0 +1,260 @@
+"""
+Streaming CSV, NDJSON and XLSX exports of the bike, customer and sale lists.
+
+``ExportMixin`` turns a list view into an export of every row its filters
+select rather than one page of them. Rows are read as plain tuples with
+``iterator(chunk_size=CHUNK_SIZE)`` and written out a chunk at a time
+through a ``StreamingHttpResponse``, so memory use depends on the chunk size,
+not on how many rows are exported.
+
+Under ASGI the rows are read with ``aiterator()`` and the response streams
+from an async generator: given a sync iterator, Django's ASGI handler would
+read the whole export into memory before sending any of it.
+
+XLSX files are written as a zip stream whose worksheet holds its strings
+inline, so they need no spreadsheet library and, like the other formats,
+go out as they are produced.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from xml.sax.saxutils import escape
+import csv
+import io
+import re
+import zipfile
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+
+from . import search as search_engine
+
+# Rows fetched from the database and written out at a time
+CHUNK_SIZE = 2000
+
+
+class CSVWriter:
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def __init__(self, fields, title):
+        self.fields = fields
+
+    def _write(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def header(self):
+        return self._write([self.fields])
+
+    def rows(self, rows):
+        return self._write(rows)
+
+    def footer(self):
+        return b''
+
+
+class NDJSONWriter:
+    content_type = 'application/x-ndjson'
+    extension = 'ndjson'
+
+    def __init__(self, fields, title):
+        self.fields = fields
+        self.encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    def header(self):
+        return b''
+
+    def rows(self, rows):
+        return ''.join(
+            self.encoder.encode(dict(zip(self.fields, row))) + '\n' for row in rows
+        ).encode()
+
+    def footer(self):
+        return b''
+
+
+class _Sink:
+    """Write-only file whose contents are handed on as they are written"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_PACKAGE_RELS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_DOCUMENT_RELS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_OFFICE_TYPES = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        f'{_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{_OFFICE_TYPES}.sheet.main+xml"/>'
+        f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{_OFFICE_TYPES}.worksheet+xml"/>'
+        f'<Override PartName="/xl/styles.xml" ContentType="{_OFFICE_TYPES}.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        f'{_XML}<Relationships xmlns="{_PACKAGE_RELS}">'
+        f'<Relationship Id="rId1" Type="{_DOCUMENT_RELS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        f'{_XML}<Relationships xmlns="{_PACKAGE_RELS}">'
+        f'<Relationship Id="rId1" Type="{_DOCUMENT_RELS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_DOCUMENT_RELS}/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell styles: 0 general, 1 date and time, 2 date (built-in formats 22 and 14)
+    'xl/styles.xml': (
+        f'{_XML}<styleSheet xmlns="{_MAIN}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_EPOCH = datetime(1899, 12, 30)
+
+
+def _cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    # Spreadsheets count dates in days since their epoch, in local time
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        return f'<c s="1"><v>{(value - _EPOCH).total_seconds() / 86400}</v></c>'
+    if isinstance(value, date):
+        return f'<c s="2"><v>{(value - _EPOCH.date()).days}</v></c>'
+    text = escape(_INVALID_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class XLSXWriter:
+    content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    extension = 'xlsx'
+
+    def __init__(self, fields, title):
+        self.fields = fields
+        self.title = title
+
+    def _rows(self, rows):
+        self.sheet.write(''.join(
+            '<row>' + ''.join(_cell(value) for value in row) + '</row>' for row in rows
+        ).encode())
+        return self.sink.drain()
+
+    def header(self):
+        # Without seek() on the sink, zipfile writes each entry's sizes after its data
+        self.sink = _Sink()
+        self.zip = zipfile.ZipFile(self.sink, 'w', zipfile.ZIP_DEFLATED)
+        for name, content in _XLSX_PARTS.items():
+            self.zip.writestr(name, content)
+        self.zip.writestr('xl/workbook.xml', (
+            f'{_XML}<workbook xmlns="{_MAIN}" xmlns:r="{_DOCUMENT_RELS}"><sheets>'
+            f'<sheet name="{escape(self.title)}" sheetId="1" r:id="rId1"/>'
+            '</sheets></workbook>'
+        ))
+        self.sheet = self.zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self.sheet.write(f'{_XML}<worksheet xmlns="{_MAIN}"><sheetData>'.encode())
+        return self._rows([self.fields])
+
+    def rows(self, rows):
+        return self._rows(rows)
+
+    def footer(self):
+        self.sheet.write(b'</sheetData></worksheet>')
+        self.sheet.close()
+        self.zip.close()
+        return self.sink.drain()
+
+
+FORMATS = {
+    'csv': CSVWriter,
+    'ndjson': NDJSONWriter,
+    'xlsx': XLSXWriter,
+}
+
+
+def _stream(rows, writer, chunk_size):
+    yield writer.header()
+    rows = rows.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield writer.rows(chunk)
+    yield writer.footer()
+
+
+async def _astream(rows, writer, chunk_size):
+    yield writer.header()
+    chunk = []
+    async for row in rows.aiterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield writer.rows(chunk)
+            chunk = []
+    if chunk:
+        yield writer.rows(chunk)
+    yield writer.footer()
+
+
+class ExportMixin:
+    """List view mixin that streams every filtered row as a file.
+
+    The format comes from the ``format`` query parameter (csv, ndjson or
+    xlsx; default csv) and the other parameters are the list view's filters.
+    export_fields maps each output column to the field lookup or expression
+    it reads; export_name names the file and the worksheet.
+    """
+    export_fields = None
+    export_name = None
+    chunk_size = CHUNK_SIZE
+
+    def search(self, queryset, text):
+        # Only filter: ranked results are not a queryset that can be streamed
+        return search_engine.matches(queryset, text)
+
+    def get(self, request, *args, **kwargs):
+        format = request.GET.get('format', 'csv')
+        if format not in FORMATS:
+            return HttpResponseBadRequest(f'Unknown export format; use one of {", ".join(FORMATS)}.')
+        writer = FORMATS[format](list(self.export_fields), self.export_name.title())
+        # Named rows: Django's plain tuple iterable runs its query as soon as
+        # it is created, which aiterator() does inside the event loop
+        rows = self.get_queryset().values_list(*self.export_fields.values(), named=True)
+
+        stream = _astream if isinstance(request, ASGIRequest) else _stream
+        response = StreamingHttpResponse(stream(rows, writer, self.chunk_size), content_type=writer.content_type)
+        filename = f'{self.export_name}-{timezone.localdate():%Y%m%d}.{writer.extension}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
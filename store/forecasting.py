@@ -0,0 +1,212 @@
+"""
+Demand forecasts and suggested reorder points for every bike at once.
+
+``daily_sales`` streams every sale of the history window with one query, as
+(bike, epoch seconds, units) rows fetched a chunk at a time into NumPy
+arrays, places each on its local day by a binary search of the window's
+midnights and sums the units per bike and day. Only the days a bike sold
+anything are kept, so memory grows with the sales, not with bikes times
+days; the database does no per-row date arithmetic, which on SQLite would
+run as a Python function per row. ``forecast`` then computes for
+all bikes together, with ``np.bincount`` sums over those arrays rather than
+a loop per bike:
+
+* moving averages of daily units over the last 7 and 28 days,
+* simple exponential smoothing of daily units (the smoothed level after
+  the last day is a decay-weighted sum of the history),
+* the standard deviation of daily units over the window, giving a safety
+  stock of z * sigma * sqrt(lead time) for the chosen service level,
+* a reorder point covering the smoothed demand over the lead time plus the
+  safety stock.
+
+``apply_reorder_points`` writes the suggestions to ``Inventory`` in bulk,
+creating inventory rows for bikes without one. ``forecast_all`` does the
+whole run and can split the bikes into primary key ranges worked on by a
+process pool, each worker with its own database connection.
+
+The history ends yesterday, so a forecast made twice in a day is the same.
+"""
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from statistics import NormalDist
+import multiprocessing
+
+import numpy as np
+from django.db import connection, connections, transaction
+from django.db.models import FloatField, Func
+from django.utils import timezone
+
+from .models import Bike, Inventory
+from .timeseries import sales_in_range
+
+# Days of the trailing moving averages
+MOVING_AVERAGE_DAYS = (7, 28)
+# Sales rows fetched from the database at a time
+CHUNK_SIZE = 10000
+
+# One array per figure, aligned with bike_ids; daily figures are in units per day
+Forecast = namedtuple('Forecast', [
+    'bike_ids', 'average_7', 'average_28', 'smoothed', 'deviation', 'safety_stock', 'reorder_point',
+])
+
+
+class EpochSeconds(Func):
+    """A timestamp as seconds since the Unix epoch"""
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Doubled twice: once for this template, once for the cursor's placeholders
+        return self.as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+                           **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def history_window(days, today=None):
+    """First day of a history of days closed days ending yesterday"""
+    return (today or timezone.localdate()) - timedelta(days=days)
+
+
+def daily_sales(first_day, days, bikes=None, chunk_size=CHUNK_SIZE):
+    """(bike ids, day offsets from first_day, units) per bike and day with sales.
+
+    bikes restricts the sales to a (lowest, highest) primary key range.
+    """
+    midnights = np.array([
+        timezone.make_aware(datetime.combine(first_day + timedelta(days=day), time.min)).timestamp()
+        for day in range(days + 1)
+    ])
+    sales = sales_in_range(first_day, first_day + timedelta(days=days - 1))
+    if bikes is not None:
+        sales = sales.filter(bike_id__gte=bikes[0], bike_id__lte=bikes[1])
+    sql, params = (
+        sales.order_by().annotate(epoch=EpochSeconds('sale_date')).values_list('bike_id', 'epoch', 'quantity')
+        .query.sql_with_params()
+    )
+    chunks = [np.empty((0, 3))]
+    # Plain numbers need none of the ORM's per-row conversion
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            chunks.append(np.array(rows, dtype=np.float64))
+    rows = np.concatenate(chunks)
+
+    bike_ids = rows[:, 0].astype(np.int64)
+    offsets = np.searchsorted(midnights, rows[:, 1], side='right') - 1
+    keys, position = np.unique(bike_ids * (days + 1) + offsets, return_inverse=True)
+    units = np.bincount(position.ravel(), weights=rows[:, 2], minlength=len(keys))
+    return keys // (days + 1), keys % (days + 1), units
+
+
+def forecast(pks, sales, days, alpha=0.1, lead_time=7, service_level=0.95):
+    """Forecast every bike in the sorted array pks from daily_sales() arrays over days days"""
+    bike_ids, offsets, units = sales
+    index = np.searchsorted(pks, bike_ids)
+    count = len(pks)
+
+    def total(weights, since=0):
+        chosen = offsets >= since
+        return np.bincount(index[chosen], weights=weights[chosen], minlength=count)
+
+    averages = {window: total(units, since=days - window) / window for window in MOVING_AVERAGE_DAYS}
+    # Unrolled smoothing from a level of zero: each day weighs in by alpha * (1 - alpha) ** age
+    smoothed = alpha * total(units * (1 - alpha) ** (days - 1 - offsets))
+    mean = total(units) / days
+    deviation = np.sqrt(np.maximum(total(units * units) / days - mean * mean, 0))
+    safety_stock = NormalDist().inv_cdf(service_level) * deviation * np.sqrt(lead_time)
+    reorder_point = np.ceil(smoothed * lead_time + safety_stock - 1e-9).astype(np.int64)
+    return Forecast(
+        bike_ids=pks,
+        average_7=averages[7],
+        average_28=averages[28],
+        smoothed=smoothed,
+        deviation=deviation,
+        safety_stock=safety_stock,
+        reorder_point=reorder_point,
+    )
+
+
+def _forecast_range(job):
+    """Forecast the bikes with primary keys from lowest to highest"""
+    lowest, highest, first_day, days, options = job
+    pks = np.fromiter(
+        Bike.objects.filter(pk__gte=lowest, pk__lte=highest).order_by('pk').values_list('pk', flat=True),
+        dtype=np.int64,
+    )
+    chunk_size = options.pop('chunk_size', CHUNK_SIZE)
+    return forecast(pks, daily_sales(first_day, days, (lowest, highest), chunk_size), days, **options)
+
+
+def _init_worker():
+    # Connections inherited from the parent must not be shared
+    connections.close_all()
+
+
+def forecast_all(days=3 * 365, workers=1, chunk_size=CHUNK_SIZE, **options):
+    """Forecast every bike from the last days days of sales.
+
+    workers > 1 splits the bikes into that many primary key ranges computed
+    in parallel processes. options go to forecast().
+    """
+    first_day = history_window(days)
+    pks = np.fromiter(Bike.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+    if not len(pks):
+        nothing = np.empty(0, dtype=np.int64)
+        return forecast(pks, (nothing, nothing, np.empty(0)), days, **options)
+    shards = np.array_split(pks, min(workers, len(pks)))
+    jobs = [(int(shard[0]), int(shard[-1]), first_day, days, dict(options, chunk_size=chunk_size))
+            for shard in shards]
+    if len(jobs) > 1:
+        connections.close_all()
+        with multiprocessing.Pool(len(jobs), initializer=_init_worker) as pool:
+            parts = pool.map(_forecast_range, jobs)
+    else:
+        parts = [_forecast_range(jobs[0])]
+    return Forecast(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+
+def apply_reorder_points(result, batch_size=1000):
+    """Store result's reorder points on each bike's Inventory; returns the rows written.
+
+    A reorder point never goes below the inventory's minimum stock, and a
+    maximum stock at or below the new reorder point is raised just above it,
+    so the levels stay valid for the inventory form. Bikes without an
+    Inventory row get one with the default levels; unchanged rows are not
+    written.
+    """
+    pks = result.bike_ids
+    if not len(pks):
+        return 0
+    minimum = np.full(len(pks), Inventory._meta.get_field('minimum_stock').default, dtype=np.int64)
+    maximum = np.full(len(pks), Inventory._meta.get_field('maximum_stock').default, dtype=np.int64)
+    current = np.full(len(pks), -1, dtype=np.int64)
+    stored = np.array(list(
+        Inventory.objects.filter(bike_id__gte=int(pks[0]), bike_id__lte=int(pks[-1])).values_list(
+            'bike_id', 'minimum_stock', 'maximum_stock', 'reorder_point'
+        )
+    ), dtype=np.int64).reshape(-1, 4)
+    index = np.minimum(np.searchsorted(pks, stored[:, 0]), len(pks) - 1)
+    # Bikes added since the forecast was made are left alone
+    known = pks[index] == stored[:, 0]
+    stored, index = stored[known], index[known]
+    minimum[index], maximum[index], current[index] = stored[:, 1], stored[:, 2], stored[:, 3]
+
+    reorder_point = np.maximum(result.reorder_point, minimum)
+    maximum = np.maximum(maximum, reorder_point + 1)
+    changed = np.flatnonzero(reorder_point != current)
+    rows = [
+        Inventory(bike_id=int(pks[i]), minimum_stock=int(minimum[i]), maximum_stock=int(maximum[i]),
+                  reorder_point=int(reorder_point[i]))
+        for i in changed
+    ]
+    with transaction.atomic():
+        Inventory.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['bike'],
+            update_fields=['maximum_stock', 'reorder_point'],
+        )
+    return len(rows)
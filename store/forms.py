@@ -1,9 +1,12 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from decimal import Decimal
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Row, Column, Field
 from crispy_forms.bootstrap import FormActions
-from .models import Bike, Customer, Sale, Supplier, Inventory
+from django.utils import timezone
+from .models import Bike, Customer, Sale, SalesPeriod, Supplier, Inventory
+from .timeseries import MAX_PERIODS, period_count
 
 
 class BikeForm(forms.ModelForm):
@@ -248,4 +251,70 @@ class BikeSearchForm(forms.Form):
             FormActions(
                 Submit('submit', 'Search', css_class='btn btn-outline-primary'),
             )
-        )
\ No newline at end of file
+        )
+
+class ReportForm(forms.Form):
+    """Date range, granularity and filters of the sales reports"""
+    start_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    end_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    granularity = forms.ChoiceField(
+        required=False,
+        choices=SalesPeriod.GRANULARITIES,
+        initial='month',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    bike_type = forms.ChoiceField(
+        required=False,
+        choices=[('', 'All Types')] + Bike.BIKE_TYPES,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    supplier = forms.ModelChoiceField(
+        required=False,
+        queryset=Supplier.objects.order_by('name'),
+        empty_label='All Suppliers',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    # Chosen by email: a select of every customer would not scale
+    customer = forms.ModelChoiceField(
+        required=False,
+        queryset=Customer.objects.all(),
+        to_field_name='email',
+        widget=forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'Customer email'}),
+        error_messages={'invalid_choice': 'No customer has this email.'}
+    )
+
+    def clean(self):
+        """Default to this year so far by month"""
+        cleaned_data = super().clean()
+        if self.errors:
+            return cleaned_data
+        end = cleaned_data['end_date'] = cleaned_data.get('end_date') or timezone.localdate()
+        start = cleaned_data['start_date'] = cleaned_data.get('start_date') or end.replace(month=1, day=1)
+        granularity = cleaned_data['granularity'] = cleaned_data.get('granularity') or 'month'
+        if start > end:
+            raise ValidationError("Start date must be on or before the end date")
+        if period_count(start, end, granularity) > MAX_PERIODS:
+            raise ValidationError(
+                f"The range covers more than {MAX_PERIODS} periods; choose a shorter range or a longer period"
+            )
+        return cleaned_data
+
+
+class OrderLineForm(forms.Form):
+    """Validates one line of a multi-line order posted to the order API"""
+    customer = forms.IntegerField(min_value=1)
+    bike = forms.IntegerField(min_value=1)
+    quantity = forms.IntegerField(min_value=1)
+    sale_price = forms.DecimalField(
+        required=False,
+        max_digits=10,
+        decimal_places=2,
+        min_value=Decimal('0.01')
+    )
+    notes = forms.CharField(required=False)
@@ -0,0 +1,383 @@
+"""
+Bulk import of suppliers, bikes, customers and sales history from files.
+
+Each file is read as a stream of rows, either CSV with a header line or
+NDJSON with one object per line, and handled a batch at a time: every row
+is validated field by field against the model, the batch's references are
+resolved with one query per related table, and the valid rows are written
+in one transaction.
+
+* Bikes and customers are upserted on their natural keys (brand, model and
+  color; email) with ``bulk_create(update_conflicts=True)``. Every change
+  an import makes to a bike's stock is recorded as a stock adjustment.
+* Supplier names are not unique in the schema, so suppliers are matched by
+  name: new names are created and known ones updated.
+* Sales are inserted as history with their own ``sale_date``; they neither
+  check nor move stock. They are added to the sales rollups and counters
+  batch by batch, or these are rebuilt once at the end.
+
+The column names are the model's field names; bikes name their supplier in
+``supplier``, and sales name their customer in ``customer_email`` and their
+bike in ``bike_brand``, ``bike_model`` and ``bike_color``. CSV and NDJSON
+files from the export views import as they are; other columns are ignored.
+
+Invalid rows are skipped and reported with their line number. The rows
+done per file are saved in an ``ImportCheckpoint`` row in the same
+transaction as each batch, so an import that stops part way and is started
+again with the same files carries on exactly after the last committed batch
+and never inserts a batch's sales twice.
+"""
+from collections import namedtuple
+from itertools import islice
+import csv
+import json
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, rollups, timeseries
+from .models import Bike, Customer, ImportCheckpoint, Sale, StockMovement, Supplier
+
+ImportStats = namedtuple('ImportStats', ['rows', 'rejected', 'seconds'])
+
+
+def read_rows(path):
+    """Yield (line number, row) for each record; row is None for an unreadable line"""
+    if path.endswith(('.ndjson', '.jsonl')):
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+    else:
+        # utf-8-sig drops the byte order mark spreadsheets put in front
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def _clean(model, names, row):
+    """Validated model field values for names, from the raw row"""
+    values = {}
+    errors = {}
+    for name in names:
+        field = model._meta.get_field(name)
+        raw = row.get(name)
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if raw in (None, '') and field.has_default():
+            values[name] = field.get_default()
+            continue
+        try:
+            value = field.clean('' if raw is None else raw, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+            continue
+        if field.get_internal_type() == 'DateTimeField' and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        values[name] = value
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def _last_by(key, rows):
+    """Rows with duplicate keys collapsed to the last one, as an upsert would"""
+    return list({key(values): values for values in rows}.values())
+
+
+class SupplierImport:
+    model = Supplier
+    topic = 'supplier'
+    fields = ['name', 'contact_person', 'email', 'phone', 'address']
+
+    def resolve(self, rows):
+        return [(number, values) for number, _, values in rows]
+
+    def write(self, rows):
+        rows = _last_by(lambda values: values['name'], rows)
+        existing = {}
+        for supplier in Supplier.objects.filter(name__in=[values['name'] for values in rows]).order_by('-pk'):
+            # Of several suppliers sharing a name, the first one added is updated
+            existing[supplier.name] = supplier
+        created = []
+        updated = []
+        now = timezone.now()
+        for values in rows:
+            supplier = existing.get(values['name'])
+            if supplier is None:
+                created.append(Supplier(**values))
+                continue
+            for name, value in values.items():
+                setattr(supplier, name, value)
+            supplier.updated_at = now
+            updated.append(supplier)
+        Supplier.objects.bulk_create(created)
+        Supplier.objects.bulk_update(updated, self.fields + ['updated_at'])
+
+
+class BikeImport:
+    model = Bike
+    topic = 'bike'
+    fields = ['brand', 'model', 'color', 'type', 'price', 'stock_quantity', 'description']
+    unique_fields = ['brand', 'model', 'color']
+
+    def __init__(self, track_rollups=True):
+        self.track_rollups = track_rollups
+
+    def resolve(self, rows):
+        names = {row['supplier'].strip() for _, row, _ in rows if (row.get('supplier') or '').strip()}
+        suppliers = dict(
+            Supplier.objects.filter(name__in=names).order_by('-pk').values_list('name', 'pk')
+        )
+        resolved = []
+        for number, row, values in rows:
+            name = (row.get('supplier') or '').strip()
+            if name and name not in suppliers:
+                resolved.append((number, ValidationError({'supplier': [f'Unknown supplier "{name}"']})))
+                continue
+            values['supplier_id'] = suppliers.get(name)
+            resolved.append((number, values))
+        return resolved
+
+    def write(self, rows):
+        key = lambda values: (values['brand'], values['model'], values['color'])
+        rows = _last_by(key, rows)
+        before = {}
+        # Locked so the stock adjustments recorded below are exactly the changes made
+        for pk, *natural_key, bike_type, supplier_id, stock in Bike.objects.select_for_update().filter(
+            brand__in={values['brand'] for values in rows},
+            model__in={values['model'] for values in rows},
+        ).values_list('pk', 'brand', 'model', 'color', 'type', 'supplier_id', 'stock_quantity'):
+            before[tuple(natural_key)] = (pk, bike_type, supplier_id, stock)
+
+        Bike.objects.bulk_create(
+            [Bike(**values) for values in rows],
+            update_conflicts=True,
+            unique_fields=self.unique_fields,
+            update_fields=['type', 'price', 'stock_quantity', 'description', 'supplier', 'updated_at'],
+        )
+        # Sales already counted under a bike's old type follow it to the new one
+        for values in rows:
+            pk, old_type, old_supplier, _ = before.get(
+                key(values), (None, values['type'], values['supplier_id'], 0)
+            )
+            if old_type != values['type'] and self.track_rollups:
+                rollups.move_bike_type(pk, old_type, values['type'])
+            if old_type != values['type'] or old_supplier != values['supplier_id']:
+                timeseries.invalidate_bike(pk)
+        self._record_stock_changes(rows, before, key)
+
+    def _record_stock_changes(self, rows, before, key):
+        changes = {}
+        for values in rows:
+            pk, *_, stock = before.get(key(values), (None, None, None, 0))
+            if values['stock_quantity'] != stock:
+                changes[key(values)] = (pk, values['stock_quantity'] - stock)
+        new = [natural_key for natural_key, (pk, _) in changes.items() if pk is None]
+        pks = {}
+        if new:
+            for pk, *natural_key in Bike.objects.filter(
+                brand__in={brand for brand, _, _ in new}, model__in={model for _, model, _ in new},
+            ).values_list('pk', 'brand', 'model', 'color'):
+                pks[tuple(natural_key)] = pk
+        StockMovement.objects.bulk_create([
+            StockMovement(bike_id=pk or pks[natural_key], kind=StockMovement.ADJUSTMENT, quantity=change,
+                          note='Import')
+            for natural_key, (pk, change) in changes.items()
+        ])
+
+
+class CustomerImport:
+    model = Customer
+    topic = 'customer'
+    fields = ['email', 'name', 'phone', 'address']
+
+    def resolve(self, rows):
+        return [(number, values) for number, _, values in rows]
+
+    def write(self, rows):
+        Customer.objects.bulk_create(
+            [Customer(**values) for values in _last_by(lambda values: values['email'], rows)],
+            update_conflicts=True,
+            unique_fields=['email'],
+            update_fields=['name', 'phone', 'address', 'updated_at'],
+        )
+
+
+class SaleImport:
+    model = Sale
+    topic = 'sale'
+    fields = ['quantity', 'sale_price', 'sale_date', 'notes']
+
+    def __init__(self, track_rollups=True):
+        self.track_rollups = track_rollups
+
+    def _bike_key(self, row):
+        color = (row.get('bike_color') or '').strip() or Bike._meta.get_field('color').get_default()
+        return ((row.get('bike_brand') or '').strip(), (row.get('bike_model') or '').strip(), color)
+
+    def resolve(self, rows):
+        emails = {(row.get('customer_email') or '').strip() for _, row, _ in rows}
+        customers = dict(Customer.objects.filter(email__in=emails).values_list('email', 'pk'))
+        keys = {self._bike_key(row) for _, row, _ in rows}
+        bikes = {}
+        for pk, *natural_key, bike_type in Bike.objects.filter(
+            brand__in={brand for brand, _, _ in keys}, model__in={model for _, model, _ in keys},
+        ).values_list('pk', 'brand', 'model', 'color', 'type'):
+            bikes[tuple(natural_key)] = (pk, bike_type)
+
+        resolved = []
+        for number, row, values in rows:
+            errors = {}
+            email = (row.get('customer_email') or '').strip()
+            if email not in customers:
+                errors['customer_email'] = [f'Unknown customer "{email}"']
+            bike = bikes.get(self._bike_key(row))
+            if bike is None:
+                errors['bike'] = ['Unknown bike "{} {} ({})"'.format(*self._bike_key(row))]
+            if errors:
+                resolved.append((number, ValidationError(errors)))
+                continue
+            values['customer_id'] = customers[email]
+            values['bike_id'], values['bike_type'] = bike
+            resolved.append((number, values))
+        return resolved
+
+    def write(self, rows):
+        days = [rollups.sale_day(values['sale_date']) for values in rows]
+        timeseries.invalidate(min(days), max(days))
+        Sale.objects.bulk_create([
+            Sale(**{name: value for name, value in values.items() if name != 'bike_type'})
+            for values in rows
+        ])
+        if self.track_rollups:
+            rollups.apply_contributions(
+                rollups.SaleContribution(
+                    day=rollups.sale_day(values['sale_date']),
+                    sale_date=values['sale_date'],
+                    bike_id=values['bike_id'],
+                    bike_type=values['bike_type'],
+                    customer_id=values['customer_id'],
+                    quantity=values['quantity'],
+                    amount=values['quantity'] * values['sale_price'],
+                )
+                for values in rows
+            )
+
+
+def _message(error):
+    if hasattr(error, 'error_dict'):
+        return '; '.join(f'{name}: {" ".join(messages)}' for name, messages in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+# Tables in the order they are imported, so references are in place first
+TABLES = ['suppliers', 'bikes', 'customers', 'sales']
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class CheckpointMismatch(Exception):
+    """The checkpoint was saved for other files, or other versions of them"""
+
+
+def _load_checkpoint(name, fingerprints):
+    checkpoint = ImportCheckpoint.objects.filter(name=name).first()
+    if checkpoint is None:
+        return {}
+    if checkpoint.files != fingerprints:
+        raise CheckpointMismatch(f'Checkpoint "{name}" was saved for different input files')
+    return checkpoint.done
+
+
+def _save_checkpoint(name, fingerprints, done):
+    ImportCheckpoint.objects.update_or_create(name=name, defaults={'files': fingerprints, 'done': done})
+
+
+def import_files(files, batch_size=1000, checkpoint=None, restart=False, rebuild_rollups=False,
+                 progress=None, reject=None):
+    """Import files, a mapping of table name (see TABLES) to path.
+
+    With checkpoint, a name, an import of the same files resumes after the
+    last batch a previous run committed, unless restart is set; the
+    checkpoint is deleted once everything is imported. rebuild_rollups
+    recomputes the sales rollups at the end instead of updating them batch
+    by batch, for bike type changes as well as new sales.
+    progress, if given, is called with (table, rows done, rows/s) after
+    every batch and reject with (table, line number, message) for every
+    skipped row. Returns a mapping of table to ImportStats(rows, rejected,
+    seconds) for this run.
+    """
+    fingerprints = {table: _fingerprint(files[table]) for table in TABLES if table in files}
+    done = {}
+    if checkpoint and restart:
+        ImportCheckpoint.objects.filter(name=checkpoint).delete()
+    elif checkpoint:
+        done = _load_checkpoint(checkpoint, fingerprints)
+    importers = {
+        'suppliers': SupplierImport(),
+        'bikes': BikeImport(track_rollups=not rebuild_rollups),
+        'customers': CustomerImport(),
+        'sales': SaleImport(track_rollups=not rebuild_rollups),
+    }
+
+    stats = {}
+    for table in fingerprints:
+        importer = importers[table]
+        started = time.perf_counter()
+        skip = done.get(table, 0)
+        records = islice(read_rows(files[table]), skip, None)
+        rows = rejected = 0
+        while batch := list(islice(records, batch_size)):
+            checked = []
+            errors = []
+            for number, row in batch:
+                try:
+                    if row is None:
+                        raise ValidationError('Not a JSON object')
+                    checked.append((number, row, _clean(importer.model, importer.fields, row)))
+                except ValidationError as e:
+                    errors.append((number, e))
+            valid = []
+            for number, values in importer.resolve(checked):
+                if isinstance(values, ValidationError):
+                    errors.append((number, values))
+                else:
+                    valid.append(values)
+
+            rows += len(batch)
+            done[table] = skip + rows
+            with transaction.atomic():
+                if valid:
+                    importer.write(valid)
+                # Progress commits with the rows, so a resumed import can neither skip nor repeat them
+                if checkpoint:
+                    _save_checkpoint(checkpoint, fingerprints, done)
+                caching.invalidate(importer.topic)
+            rejected += len(errors)
+            if reject:
+                for number, error in sorted(errors, key=lambda item: item[0]):
+                    reject(table, number, _message(error))
+            if progress:
+                progress(table, skip + rows, rows / max(time.perf_counter() - started, 1e-9))
+        stats[table] = ImportStats(rows, rejected, time.perf_counter() - started)
+
+    # Bikes that changed type move their sales between rollups too
+    if rebuild_rollups:
+        rollups.rebuild_rollups(batch_size=batch_size)
+    caching.invalidate(*caching.TABLES)
+    if checkpoint:
+        ImportCheckpoint.objects.filter(name=checkpoint).delete()
+    return stats
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from store import caching
+from store.models import Bike
+import asyncio
+import io
+import sys
+import time
+
+ROUTES = ['dashboard', 'api_dashboard', 'api_bike_price', 'api_sales_by_bike_type', 'api_bike_inventory']
+
+
+def _percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/s and latency of the read-only views served through the WSGI handler '
+            'on a thread pool against the ASGI handler on an event loop')
+
+    def add_arguments(self, parser):
+        parser.add_argument('routes', nargs='*', help=f'Route names to request in turn (default: {", ".join(ROUTES)})')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per handler (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Requests in flight at once (default: 50)')
+        parser.add_argument('--uncached', action='store_true',
+                            help='Disable the response cache so every request runs its queries')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+        bike = Bike.objects.order_by('pk').first()
+        if bike is None:
+            raise CommandError('Needs at least one bike; run generate_load_data first')
+        names = options['routes'] or ROUTES
+        args = {'api_bike_price': [bike.pk]}
+        try:
+            paths = [reverse(f'store:{name}', args=args.get(name)) for name in names]
+        except Exception as e:
+            raise CommandError(f'Cannot request {", ".join(names)}: {e}')
+        paths = [paths[i % len(paths)] for i in range(options['requests'])]
+
+        ttls = {name: 0 for name in caching.DEFAULT_TTLS} if options['uncached'] else {}
+        with override_settings(ALLOWED_HOSTS=['*'], STORE_CACHE_TTLS=ttls):
+            results = [
+                ('WSGI (threads)', self._wsgi(paths, options['concurrency'])),
+                ('ASGI (event loop)', asyncio.run(self._asgi(paths, options['concurrency']))),
+            ]
+
+        self.stdout.write(
+            f'{len(paths)} requests over {", ".join(names)} at concurrency {options["concurrency"]}'
+            f'{" (uncached)" if options["uncached"] else ""}'
+        )
+        self.stdout.write(f'{"handler":<20}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for name, (elapsed, timings, errors) in results:
+            self.stdout.write(
+                f'{name:<20}{len(timings) / elapsed:>10.0f}{_percentile(timings, 0.5) * 1000:>10.1f}'
+                f'{_percentile(timings, 0.99) * 1000:>10.1f}{errors:>8}'
+            )
+        (_, (wsgi, _, _)), (_, (asgi, _, _)) = results
+        self.stdout.write(self.style.SUCCESS(f'ASGI throughput is {wsgi / asgi:.2f}x WSGI'))
+
+    def _wsgi(self, paths, concurrency):
+        handler = WSGIHandler()
+
+        def request(path):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+                'wsgi.url_scheme': 'http',
+            }
+            status = []
+            started = time.perf_counter()
+            body = handler(environ, lambda code, headers: status.append(code))
+            try:
+                b''.join(body)
+            finally:
+                # Closing fires request_finished, which releases the thread's connection
+                body.close()
+            return time.perf_counter() - started, not status[0].startswith('200')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            outcomes = list(pool.map(request, paths))
+        elapsed = time.perf_counter() - started
+        return elapsed, [timing for timing, _ in outcomes], sum(error for _, error in outcomes)
+
+    async def _asgi(self, paths, concurrency):
+        handler = ASGIHandler()
+        pending = iter(paths)
+        timings = []
+        errors = 0
+
+        async def request(path):
+            requested = False
+            status = None
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # The client stays connected until the handler finishes
+                await asyncio.Future()
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            started = time.perf_counter()
+            await handler(scope, receive, send)
+            return time.perf_counter() - started, status != 200
+
+        async def worker():
+            nonlocal errors
+            for path in pending:
+                timing, error = await request(path)
+                timings.append(timing)
+                errors += error
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, timings, errors
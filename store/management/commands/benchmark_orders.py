@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from store.models import Bike, Customer, Sale
+from store.orders import place_order
+from decimal import Decimal
+import random
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Compare a batch order against the same lines saved with sequential Sale.objects.create calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=500, help='Order lines per run (default: 500)')
+        parser.add_argument('--bikes', type=int, default=25, help='Distinct bikes in the order (default: 25)')
+        parser.add_argument('--customers', type=int, default=10, help='Distinct customers (default: 10)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated lines')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Everything runs inside one transaction that is rolled back at the
+        # end, so the benchmark never leaves rows behind.
+        with transaction.atomic():
+            bikes, customers = self._fixtures(options['bikes'], options['customers'], options['lines'])
+            lines = [
+                {
+                    'customer': rng.choice(customers).pk,
+                    'bike': rng.choice(bikes).pk,
+                    'quantity': rng.randint(1, 3),
+                }
+                for _ in range(options['lines'])
+            ]
+
+            sequential = self._measure(lambda: self._sequential(lines))
+            batch = self._measure(lambda: place_order(lines))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'{"approach":<28}{"lines":>8}{"seconds":>10}{"lines/s":>12}{"queries":>10}')
+        for name, (elapsed, queries) in (
+            ('Sale.objects.create x N', sequential),
+            ('place_order (bulk)', batch),
+        ):
+            self.stdout.write(
+                f'{name:<28}{len(lines):>8}{elapsed:>10.3f}{len(lines) / elapsed:>12.0f}{queries:>10}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Batch order is {sequential[0] / batch[0]:.1f}x faster '
+            f'with {sequential[1] / max(batch[1], 1):.0f}x fewer queries'
+        ))
+
+    def _fixtures(self, bike_count, customer_count, line_count):
+        tag = uuid.uuid4().hex[:8]
+        # Enough stock for both runs to sell every line
+        stock = line_count * 3 * 2
+        bikes = Bike.objects.bulk_create([
+            Bike(brand='Bench', model=f'{tag}-{i}', color='Black', type='Road',
+                 price=Decimal('1000.00'), stock_quantity=stock)
+            for i in range(bike_count)
+        ])
+        customers = Customer.objects.bulk_create([
+            Customer(name=f'Bench {i}', email=f'bench-{tag}-{i}@example.com',
+                     phone='0000000000', address='Benchmark')
+            for i in range(customer_count)
+        ])
+        return bikes, customers
+
+    def _sequential(self, lines):
+        for line in lines:
+            Sale.objects.create(
+                customer_id=line['customer'],
+                bike=Bike.objects.get(pk=line['bike']),
+                quantity=line['quantity'],
+            )
+
+    def _measure(self, run):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+        return elapsed, len(captured)
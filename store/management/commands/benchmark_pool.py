@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import reverse
+from store import caching
+from store.models import Bike
+from store.pooling import close_pools, configure_pool, pool_stats
+from .benchmark_api import Command as APIBenchmark, _percentile
+import copy
+
+# Short requests, where opening a connection is a noticeable share of the work
+ROUTES = ['api_bike_price', 'bike_detail', 'bike_list', 'api_bike_inventory']
+
+
+def _unpooled(database, conn_max_age):
+    database = copy.deepcopy(database)
+    database['OPTIONS'] = {name: value for name, value in database.get('OPTIONS', {}).items() if name != 'pool'}
+    if database['ENGINE'] == 'store.backends.sqlite3':
+        database['ENGINE'] = 'django.db.backends.sqlite3'
+    database['CONN_MAX_AGE'] = conn_max_age
+    return database
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/s of the views served by a thread pool with a new database connection '
+            'per request, persistent connections per thread, and pooled connections')
+
+    def add_arguments(self, parser):
+        parser.add_argument('routes', nargs='*', help=f'Route names to request in turn (default: {", ".join(ROUTES)})')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Threads serving requests at once (default: 32)')
+        parser.add_argument('--max-size', type=int, default=getattr(settings, 'DB_POOL_OPTIONS', {}).get('max_size', 10),
+                            help='Connections in the pool (default: DB_POOL_MAX_SIZE)')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1 or options['max_size'] < 1:
+            raise CommandError('--requests, --concurrency and --max-size must be at least 1')
+        bike = Bike.objects.order_by('pk').first()
+        if bike is None:
+            raise CommandError('Needs at least one bike; run generate_load_data first')
+        names = options['routes'] or ROUTES
+        args = {'api_bike_price': [bike.pk], 'bike_detail': [bike.pk]}
+        try:
+            paths = [reverse(f'store:{name}', args=args.get(name)) for name in names]
+        except Exception as e:
+            raise CommandError(f'Cannot request {", ".join(names)}: {e}')
+        paths = [paths[i % len(paths)] for i in range(options['requests'])]
+
+        database = connections.settings['default']
+        pool_options = {**getattr(settings, 'DB_POOL_OPTIONS', {}), 'max_size': options['max_size']}
+        runs = [
+            ('New connection per request', _unpooled(database, 0)),
+            ('Persistent per thread', _unpooled(database, 600)),
+            (f'Pooled (max {options["max_size"]})', configure_pool(_unpooled(database, 0), pool_options)),
+        ]
+        # Every request must reach the database, so the response cache is off
+        ttls = {name: 0 for name in caching.DEFAULT_TTLS}
+        results = []
+        try:
+            with override_settings(ALLOWED_HOSTS=['*'], STORE_CACHE_TTLS=ttls):
+                for name, run_database in runs:
+                    results.append((name, *self._run(run_database, paths, options['concurrency'])))
+        finally:
+            self._switch(database)
+
+        self.stdout.write(
+            f'{len(paths)} requests over {", ".join(names)} from {options["concurrency"]} threads '
+            f'on {database["ENGINE"].rsplit(".", 1)[-1]}'
+        )
+        self.stdout.write(f'{"connections":<28}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"opened":>8}{"errors":>8}')
+        for name, (elapsed, timings, errors), opened in results:
+            self.stdout.write(
+                f'{name:<28}{len(timings) / elapsed:>10.0f}{_percentile(timings, 0.5) * 1000:>10.1f}'
+                f'{_percentile(timings, 0.99) * 1000:>10.1f}{opened:>8}{errors:>8}'
+            )
+        unpooled, pooled = results[0][1][0], results[-1][1][0]
+        self.stdout.write(self.style.SUCCESS(f'Pooled throughput is {unpooled / pooled:.2f}x a connection per request'))
+
+    def _switch(self, database):
+        """Serve the default alias from database, in this thread and every new one"""
+        connections.close_all()
+        pool = getattr(connections['default'], 'close_pool', None)
+        if pool:
+            pool()
+        close_pools()
+        connections.settings['default'] = database
+        del connections['default']
+
+    def _run(self, database, paths, concurrency):
+        self._switch(database)
+        opened = 0
+
+        def count(sender, **kwargs):
+            nonlocal opened
+            opened += 1
+
+        connection_created.connect(count, weak=False)
+        try:
+            result = APIBenchmark()._wsgi(paths, concurrency)
+        finally:
+            connection_created.disconnect(count)
+        # Pooled connections signal every checkout, so ask the pool what it opened
+        stats = pool_stats(connections).get('default')
+        return result, stats['connections_num'] if stats else opened
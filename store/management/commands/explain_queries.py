@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from store.models import Bike, Customer, Sale, Supplier
+from store.perf import explain_plan, is_full_scan, route_requests
+
+
+class Command(BaseCommand):
+    help = "Print the database query plan for every query each store view issues"
+
+    def add_arguments(self, parser):
+        parser.add_argument('routes', nargs='*', help='Route names to explain (default: every store route)')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Execute the queries for actual row counts and timings (PostgreSQL)')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        samples = [model.objects.order_by('pk').first() for model in (Bike, Customer, Supplier, Sale)]
+        if None in samples:
+            raise CommandError('Needs at least one bike, customer, supplier and sale; run generate_load_data first')
+        routes = route_requests(*samples)
+        unknown = set(options['routes']) - set(routes)
+        if unknown:
+            raise CommandError(f'Unknown route(s): {", ".join(sorted(unknown))}')
+        names = options['routes'] or list(routes)
+
+        self.stdout.write(f'Query plans on {connection.vendor}')
+        full_scans = 0
+        client = Client()
+        # Views that write (the order API) are rolled back afterwards
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['*']):
+            for name in names:
+                full_scans += self._explain_route(client, name, *routes[name], options['analyze'])
+            transaction.set_rollback(True)
+
+        if full_scans:
+            self.stdout.write(self.style.WARNING(f'{full_scans} full table scan(s) found'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No full table scans'))
+
+    def _explain_route(self, client, name, method, url, body, analyze):
+        with CaptureQueriesContext(connection) as captured:
+            if body is None:
+                response = getattr(client, method)(url)
+            else:
+                response = getattr(client, method)(url, data=body, content_type='application/json')
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{name}  {method.upper()} {url}  [{response.status_code}]'))
+        full_scans = 0
+        seen = set()
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+                continue
+            seen.add(sql)
+            self.stdout.write(f'  {sql if len(sql) <= 200 or self.verbosity > 1 else sql[:197] + "..."}')
+            for line in explain_plan(sql, analyze=analyze):
+                if is_full_scan(line):
+                    full_scans += 1
+                    self.stdout.write(self.style.WARNING(f'    {line}'))
+                else:
+                    self.stdout.write(f'    {line}')
+        return full_scans
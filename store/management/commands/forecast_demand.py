@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.forecasting import CHUNK_SIZE, apply_reorder_points, forecast_all
+import time
+
+
+class Command(BaseCommand):
+    help = ('Forecast daily demand for every bike from its sales history and store suggested '
+            'reorder points on the inventory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='Days of sales history ending yesterday (default: 1095)')
+        parser.add_argument('--lead-time', type=int, default=7,
+                            help='Days a reorder takes to arrive (default: 7)')
+        parser.add_argument('--service-level', type=float, default=0.95,
+                            help='Chance of not running out during the lead time (default: 0.95)')
+        parser.add_argument('--alpha', type=float, default=0.1,
+                            help='Exponential smoothing factor, 0 to 1 (default: 0.1)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes forecasting ranges of bikes in parallel (default: 1)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Sales rows fetched from the database at a time (default: {CHUNK_SIZE})')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Inventory rows written per statement (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Forecast and report without storing the reorder points')
+
+    def handle(self, *args, **options):
+        for option in ('days', 'workers', 'chunk_size', 'batch_size'):
+            if options[option] < 1:
+                raise CommandError(f'--{option.replace("_", "-")} must be at least 1')
+        if options['lead_time'] < 0:
+            raise CommandError('--lead-time cannot be negative')
+        if not 0 < options['service_level'] < 1:
+            raise CommandError('--service-level must be between 0 and 1')
+        if not 0 < options['alpha'] <= 1:
+            raise CommandError('--alpha must be above 0 and at most 1')
+
+        started = time.perf_counter()
+        result = forecast_all(
+            days=options['days'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            alpha=options['alpha'],
+            lead_time=options['lead_time'],
+            service_level=options['service_level'],
+        )
+        forecast_seconds = time.perf_counter() - started
+        bikes = len(result.bike_ids)
+        selling = int((result.smoothed > 0).sum())
+        self.stdout.write(
+            f'Forecast {bikes} bikes ({selling} with sales) from {options["days"]} days '
+            f'in {forecast_seconds:.2f}s'
+        )
+        if options['verbosity'] > 1:
+            self.stdout.write(f'{"bike":>10}{"7-day avg":>12}{"28-day avg":>12}{"smoothed":>10}'
+                              f'{"safety":>10}{"reorder at":>12}')
+            for row in zip(*result):
+                pk, average_7, average_28, smoothed, _, safety_stock, reorder_point = row
+                self.stdout.write(f'{pk:>10}{average_7:>12.2f}{average_28:>12.2f}{smoothed:>10.2f}'
+                                  f'{safety_stock:>10.1f}{reorder_point:>12}')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Dry run: no reorder points stored'))
+            return
+        started = time.perf_counter()
+        written = apply_reorder_points(result, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {written} changed reorder points in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.synthetic import generate_dataset
+import time
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic catalogue and sales history for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suppliers', type=int, default=50, help='Suppliers to create (default: 50)')
+        parser.add_argument('--bikes', type=int, default=1000, help='Bikes to create (default: 1000)')
+        parser.add_argument('--customers', type=int, default=10000, help='Customers to create (default: 10000)')
+        parser.add_argument('--sales', type=int, default=100000, help='Sales to create (default: 100000)')
+        parser.add_argument('--days', type=int, default=730, help='Days of sales history ending yesterday (default: 730)')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed; use a different seed to add another dataset next to an existing one')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Rows generated and committed per chunk (default: 10000)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT statement (default: 1000)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes inserting chunks in parallel (default: 1)')
+        parser.add_argument('--skip-rollups', action='store_true',
+                            help='Do not rebuild the sales rollups afterwards (run rebuild_sales_rollups later)')
+
+    def handle(self, *args, **options):
+        for option in ('suppliers', 'bikes', 'customers', 'sales'):
+            if options[option] < 0:
+                raise CommandError(f'--{option} cannot be negative')
+        for option in ('days', 'chunk_size', 'batch_size', 'workers'):
+            if options[option] < 1:
+                raise CommandError(f'--{option.replace("_", "-")} must be at least 1')
+
+        self.stdout.write(
+            f'Generating {options["suppliers"]} suppliers, {options["bikes"]} bikes, '
+            f'{options["customers"]} customers and {options["sales"]} sales '
+            f'(seed {options["seed"]}, {options["workers"]} worker(s))...'
+        )
+        started = time.perf_counter()
+        stats = generate_dataset(
+            suppliers=options['suppliers'],
+            bikes=options['bikes'],
+            customers=options['customers'],
+            sales=options['sales'],
+            days=options['days'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            rollups=not options['skip_rollups'],
+            progress=self._progress if options['verbosity'] > 1 else None,
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'{"table":<12}{"rows":>12}{"seconds":>10}{"rows/s":>12}')
+        for name, (rows, seconds) in stats.items():
+            self.stdout.write(f'{name:<12}{rows:>12}{seconds:>10.2f}{rows / max(seconds, 1e-9):>12.0f}')
+        total = sum(rows for rows, _ in stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {total} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+
+    def _progress(self, table, done, total):
+        self.stdout.write(f'  {table}: {done}/{total}')
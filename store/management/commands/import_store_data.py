@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.importer import TABLES, CheckpointMismatch, import_files
+from store.models import ImportCheckpoint
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = ('Import suppliers, bikes, customers and sales history from CSV or NDJSON files, '
+            'upserting the catalogue and customers on their natural keys')
+
+    def add_arguments(self, parser):
+        for table in TABLES:
+            parser.add_argument(f'--{table}', metavar='FILE', help=f'CSV or NDJSON (.ndjson, .jsonl) file of {table}')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows validated and committed together (default: 1000)')
+        parser.add_argument('--checkpoint', default='import_store_data',
+                            help='Name committed progress is saved under in the database, for resuming '
+                                 '(default: import_store_data)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore an existing checkpoint and import every row again')
+        parser.add_argument('--rebuild-rollups', action='store_true',
+                            help='Rebuild the sales rollups once at the end instead of per batch '
+                                 '(faster for large histories)')
+
+    def handle(self, *args, **options):
+        files = {table: options[table] for table in TABLES if options[table]}
+        if not files:
+            raise CommandError(f'Give at least one of {", ".join(f"--{table}" for table in TABLES)}')
+        for table, path in files.items():
+            if not os.path.isfile(path):
+                raise CommandError(f'--{table}: {path} does not exist')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if ImportCheckpoint.objects.filter(name=options['checkpoint']).exists() and not options['restart']:
+            self.stdout.write(f'Resuming from checkpoint "{options["checkpoint"]}"...')
+
+        started = time.perf_counter()
+        try:
+            stats = import_files(
+                files,
+                batch_size=options['batch_size'],
+                checkpoint=options['checkpoint'],
+                restart=options['restart'],
+                rebuild_rollups=options['rebuild_rollups'],
+                progress=self._progress if options['verbosity'] > 1 else None,
+                reject=self._reject if options['verbosity'] > 0 else None,
+            )
+        except CheckpointMismatch as e:
+            raise CommandError(f'{e}; pass --restart to discard it')
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'{"table":<12}{"rows":>12}{"rejected":>10}{"seconds":>10}{"rows/s":>12}')
+        for table, (rows, rejected, seconds) in stats.items():
+            self.stdout.write(
+                f'{table:<12}{rows:>12}{rejected:>10}{seconds:>10.2f}{rows / max(seconds, 1e-9):>12.0f}'
+            )
+        total = sum(rows for rows, _, _ in stats.values())
+        rejected = sum(rejected for _, rejected, _ in stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {total} rows ({rejected} rejected) in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+
+    def _progress(self, table, done, rate):
+        self.stdout.write(f'  {table}: {done} rows ({rate:.0f} rows/s)')
+
+    def _reject(self, table, number, message):
+        self.stderr.write(f'{table} line {number}: {message}')
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.reorders import LINE_FIELDS, draft_orders
+import csv
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = ('List the bikes at or below their reorder point as draft purchase orders per supplier, '
+            'optionally writing one CSV file per supplier')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supplier', type=int,
+                            help='Only plan the order of this supplier id (0 for bikes without a supplier)')
+        parser.add_argument('--output-dir', metavar='DIR',
+                            help='Write each draft order to DIR/reorder-<supplier id>.csv')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Order lines fetched from the database at a time (default: 2000)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        output_dir = options['output_dir']
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        started = time.perf_counter()
+        self.stdout.write(f'{"supplier":<40}{"bikes":>8}{"units":>10}{"list value":>16}')
+        orders = bikes = units = 0
+        for order in draft_orders(options['supplier'], chunk_size=options['chunk_size']):
+            orders += 1
+            bikes += len(order.lines)
+            units += order.units
+            name = order.supplier_name or 'No supplier'
+            self.stdout.write(f'{name[:39]:<40}{len(order.lines):>8}{order.units:>10}{order.value:>16,.2f}')
+            if options['verbosity'] > 1:
+                for line in order.lines:
+                    self.stdout.write(
+                        f'  {line.brand} {line.model} ({line.color}): {line.stock_quantity} in stock, '
+                        f'order {line.order_quantity}'
+                    )
+            if output_dir:
+                self._write(os.path.join(output_dir, f'reorder-{order.supplier_id or 0}.csv'), order)
+        elapsed = time.perf_counter() - started
+
+        if not orders:
+            self.stdout.write(self.style.SUCCESS('No bike is at or below its reorder point'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Planned {orders} draft orders for {bikes} bikes ({units} units) in {elapsed:.2f}s'
+        ))
+
+    def _write(self, path, order):
+        with open(path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(LINE_FIELDS)
+            writer.writerows(order.lines)
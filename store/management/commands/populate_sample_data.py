@@ -1,7 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db import transaction
-from store.models import Bike, Customer, Sale, Supplier
+from store.models import Bike, Customer, Sale, Supplier, InsufficientStockError
 from decimal import Decimal
 import random
 from datetime import datetime, timedelta
@@ -128,34 +127,31 @@ class Command(BaseCommand):
 
         # Create sales
         self.stdout.write('Creating sales transactions...')
-        for _ in range(20):  # Reduce to 20 sales to avoid stock issues
+        # Pick from the ids in Python rather than ORDER BY RANDOM(), which sorts the whole table
+        in_stock_ids = list(Bike.objects.filter(stock_quantity__gte=2).values_list('pk', flat=True))  # At least 2 in stock
+        for _ in range(20 if in_stock_ids else 0):  # Reduce to 20 sales to avoid stock issues
             customer = random.choice(customers)
             # Get fresh bike data from database to ensure we have current stock levels
-            bike = Bike.objects.filter(stock_quantity__gte=2).order_by('?').first()  # At least 2 in stock
+            bike = Bike.objects.filter(pk=random.choice(in_stock_ids), stock_quantity__gte=2).first()
             
             # Only create sale if bike is in stock
             if bike and bike.stock_quantity >= 2:
                 quantity = 1  # Always sell just 1 bike to avoid stock issues
                 sale_price = bike.price * Decimal(random.uniform(0.85, 1.0))  # Some discount possible
                 
-                with transaction.atomic():
-                    # Refresh the bike instance to get the latest stock quantity
-                    bike.refresh_from_db()
-                    
-                    # Double-check stock after refresh
-                    if bike.stock_quantity >= quantity:
-                        sale = Sale.objects.create(
-                            customer=customer,
-                            bike=bike,
-                            quantity=quantity,
-                            sale_price=sale_price
-                        )
-                        
-                        # Update bike stock
-                        bike.stock_quantity -= quantity
-                        bike.save()
-                        
-                        self.stdout.write(f'Created sale: {customer.name} bought {quantity} x {bike.brand} {bike.model}')
+                # Sale.save takes the units out of stock atomically
+                try:
+                    Sale.objects.create(
+                        customer=customer,
+                        bike=bike,
+                        quantity=quantity,
+                        sale_price=sale_price
+                    )
+                except InsufficientStockError as e:
+                    self.stdout.write(self.style.WARNING(f'Skipped sale of {bike}: {e}'))
+                    continue
+
+                self.stdout.write(f'Created sale: {customer.name} bought {quantity} x {bike.brand} {bike.model}')
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from store.rollups import rebuild_rollups
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily, monthly and bike type sales rollups and the bike and customer sales counters from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rollup rows written per INSERT (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding sales rollups...')
+        started = time.perf_counter()
+        written = rebuild_rollups(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        for name, count in written.items():
+            self.stdout.write(f'- {name}: {count} rows')
+        self.stdout.write(self.style.SUCCESS(f'Sales rollups rebuilt in {elapsed:.2f}s'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store.search import install_search_index, rebuild_search_index
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the bike and customer full-text search index from the model tables'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding search index...')
+        started = time.perf_counter()
+        install_search_index()
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt in {time.perf_counter() - started:.2f}s'))
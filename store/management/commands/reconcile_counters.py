@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.rollups import COUNTER_MODELS, reconcile_counters
+import time
+
+
+class Command(BaseCommand):
+    help = ('Check the sales counters stored on bikes and customers against the sales table, '
+            'and with --fix write back any that have drifted')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Repair the counters that differ instead of only reporting them')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows read and repaired together (default: 1000)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        report = self._report if options['verbosity'] > 1 else None
+
+        self.stdout.write(f'{"model":<12}{"rows":>10}{"drifted":>10}{"seconds":>10}')
+        total_drifted = 0
+        for model in COUNTER_MODELS:
+            started = time.perf_counter()
+            checked, drifted = reconcile_counters(
+                model, fix=options['fix'], batch_size=options['batch_size'], report=report
+            )
+            elapsed = time.perf_counter() - started
+            total_drifted += drifted
+            self.stdout.write(f'{model.__name__:<12}{checked:>10}{drifted:>10}{elapsed:>10.2f}')
+
+        if not total_drifted:
+            self.stdout.write(self.style.SUCCESS('All sales counters match the sales'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired the counters of {total_drifted} rows'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'{total_drifted} rows have drifted counters; run with --fix to repair them'
+            ))
+
+    def _report(self, pk, field, stored, actual):
+        self.stdout.write(f'  #{pk} {field}: stored {stored}, actual {actual}')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.stock import drifted, take_snapshots
+import time
+
+
+class Command(BaseCommand):
+    help = ('Snapshot the stock of every bike that has moved since its last snapshot, so stock at any '
+            'time is read from one snapshot and a short tail of movements; run it periodically')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Snapshots written per statement (default: 1000)')
+        parser.add_argument('--check', action='store_true',
+                            help='Also report bikes whose stored stock differs from their stock ledger')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        started = time.perf_counter()
+        taken = take_snapshots(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Took {taken} stock snapshots in {time.perf_counter() - started:.2f}s'
+        ))
+        if not options['check']:
+            return
+
+        bikes = list(drifted().values_list('pk', 'brand', 'model', 'color', 'stock_quantity', 'ledger_stock'))
+        if not bikes:
+            self.stdout.write(self.style.SUCCESS('Every bike\'s stock matches its ledger'))
+            return
+        self.stdout.write(f'{"bike":>10}  {"name":<40}{"stored":>8}{"ledger":>8}')
+        for pk, brand, model, color, stored, ledger_stock in bikes:
+            name = f'{brand} {model} ({color})'
+            self.stdout.write(f'{pk:>10}  {name[:39]:<40}{stored:>8}{ledger_stock:>8}')
+        self.stdout.write(self.style.WARNING(f'{len(bikes)} bikes differ from their stock ledger'))
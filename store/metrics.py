@@ -0,0 +1,258 @@
+"""
+Request timing and SQL instrumentation, exposed in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and ``record_query``, installed on
+each database connection with ``execute_wrapper`` as it is opened, counts
+the queries the request runs and the time spent in them. The request's
+figures live in a context variable, which Django copies into the threads
+``sync_to_async`` runs database code in, so sync and async views are
+measured alike. Per view (the URL name) this keeps:
+
+* ``bikestore_requests_total``: requests by method and status code
+* ``bikestore_request_duration_seconds``: a latency histogram
+* ``bikestore_request_queries``: a histogram of queries per request
+* ``bikestore_db_duration_seconds_total``: time spent in the database
+* ``bikestore_slow_query_duration_seconds``: the slowest statements seen,
+  as the SQL with its placeholders
+
+``registry.render()`` formats them for ``/metrics``. With
+``STORE_METRICS_LOG`` set, each request is also logged to ``store.metrics``
+as one JSON object.
+
+Recording a query costs two clock reads and a few additions, and a request
+takes one short lock, so the instrumentation can stay on in production. The
+figures belong to the process: with several workers each one reports its
+own, and Prometheus sums them across scrapes of every worker. Streaming
+responses are timed until their headers are ready, not until the last byte.
+"""
+from contextvars import ContextVar
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Slowest statements kept for /metrics
+SLOW_QUERIES = 10
+
+_current = ContextVar('store_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Queries run and database time spent by one request"""
+    __slots__ = ('queries', 'db_seconds', 'slowest_sql', 'slowest_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_sql = None
+        self.slowest_seconds = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper adding each query to the current request's figures"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.db_seconds += elapsed
+        if elapsed > metrics.slowest_seconds:
+            metrics.slowest_seconds = elapsed
+            metrics.slowest_sql = sql
+
+
+def install(connection):
+    """Wrap a database connection's queries with record_query, once"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, buckets):
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Every view's figures since the process started"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.durations = {}
+            self.queries = {}
+            self.db_seconds = {}
+            self.slow_queries = {}
+
+    def observe(self, view, method, status, seconds, metrics):
+        with self._lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.durations.get((view, method))
+            if histogram is None:
+                histogram = self.durations[view, method] = Histogram(DURATION_BUCKETS)
+            histogram.observe(seconds, DURATION_BUCKETS)
+            histogram = self.queries.get(view)
+            if histogram is None:
+                histogram = self.queries[view] = Histogram(QUERY_BUCKETS)
+            histogram.observe(metrics.queries, QUERY_BUCKETS)
+            self.db_seconds[view] = self.db_seconds.get(view, 0.0) + metrics.db_seconds
+
+            if metrics.slowest_sql is not None:
+                key = (view, metrics.slowest_sql)
+                if metrics.slowest_seconds > self.slow_queries.get(key, 0.0):
+                    self.slow_queries[key] = metrics.slowest_seconds
+                    # Trim now and then rather than on every request
+                    if len(self.slow_queries) > 2 * SLOW_QUERIES:
+                        self.slow_queries = dict(
+                            sorted(self.slow_queries.items(), key=lambda item: -item[1])[:SLOW_QUERIES]
+                        )
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP bikestore_requests_total Requests served, by view, method and status code.',
+                '# TYPE bikestore_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'bikestore_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+            lines += [
+                '# HELP bikestore_request_duration_seconds Time from request to response, by view and method.',
+                '# TYPE bikestore_request_duration_seconds histogram',
+            ]
+            for (view, method), histogram in sorted(self.durations.items()):
+                lines += _histogram('bikestore_request_duration_seconds', histogram, DURATION_BUCKETS,
+                                    view=view, method=method)
+
+            lines += [
+                '# HELP bikestore_request_queries SQL queries per request, by view.',
+                '# TYPE bikestore_request_queries histogram',
+            ]
+            for view, histogram in sorted(self.queries.items()):
+                lines += _histogram('bikestore_request_queries', histogram, QUERY_BUCKETS, view=view)
+
+            lines += [
+                '# HELP bikestore_db_duration_seconds_total Time spent running SQL queries, by view.',
+                '# TYPE bikestore_db_duration_seconds_total counter',
+            ]
+            for view, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'bikestore_db_duration_seconds_total{_labels(view=view)} {seconds:.6f}')
+
+            lines += [
+                f'# HELP bikestore_slow_query_duration_seconds The {SLOW_QUERIES} slowest SQL statements seen, '
+                'by view.',
+                '# TYPE bikestore_slow_query_duration_seconds gauge',
+            ]
+            slowest = sorted(self.slow_queries.items(), key=lambda item: -item[1])[:SLOW_QUERIES]
+            for (view, sql), seconds in slowest:
+                lines.append(f'bikestore_slow_query_duration_seconds{_labels(view=view, sql=sql)} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    escaped = (
+        str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        for value in labels.values()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _histogram(name, histogram, buckets, **labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+    return lines
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """Record every request's latency, query count and database time.
+
+    Put it first in MIDDLEWARE so the time covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, time.perf_counter() - started, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, time.perf_counter() - started, metrics)
+        return response
+
+    def _finish(self, request, response, seconds, metrics):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        registry.observe(view, request.method, response.status_code, seconds, metrics)
+        if getattr(settings, 'STORE_METRICS_LOG', False):
+            logger.info(json.dumps({
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(seconds * 1000, 3),
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_seconds * 1000, 3),
+                'slowest_sql': metrics.slowest_sql,
+                'slowest_sql_ms': round(metrics.slowest_seconds * 1000, 3),
+            }))
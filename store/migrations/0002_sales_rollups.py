@@ -0,0 +1,127 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:46
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Sale = apps.get_model('store', 'Sale')
+    totals = {
+        'sale_count': Count('id'),
+        'units_sold': Sum('quantity'),
+        'revenue': Sum(F('quantity') * F('sale_price')),
+    }
+    sales = Sale.objects.order_by()
+
+    DailySalesRollup = apps.get_model('store', 'DailySalesRollup')
+    MonthlySalesRollup = apps.get_model('store', 'MonthlySalesRollup')
+    daily = [
+        DailySalesRollup(**row)
+        for row in sales.annotate(day=TruncDate('sale_date')).values('day').annotate(**totals)
+    ]
+    DailySalesRollup.objects.bulk_create(daily, batch_size=1000)
+    monthly = {}
+    for row in daily:
+        month = monthly.setdefault(row.day.replace(day=1), MonthlySalesRollup(month=row.day.replace(day=1)))
+        month.sale_count += row.sale_count
+        month.units_sold += row.units_sold
+        month.revenue += row.revenue
+    MonthlySalesRollup.objects.bulk_create(monthly.values(), batch_size=1000)
+
+    for model_name, group_by, key in (
+        ('BikeTypeSalesRollup', 'bike__type', 'bike_type'),
+        ('BikeSalesRollup', 'bike_id', 'bike_id'),
+        ('CustomerSalesRollup', 'customer_id', 'customer_id'),
+    ):
+        model = apps.get_model('store', model_name)
+        model.objects.bulk_create(
+            [
+                model(**{key: row.pop(group_by)}, **row)
+                for row in sales.values(group_by).annotate(**totals)
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BikeTypeSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_count', models.IntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bike_type', models.CharField(choices=[('Mountain', 'Mountain Bike'), ('Road', 'Road Bike'), ('Hybrid', 'Hybrid Bike'), ('Electric', 'Electric Bike'), ('BMX', 'BMX Bike'), ('Cruiser', 'Cruiser Bike')], max_length=20, unique=True)),
+            ],
+            options={
+                'ordering': ['bike_type'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_count', models.IntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('day', models.DateField(unique=True)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_count', models.IntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField(unique=True)),
+            ],
+            options={
+                'ordering': ['month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BikeSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_count', models.IntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bike', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollup', to='store.bike')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-units_sold'], name='store_bikeroll_units_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerSalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_count', models.IntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollup', to='store.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-revenue'], name='store_custroll_revenue_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sale',
+            name='bike',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='store.bike'),
+        ),
+        migrations.AlterField(
+            model_name='sale',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='store.customer'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['type', 'price'], name='store_bike_type_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['price'], name='store_bike_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(condition=models.Q(('stock_quantity__lt', 5)), fields=['stock_quantity'], name='store_bike_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['-sale_date'], name='store_sale_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['bike', '-sale_date'], name='store_sale_bike_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['customer', '-sale_date'], name='store_sale_cust_date_idx'),
+        ),
+    ]
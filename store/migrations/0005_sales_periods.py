@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:37
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month'), ('quarter', 'Quarter')], max_length=7)),
+                ('start', models.DateField()),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['granularity', 'start'],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'start'), name='store_salesperiod_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesPeriodBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_count', models.IntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bike_type', models.CharField(choices=[('Mountain', 'Mountain Bike'), ('Road', 'Road Bike'), ('Hybrid', 'Hybrid Bike'), ('Electric', 'Electric Bike'), ('BMX', 'BMX Bike'), ('Cruiser', 'Cruiser Bike')], max_length=20)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='store.salesperiod')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.supplier')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:51
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def _total(sales, aggregate, output_field):
+    return Subquery(sales.annotate(total=aggregate).values('total'), output_field=output_field)
+
+
+def backfill_counters(apps, schema_editor):
+    Sale = apps.get_model('store', 'Sale')
+    money = models.DecimalField(max_digits=16, decimal_places=2)
+    revenue = Sum(F('quantity') * F('sale_price'))
+
+    sales = Sale.objects.filter(bike=OuterRef('pk')).order_by().values('bike')
+    apps.get_model('store', 'Bike').objects.update(
+        units_sold=Coalesce(_total(sales, Sum('quantity'), models.BigIntegerField()), 0),
+        revenue=Coalesce(_total(sales, revenue, money), Decimal('0.00'), output_field=money),
+    )
+    sales = Sale.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    apps.get_model('store', 'Customer').objects.update(
+        purchase_count=Coalesce(_total(sales, Count('id'), models.IntegerField()), 0),
+        lifetime_spend=Coalesce(_total(sales, revenue, money), Decimal('0.00'), output_field=money),
+        last_purchase_at=_total(sales, Max('sale_date'), models.DateTimeField()),
+    )
+
+
+def restore_rollups(apps, schema_editor):
+    Sale = apps.get_model('store', 'Sale')
+    totals = {
+        'sale_count': Count('id'),
+        'units_sold': Sum('quantity'),
+        'revenue': Sum(F('quantity') * F('sale_price')),
+    }
+    for model_name, key in (('BikeSalesRollup', 'bike_id'), ('CustomerSalesRollup', 'customer_id')):
+        model = apps.get_model('store', model_name)
+        model.objects.bulk_create(
+            [model(**row) for row in Sale.objects.order_by().values(key).annotate(**totals)],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_sales_periods'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bike',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='bike',
+            name='units_sold',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='last_purchase_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_spend',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='purchase_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['-units_sold'], name='store_bike_units_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['-lifetime_spend'], name='store_customer_spend_idx'),
+        ),
+        migrations.RunPython(backfill_counters, restore_rollups),
+        migrations.DeleteModel(
+            name='BikeSalesRollup',
+        ),
+        migrations.DeleteModel(
+            name='CustomerSalesRollup',
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def record_opening_stock(apps, schema_editor):
+    """Start every bike's ledger with the stock it has now"""
+    StockMovement = apps.get_model('store', 'StockMovement')
+    now = django.utils.timezone.now()
+    stock = apps.get_model('store', 'Bike').objects.filter(stock_quantity__gt=0).values_list('pk', 'stock_quantity')
+    StockMovement.objects.bulk_create(
+        (
+            StockMovement(bike_id=pk, kind='adjustment', quantity=quantity, note='Opening stock', created_at=now)
+            for pk, quantity in stock.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_sales_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('restock', 'Restock'), ('adjustment', 'Adjustment'), ('return', 'Return')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bike', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='store.bike')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='store.sale')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['bike', 'created_at'], name='store_stockmove_bike_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('quantity', models.IntegerField()),
+                ('bike', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='store.bike')),
+            ],
+            options={
+                'ordering': ['bike', '-taken_at'],
+                'constraints': [models.UniqueConstraint(fields=('bike', 'taken_at'), name='store_stocksnapshot_unique')],
+            },
+        ),
+        migrations.RunPython(record_opening_stock, migrations.RunPython.noop),
+    ]
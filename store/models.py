@@ -1,8 +1,43 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
 
+
+class InsufficientStockError(ValueError):
+    """Raised when a sale asks for more units than a bike has in stock"""
+
+    def __init__(self, bike, requested, available):
+        self.bike = bike
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Insufficient stock. Available: {available}")
+
+class SalesCountersMixin:
+    """Leave the denormalised sales counters out of saves of an existing row.
+
+    The counters only ever move by F() updates made alongside the sales they
+    count, so an instance loaded before a sale must not write its stale copy
+    back when it is saved.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class SupplierQuerySet(models.QuerySet):
+    def with_bike_counts(self):
+        """Annotate each supplier with the number of bikes it supplies"""
+        return self.annotate(bike_count=models.Count('bike'))
+
+
 class Supplier(models.Model):
     """Model for bike suppliers"""
     name = models.CharField(max_length=100)
@@ -13,8 +48,13 @@ class Supplier(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = SupplierQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='store_supplier_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -23,7 +63,7 @@ class Supplier(models.Model):
         return reverse('store:supplier_detail', kwargs={'pk': self.pk})
 
 
-class Bike(models.Model):
+class Bike(SalesCountersMixin, models.Model):
     """Model for bikes in the store"""
     BIKE_TYPES = [
         ('Mountain', 'Mountain Bike'),
@@ -51,12 +91,25 @@ class Bike(models.Model):
         null=True, 
         blank=True
     )
+    # Totals of the bike's sales, kept up to date by store.rollups
+    units_sold = models.BigIntegerField(default=0, editable=False)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'), editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    counter_fields = ('units_sold', 'revenue')
+
     class Meta:
         ordering = ['brand', 'model']
         unique_together = ['brand', 'model', 'color']
+        # brand, model ordering is served by the unique_together index
+        indexes = [
+            models.Index(fields=['type', 'price'], name='store_bike_type_price_idx'),
+            models.Index(fields=['price'], name='store_bike_price_idx'),
+            models.Index(fields=['stock_quantity'], name='store_bike_low_stock_idx',
+                         condition=models.Q(stock_quantity__lt=5)),
+            models.Index(fields=['-units_sold'], name='store_bike_units_sold_idx'),
+        ]
 
     def __str__(self):
         return f"{self.brand} {self.model} ({self.color})"
@@ -64,6 +117,36 @@ class Bike(models.Model):
     def get_absolute_url(self):
         return reverse('store:bike_detail', kwargs={'pk': self.pk})
 
+    def save(self, *args, **kwargs):
+        """Save the bike, recording any change to its stock in the stock ledger.
+
+        The stored type, stock and supplier are read once, under a row lock
+        in the same transaction as the write, and kept on the instance as
+        _previous_type, _previous_stock and _previous_supplier for the
+        rollup, period and live update handlers. The recorded adjustment is
+        exactly the change made even when sales are taking stock at the same
+        time.
+        """
+        self._previous_type = self._previous_stock = self._previous_supplier = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not set(update_fields) & {'type', 'stock_quantity', 'supplier', 'supplier_id'}:
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            if self.pk is not None:
+                self._previous_type, self._previous_stock, self._previous_supplier = (
+                    Bike.objects.select_for_update().filter(pk=self.pk).order_by().values_list(
+                        'type', 'stock_quantity', 'supplier_id'
+                    ).first() or (None, None, None)
+                )
+            super().save(*args, **kwargs)
+            previous = self._previous_stock or 0
+            if self.stock_quantity != previous and (update_fields is None or 'stock_quantity' in update_fields):
+                StockMovement.objects.create(
+                    bike=self, kind=StockMovement.ADJUSTMENT, quantity=self.stock_quantity - previous
+                )
+
     @property
     def is_low_stock(self):
         """Check if bike stock is low (less than 5 units)"""
@@ -75,17 +158,27 @@ class Bike(models.Model):
         return self.stock_quantity > 0
 
 
-class Customer(models.Model):
+class Customer(SalesCountersMixin, models.Model):
     """Model for customers"""
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=15)
     address = models.TextField()
+    # Totals of the customer's purchases, kept up to date by store.rollups
+    purchase_count = models.IntegerField(default=0, editable=False)
+    lifetime_spend = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'), editable=False)
+    last_purchase_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    counter_fields = ('purchase_count', 'lifetime_spend', 'last_purchase_at')
+
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='store_customer_name_idx'),
+            models.Index(fields=['-lifetime_spend'], name='store_customer_spend_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -95,28 +188,25 @@ class Customer(models.Model):
 
     @property
     def total_purchases(self):
-        """Calculate total amount spent by customer"""
-        return self.sales.aggregate(
-            total=models.Sum(models.F('quantity') * models.F('sale_price'))
-        )['total'] or Decimal('0.00')
-
-    @property
-    def purchase_count(self):
-        """Count total number of purchases"""
-        return self.sales.count()
+        """Total amount spent by customer"""
+        return self.lifetime_spend
 
 
 class Sale(models.Model):
     """Model for sales transactions"""
+    # The composite (customer|bike, sale_date) indexes below also serve
+    # the foreign key lookups, so the single-column indexes are dropped
     customer = models.ForeignKey(
         Customer, 
         on_delete=models.CASCADE,
-        related_name='sales'
+        related_name='sales',
+        db_index=False
     )
     bike = models.ForeignKey(
         Bike, 
         on_delete=models.CASCADE,
-        related_name='sales'
+        related_name='sales',
+        db_index=False
     )
     quantity = models.PositiveIntegerField(
         validators=[MinValueValidator(1)]
@@ -126,11 +216,17 @@ class Sale(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(Decimal('0.01'))]
     )
-    sale_date = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add, so imports and synthetic history keep their dates
+    sale_date = models.DateTimeField(default=timezone.now, editable=False)
     notes = models.TextField(blank=True)
 
     class Meta:
         ordering = ['-sale_date']
+        indexes = [
+            models.Index(fields=['-sale_date', '-id'], name='store_sale_date_id_idx'),
+            models.Index(fields=['bike', '-sale_date'], name='store_sale_bike_date_idx'),
+            models.Index(fields=['customer', '-sale_date'], name='store_sale_cust_date_idx'),
+        ]
 
     def __str__(self):
         return f"Sale #{self.pk} - {self.customer.name} - {self.bike}"
@@ -144,24 +240,50 @@ class Sale(models.Model):
         return self.quantity * self.sale_price
 
     def save(self, *args, **kwargs):
-        """Override save to update bike stock automatically"""
-        if not self.pk:  # New sale
-            # Set sale price to current bike price if not set
-            if not self.sale_price:
-                self.sale_price = self.bike.price
-            
-            # Check if enough stock available
-            if self.bike.stock_quantity < self.quantity:
-                raise ValueError(f"Insufficient stock. Available: {self.bike.stock_quantity}")
-            
-            # Save the sale first
+        """Override save to update bike stock automatically.
+
+        New sales decrement stock with a single conditional UPDATE
+        (``stock_quantity >= quantity``) in the same transaction as the
+        INSERT, so concurrent checkouts can never oversell and only the
+        stock column of the bike row is written. The sale's stock movement
+        is recorded in that transaction too.
+        """
+        if self.pk:
             super().save(*args, **kwargs)
-            
-            # Update bike stock
-            self.bike.stock_quantity -= self.quantity
-            self.bike.save()
-        else:
+            return
+
+        # Set sale price to current bike price if not set
+        if not self.sale_price:
+            self.sale_price = self.bike.price
+
+        with transaction.atomic():
+            reserve_stock(self.bike_id, self.quantity)
             super().save(*args, **kwargs)
+            StockMovement.objects.create(
+                bike_id=self.bike_id, kind=StockMovement.SALE, quantity=-self.quantity, sale=self,
+            )
+
+        # Keep an already loaded bike in step with the database
+        if Sale.bike.is_cached(self):
+            self.bike.refresh_from_db(fields=['stock_quantity', *Bike.counter_fields])
+
+
+def reserve_stock(bike_id, quantity):
+    """Atomically take quantity units of a bike out of stock.
+
+    Raises InsufficientStockError (leaving stock untouched) when fewer than
+    quantity units are available at the moment of the UPDATE.
+    """
+    updated = Bike.objects.filter(
+        pk=bike_id, stock_quantity__gte=quantity
+    ).update(
+        stock_quantity=models.F('stock_quantity') - quantity,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        bike = Bike.objects.filter(pk=bike_id).first()
+        available = bike.stock_quantity if bike else 0
+        raise InsufficientStockError(bike, quantity, available)
 
 
 class Inventory(models.Model):
@@ -200,3 +322,172 @@ class Inventory(models.Model):
             return "Overstocked"
         else:
             return "Normal"
+
+
+class StockMovement(models.Model):
+    """One change to a bike's stock; the ledger is only ever appended to"""
+    SALE = 'sale'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    RETURN = 'return'
+    KINDS = [
+        (SALE, 'Sale'),
+        (RESTOCK, 'Restock'),
+        (ADJUSTMENT, 'Adjustment'),
+        (RETURN, 'Return'),
+    ]
+
+    # Served by the (bike, created_at) index below
+    bike = models.ForeignKey(
+        Bike,
+        on_delete=models.CASCADE,
+        related_name='stock_movements',
+        db_index=False
+    )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    # Units added to (positive) or taken out of (negative) stock
+    quantity = models.IntegerField()
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements'
+    )
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['bike', 'created_at'], name='store_stockmove_bike_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.quantity:+d} {self.bike}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Stock movements cannot be changed; record a new movement instead")
+        super().save(*args, **kwargs)
+
+
+class StockSnapshot(models.Model):
+    """A bike's stock as of taken_at, counting every movement up to and including it"""
+    bike = models.ForeignKey(
+        Bike,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots',
+        db_index=False
+    )
+    taken_at = models.DateTimeField()
+    quantity = models.IntegerField()
+
+    class Meta:
+        ordering = ['bike', '-taken_at']
+        constraints = [
+            models.UniqueConstraint(fields=['bike', 'taken_at'], name='store_stocksnapshot_unique'),
+        ]
+
+    def __str__(self):
+        return f"Stock of {self.bike} at {self.taken_at}"
+
+
+class SalesTotals(models.Model):
+    """Abstract base for pre-aggregated sales rollup rows"""
+    sale_count = models.IntegerField(default=0)
+    units_sold = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class DailySalesRollup(SalesTotals):
+    """Sales totals for a single calendar day"""
+    day = models.DateField(unique=True)
+
+    class Meta:
+        ordering = ['day']
+
+    def __str__(self):
+        return f"Sales on {self.day}"
+
+
+class MonthlySalesRollup(SalesTotals):
+    """Sales totals for a calendar month (keyed on the first day of the month)"""
+    month = models.DateField(unique=True)
+
+    class Meta:
+        ordering = ['month']
+
+    def __str__(self):
+        return f"Sales in {self.month:%B %Y}"
+
+
+class BikeTypeSalesRollup(SalesTotals):
+    """Sales totals per bike type"""
+    bike_type = models.CharField(max_length=20, choices=Bike.BIKE_TYPES, unique=True)
+
+    class Meta:
+        ordering = ['bike_type']
+
+    def __str__(self):
+        return f"Sales of {self.bike_type} bikes"
+
+
+class SalesPeriod(models.Model):
+    """A closed reporting period whose sales buckets have been computed"""
+    GRANULARITIES = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+        ('quarter', 'Quarter'),
+    ]
+
+    granularity = models.CharField(max_length=7, choices=GRANULARITIES)
+    start = models.DateField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['granularity', 'start']
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'start'], name='store_salesperiod_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_granularity_display()} from {self.start}"
+
+
+class SalesPeriodBucket(SalesTotals):
+    """Sales totals of one bike type and supplier within a SalesPeriod"""
+    period = models.ForeignKey(
+        SalesPeriod,
+        on_delete=models.CASCADE,
+        related_name='buckets'
+    )
+    bike_type = models.CharField(max_length=20, choices=Bike.BIKE_TYPES)
+    supplier = models.ForeignKey(
+        Supplier,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+
+    def __str__(self):
+        return f"{self.bike_type} sales in {self.period}"
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of an import_store_data run, saved in each batch's transaction"""
+    name = models.CharField(max_length=200, unique=True)
+    # Path, size and modification time of each input file, by table
+    files = models.JSONField()
+    # Rows read so far, by table
+    done = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import checkpoint {self.name}"
@@ -0,0 +1,208 @@
+"""
+Repeated-query (N+1) and slow-query detection for development and CI.
+
+With ``STORE_QUERY_INSPECTION`` set to ``'warn'`` or ``'strict'``,
+``QueryInspectionMiddleware`` watches every query a request runs. Each
+statement is normalised to its shape (literals, placeholders and ``IN``
+lists collapsed), and a shape run ``STORE_NPLUSONE_THRESHOLD`` times or more
+in one request is reported as an N+1, along with where the repeated query
+came from: the innermost project source line and, when a template was
+rendering, the template line. Statements slower than ``STORE_SLOW_QUERY_MS``
+are reported the same way. Reports go to the ``store.nplusone`` logger;
+in strict mode a request with an N+1 also fails with ``NPlusOneError``, so
+running the test suite with ``STORE_QUERY_INSPECTION=strict`` fails on any
+new N+1. Findings listed in ``STORE_NPLUSONE_ALLOW`` (by either location,
+e.g. ``'store/admin.py:17'`` or ``'store/bike_list.html:40'``) are known
+and not reported.
+
+Off by default: with the setting empty the middleware removes itself and
+no query is wrapped. ``inspect()`` watches a block of code outside a
+request in the same way.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import re
+import sys
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('store_query_inspection', default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SOURCE_ROOT = str(settings.BASE_DIR) + '/'
+# Project files that run every query rather than ask for it
+_PLUMBING = {__file__, metrics.__file__}
+
+
+class NPlusOneError(Exception):
+    """A request ran the same query shape once per row"""
+
+
+def normalise(sql):
+    """The statement's shape: literals and placeholders as ?, IN lists as (...)"""
+    return ' '.join(_LISTS.sub('(...)', _LITERALS.sub('?', sql)).split())
+
+
+def _origin():
+    """(innermost project source line, innermost template line) of the running query"""
+    source = template = None
+    frame = sys._getframe(2)
+    while frame is not None and not (source and template):
+        code = frame.f_code
+        if template is None and code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            if origin is not None:
+                template = f'{origin.template_name or origin.name}:{node.token.lineno}'
+        elif (source is None and code.co_filename.startswith(_SOURCE_ROOT)
+              and '/site-packages/' not in code.co_filename and code.co_filename not in _PLUMBING):
+            source = f'{code.co_filename[len(_SOURCE_ROOT):]}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return source, template
+
+
+class Finding:
+    __slots__ = ('kind', 'shape', 'count', 'ms', 'source', 'template')
+
+    def __init__(self, kind, shape, count, ms, source, template):
+        self.kind = kind
+        self.shape = shape
+        self.count = count
+        self.ms = ms
+        self.source = source
+        self.template = template
+
+    @property
+    def locations(self):
+        return [location.split(' in ')[0] for location in (self.source, self.template) if location]
+
+    def __str__(self):
+        where = ', rendering '.join(location for location in (self.source, self.template) if location)
+        if self.kind == 'nplusone':
+            figure = f'{self.count} times'
+        else:
+            figure = f'{self.ms:.0f}ms'
+        return f'{self.kind} query ({figure}) at {where or "unknown location"}: {self.shape}'
+
+
+class Inspection:
+    """The query shapes one request or block has run"""
+
+    def __init__(self, threshold, slow_ms):
+        self.threshold = threshold
+        self.slow_ms = slow_ms
+        self.shapes = {}
+        self.slow = []
+
+    def record(self, sql, seconds):
+        shape = normalise(sql)
+        seen = self.shapes.get(shape)
+        if seen is None:
+            seen = self.shapes[shape] = [0, None]
+        seen[0] += 1
+        # The stack is only walked once a shape repeats, and only the once
+        if seen[0] == self.threshold:
+            seen[1] = _origin()
+        if seconds * 1000 >= self.slow_ms:
+            self.slow.append(Finding('slow', shape, 1, seconds * 1000, *_origin()))
+
+    @property
+    def findings(self):
+        """The N+1 and slow queries, less those STORE_NPLUSONE_ALLOW lists"""
+        allowed = set(getattr(settings, 'STORE_NPLUSONE_ALLOW', ()))
+        findings = [
+            Finding('nplusone', shape, count, None, *origin)
+            for shape, (count, origin) in self.shapes.items() if count >= self.threshold
+        ] + self.slow
+        return [finding for finding in findings if not allowed.intersection(finding.locations)]
+
+
+def inspect_query(execute, sql, params, many, context):
+    """Connection execute wrapper recording each query in the current inspection"""
+    inspection = _current.get()
+    if inspection is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        inspection.record(sql, time.perf_counter() - started)
+
+
+def _install_on(sender=None, connection=None, **kwargs):
+    if inspect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(inspect_query)
+
+
+def install():
+    """Wrap the queries of every open and future database connection"""
+    connection_created.connect(_install_on, dispatch_uid='store.nplusone')
+    for connection in connections.all(initialized_only=True):
+        _install_on(connection=connection)
+
+
+@contextmanager
+def inspect(threshold=None, slow_ms=None):
+    """Watch the queries of a block; the yielded Inspection has their findings"""
+    install()
+    inspection = Inspection(
+        threshold or getattr(settings, 'STORE_NPLUSONE_THRESHOLD', 5),
+        slow_ms or getattr(settings, 'STORE_SLOW_QUERY_MS', 100),
+    )
+    token = _current.set(inspection)
+    try:
+        yield inspection
+    finally:
+        _current.reset(token)
+
+
+class QueryInspectionMiddleware:
+    """Report each request's N+1 and slow queries; in strict mode fail on N+1s"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, 'STORE_QUERY_INSPECTION', '')
+        if not self.mode:
+            raise MiddlewareNotUsed
+        if self.mode not in ('warn', 'strict'):
+            raise ImproperlyConfigured(f"STORE_QUERY_INSPECTION must be 'warn' or 'strict', not {self.mode!r}")
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with inspect() as inspection:
+            response = self.get_response(request)
+        self._report(request, inspection)
+        return response
+
+    async def __acall__(self, request):
+        with inspect() as inspection:
+            response = await self.get_response(request)
+        self._report(request, inspection)
+        return response
+
+    def _report(self, request, inspection):
+        findings = inspection.findings
+        for finding in findings:
+            logger.warning('%s %s: %s', request.method, request.path, finding)
+        repeated = [finding for finding in findings if finding.kind == 'nplusone']
+        if repeated and self.mode == 'strict':
+            raise NPlusOneError(
+                f'{request.method} {request.path} repeated queries:\n' + '\n'.join(map(str, repeated))
+            )
@@ -0,0 +1,118 @@
+"""
+Multi-line orders.
+
+``place_order`` records a whole batch of sales in one transaction: the bikes
+involved are locked with a single ``SELECT ... FOR UPDATE``, stock is checked
+in memory, the sales are written with ``bulk_create`` and every bike's stock
+is decremented by one grouped ``UPDATE``. ``bulk_create`` skips ``Sale.save``
+and its signals, so the stock movements, sales rollups, cached responses and
+live dashboard events are handled here as well.
+"""
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .forms import OrderLineForm
+from .models import Bike, Customer, Sale, StockMovement
+from . import caching, events, rollups
+
+# Upper bound on lines accepted in a single order request
+MAX_ORDER_LINES = 5000
+
+
+def _failure(index, errors):
+    return {'line': index, 'success': False, 'errors': errors}
+
+
+def place_order(lines, allow_partial=False, batch_size=500):
+    """Record every valid line of an order as a sale.
+
+    lines is a sequence of mappings with customer, bike, quantity and the
+    optional sale_price and notes. Returns one result per line, in order.
+    Unless allow_partial is set, a single bad line rejects the whole order
+    and nothing is written.
+    """
+    results = [None] * len(lines)
+    valid = []
+    for index, data in enumerate(lines):
+        form = OrderLineForm(data if isinstance(data, dict) else {})
+        if form.is_valid():
+            valid.append((index, form.cleaned_data))
+        else:
+            results[index] = _failure(
+                index, {field: [str(e) for e in errors] for field, errors in form.errors.items()}
+            )
+
+    with transaction.atomic():
+        # Lock in primary key order so concurrent orders cannot deadlock
+        bikes = Bike.objects.select_for_update().only(
+            'id', 'brand', 'model', 'color', 'type', 'price', 'stock_quantity'
+        ).order_by('pk').in_bulk({line['bike'] for _, line in valid})
+        customer_ids = set(Customer.objects.filter(
+            pk__in={line['customer'] for _, line in valid}
+        ).values_list('pk', flat=True))
+
+        remaining = {pk: bike.stock_quantity for pk, bike in bikes.items()}
+        accepted = []
+        for index, line in valid:
+            bike = bikes.get(line['bike'])
+            errors = {}
+            if line['customer'] not in customer_ids:
+                errors['customer'] = ['Unknown customer.']
+            if bike is None:
+                errors['bike'] = ['Unknown bike.']
+            elif remaining[bike.pk] < line['quantity']:
+                errors['quantity'] = [
+                    f"Insufficient stock for {bike}. Available: {remaining[bike.pk]}"
+                ]
+            if errors:
+                results[index] = _failure(index, errors)
+                continue
+
+            remaining[bike.pk] -= line['quantity']
+            accepted.append((index, Sale(
+                customer_id=line['customer'],
+                bike=bike,
+                quantity=line['quantity'],
+                sale_price=line['sale_price'] or bike.price,
+                notes=line['notes'],
+            )))
+
+        if len(accepted) < len(lines) and not allow_partial:
+            for index, _ in accepted:
+                results[index] = _failure(
+                    index, {'order': ['Not recorded because other lines in the order failed.']}
+                )
+            return results
+
+        sales = Sale.objects.bulk_create([sale for _, sale in accepted], batch_size=batch_size)
+
+        decrements = {
+            pk: bikes[pk].stock_quantity - left
+            for pk, left in remaining.items()
+            if left != bikes[pk].stock_quantity
+        }
+        if decrements:
+            Bike.objects.filter(pk__in=decrements).update(
+                stock_quantity=Case(
+                    *[When(pk=pk, then=F('stock_quantity') - units) for pk, units in decrements.items()]
+                ),
+                updated_at=timezone.now(),
+            )
+        StockMovement.objects.bulk_create([
+            StockMovement(bike_id=sale.bike_id, kind=StockMovement.SALE, quantity=-sale.quantity, sale=sale)
+            for sale in sales
+        ], batch_size=batch_size)
+
+        rollups.apply_contributions(rollups.contribution_for(sale) for sale in sales)
+        caching.invalidate('sale', 'bike', *[f'bike:{pk}' for pk in decrements])
+        events.on_commit(events.publish_sales, sales)
+
+    for (index, _), sale in zip(accepted, sales):
+        results[index] = {
+            'line': index,
+            'success': True,
+            'sale_id': sale.pk,
+            'total': sale.total_amount,
+        }
+    return results
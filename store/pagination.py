@@ -0,0 +1,171 @@
+"""
+Keyset (cursor) pagination for the list views.
+
+Offset pagination runs ``COUNT(*)`` on every request and makes the database
+skip ``OFFSET n`` rows, so deep pages get slower as the table grows.
+``KeysetPaginator`` instead remembers the ordering key of the last (or first)
+row on a page in a signed, opaque cursor and asks for the rows after (or
+before) it, which an index on the ordering columns answers at the same cost
+on every page. The total shown to users comes from a count cached until the
+tables it reads change, or from a caller-supplied function such as the sales
+rollups.
+
+The ordering columns, model fields or annotations such as a search rank,
+must be non-null and end in a unique column (the primary key is appended
+when it is missing).
+"""
+from functools import reduce
+import operator
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import caching
+
+_SALT = 'store.pagination'
+
+
+def cached_count(queryset, timeout=None):
+    """queryset.count(), remembered per distinct query until a table it reads changes"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    return caching.cached(
+        'count', caching.table_topics(queryset), queryset.count, sql, params, timeout=timeout
+    )
+
+
+class KeysetPage:
+    """One page of rows plus the cursors for the neighbouring pages"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} rows>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset by its ordering key.
+
+    ordering defaults to the queryset's own ordering; count, if given, is a
+    callable returning the total number of rows (default: a cached COUNT).
+    """
+    keyset = True
+
+    def __init__(self, queryset, per_page, ordering=None, count=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        if not any(name.lstrip('-') in ('pk', queryset.model._meta.pk.name) for name in ordering):
+            ordering.append('-pk' if ordering and ordering[0].startswith('-') else 'pk')
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self._count = count
+
+    @cached_property
+    def count(self):
+        if self._count is not None:
+            return self._count()
+        return cached_count(self.queryset)
+
+    def _field(self, name):
+        """The model field, or for an annotation its output field, a key column is read with"""
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        meta = self.queryset.model._meta
+        return meta.pk if name == 'pk' else meta.get_field(name)
+
+    def _attname(self, name):
+        return name if name in self.queryset.query.annotations else self._field(name).attname
+
+    def _key(self, obj):
+        return [str(getattr(obj, self._attname(name))) for name, _ in self.ordering]
+
+    def _cursor(self, obj, backwards):
+        return signing.dumps({'k': self._key(obj), 'b': backwards}, salt=_SALT, compress=True)
+
+    def _decode(self, cursor):
+        """Return (key values, backwards) for a cursor, or None if it is not valid"""
+        try:
+            data = signing.loads(cursor, salt=_SALT)
+            values = [self._field(name).to_python(value) for (name, _), value in zip(self.ordering, data['k'])]
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+        if len(values) != len(self.ordering):
+            return None
+        return values, bool(data.get('b'))
+
+    def _beyond(self, values, backwards):
+        """Rows after the key in the (possibly reversed) ordering.
+
+        The expanded OR is led by a plain range on the first column so the
+        database can seek straight to the key in its index.
+        """
+        clauses = []
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            clauses.append(Q(**equal, **{f'{name}__{lookup}': value}))
+            equal[name] = value
+        first, descending = self.ordering[0]
+        bound = Q(**{f'{first}__{"lte" if descending != backwards else "gte"}': values[0]})
+        return bound & reduce(operator.or_, clauses)
+
+    def page(self, cursor=None):
+        decoded = self._decode(cursor) if cursor else None
+        backwards = bool(decoded and decoded[1])
+        queryset = self.queryset.order_by(*[
+            f'-{name}' if descending != backwards else name for name, descending in self.ordering
+        ])
+        if decoded:
+            queryset = queryset.filter(self._beyond(*decoded))
+
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if more or backwards:
+                next_cursor = self._cursor(rows[-1], backwards=False)
+            if decoded and (more or not backwards):
+                previous_cursor = self._cursor(rows[0], backwards=True)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """ListView mixin that paginates with cursors instead of page numbers"""
+    cursor_kwarg = 'cursor'
+    keyset_ordering = None
+
+    def get_keyset_count(self):
+        """Callable returning the total row count, or None for a cached COUNT"""
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering, self.get_keyset_count())
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,138 @@
+"""
+Per-route performance measurement.
+
+``route_requests`` maps every named route in ``store/urls.py`` to a request
+that exercises it, ``measure`` records the SQL query count and median wall
+time for one route, and ``perf_budgets.json`` holds the committed budget for
+each route. The performance test fails when a route goes over its budget and
+can write the measurements out as a JSON baseline for comparing releases.
+``explain_plan`` returns the database's query plan for captured SQL.
+"""
+from pathlib import Path
+from statistics import median
+import json
+import platform
+import time
+
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+BUDGETS_PATH = Path(__file__).with_name('perf_budgets.json')
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path) as budgets:
+        return json.load(budgets)
+
+
+def route_requests(bike, customer, supplier, sale):
+    """Return {route name: (method, url, json body)} covering every store route"""
+    order = {'lines': [{'customer': customer.pk, 'bike': bike.pk, 'quantity': 1}]}
+    return {
+        'dashboard': ('get', reverse('store:dashboard'), None),
+        'bike_list': ('get', reverse('store:bike_list'), None),
+        'bike_detail': ('get', reverse('store:bike_detail', args=[bike.pk]), None),
+        'bike_create': ('get', reverse('store:bike_create'), None),
+        'bike_update': ('get', reverse('store:bike_update', args=[bike.pk]), None),
+        'bike_delete': ('get', reverse('store:bike_delete', args=[bike.pk]), None),
+        'bike_export': ('get', reverse('store:bike_export'), None),
+        'customer_list': ('get', reverse('store:customer_list'), None),
+        'customer_detail': ('get', reverse('store:customer_detail', args=[customer.pk]), None),
+        'customer_create': ('get', reverse('store:customer_create'), None),
+        'customer_update': ('get', reverse('store:customer_update', args=[customer.pk]), None),
+        'customer_delete': ('get', reverse('store:customer_delete', args=[customer.pk]), None),
+        'customer_export': ('get', reverse('store:customer_export'), None),
+        'sale_list': ('get', reverse('store:sale_list'), None),
+        'sale_detail': ('get', reverse('store:sale_detail', args=[sale.pk]), None),
+        'sale_create': ('get', reverse('store:sale_create'), None),
+        'sale_export': ('get', reverse('store:sale_export'), None),
+        'supplier_list': ('get', reverse('store:supplier_list'), None),
+        'supplier_detail': ('get', reverse('store:supplier_detail', args=[supplier.pk]), None),
+        'supplier_create': ('get', reverse('store:supplier_create'), None),
+        'supplier_update': ('get', reverse('store:supplier_update', args=[supplier.pk]), None),
+        'supplier_delete': ('get', reverse('store:supplier_delete', args=[supplier.pk]), None),
+        'reorder_plan': ('get', reverse('store:reorder_plan'), None),
+        'reorder_export': ('get', reverse('store:reorder_export'), None),
+        'reports': ('get', reverse('store:reports'), None),
+        'api_bike_price': ('get', reverse('store:api_bike_price', args=[bike.pk]), None),
+        'api_dashboard': ('get', reverse('store:api_dashboard'), None),
+        'api_sales_by_bike_type': ('get', reverse('store:api_sales_by_bike_type'), None),
+        'api_sales_series': ('get', reverse('store:api_sales_series'), None),
+        'api_bike_inventory': ('get', reverse('store:api_bike_inventory'), None),
+        'api_events': ('get', reverse('store:api_events'), None),
+        'api_create_order': ('post', reverse('store:api_create_order'), order),
+        'api_search': ('post', reverse('store:api_search', args=['bikes']),
+                       {'query': bike.brand[:3], 'sort': {'field': 'relevance'}}),
+        'metrics': ('get', reverse('store:metrics'), None),
+    }
+
+
+def measure(client, method, url, body=None, repeat=3):
+    """Issue a request repeat times; return its status, worst query count and median ms"""
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            if body is None:
+                response = getattr(client, method)(url)
+            else:
+                response = getattr(client, method)(url, data=json.dumps(body),
+                                                   content_type='application/json')
+            timings.append(time.perf_counter() - started)
+        # The most any repeat issued, so cached responses do not hide queries
+        queries = max(queries, len(captured))
+    return {
+        'status': response.status_code,
+        'queries': queries,
+        'ms': round(median(timings) * 1000, 2),
+    }
+
+
+def write_baseline(path, results, **metadata):
+    """Write route measurements plus environment details as a JSON baseline"""
+    baseline = {
+        'generated_at': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        **metadata,
+        'routes': results,
+    }
+    with open(path, 'w') as output:
+        json.dump(baseline, output, indent=2, sort_keys=True)
+
+
+def explain_plan(sql, params=None, analyze=False):
+    """Return the query plan for sql (with optional params) as a list of lines.
+
+    analyze runs the query for actual timings where the backend supports it
+    (PostgreSQL's EXPLAIN ANALYZE); SQLite always returns its static plan.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            rows = cursor.fetchall()
+        # Rows are (id, parent, notused, detail); indent children under parents
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node] + detail)
+        return lines
+
+    prefix = 'EXPLAIN'
+    if analyze and connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS)'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def is_full_scan(plan_line):
+    """Whether a plan line reads a whole table rather than using an index"""
+    line = plan_line.strip()
+    return (line.startswith('SCAN ') and ' USING ' not in line) or 'Seq Scan' in line
@@ -0,0 +1,319 @@
+"""
+Database connection pooling.
+
+``configure_pool`` turns pooling on for a ``DATABASES`` entry, as the
+settings do unless ``DB_POOL=0``:
+
+* PostgreSQL uses Django's own pool (``OPTIONS['pool']``), which needs
+  psycopg 3 with ``psycopg_pool``.
+* SQLite switches to the ``store.backends.sqlite3`` engine, whose
+  connections come from a ``ConnectionPool`` below. Opening an SQLite
+  connection also registers Django's SQL functions and runs its PRAGMAs, so
+  a connection per request costs more than the file open.
+* Other databases, or PostgreSQL without psycopg 3, keep persistent
+  connections (``CONN_MAX_AGE``) with health checks.
+
+Pooled connections are released at the end of every request
+(``CONN_MAX_AGE = 0``), so a few connections serve many more threads, and
+``max_size`` bounds how many the process ever holds. A thread asking for a
+connection while all of them are in use waits up to ``timeout`` seconds and
+then fails with ``OperationalError``. With ``CONN_HEALTH_CHECKS`` both pools
+test a connection before handing it out.
+
+Both pools report the same figures, named as psycopg_pool's
+``get_stats()`` names them; ``render()`` formats them for ``/metrics``.
+"""
+import os
+import threading
+import time
+
+# Pool options understood by both pools; see ConnectionPool
+DEFAULT_OPTIONS = {
+    'min_size': 2,
+    'max_size': 10,
+    'timeout': 10.0,
+    'max_idle': 300.0,
+}
+# Figures of get_stats() that are gauges rather than running totals
+GAUGES = ('pool_min', 'pool_max', 'pool_size', 'pool_available', 'requests_waiting')
+# The figures served at /metrics
+FIGURES = {
+    'pool_min': 'Connections the pool keeps open even when idle',
+    'pool_max': 'Most connections the pool opens',
+    'pool_size': 'Connections open or being opened',
+    'pool_available': 'Idle connections ready to be handed out',
+    'requests_waiting': 'Threads waiting for a free connection',
+    'requests_num': 'Connections asked for',
+    'requests_queued': 'Requests that had to wait for a free connection',
+    'requests_wait_ms': 'Milliseconds spent waiting for a free connection',
+    'requests_errors': 'Requests that got no connection in time',
+    'returns_bad': 'Connections returned in a broken state',
+    'connections_num': 'Connections opened',
+    'connections_ms': 'Milliseconds spent opening connections',
+    'connections_errors': 'Connections that failed to open',
+    'connections_lost': 'Connections found broken by a health check',
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool's timeout"""
+
+
+class ConnectionPool:
+    """A thread-safe pool of DB-API connections.
+
+    connect opens a new connection and check, if given, runs a trivial query
+    on one, raising if it is broken. Idle connections are handed out most
+    recently used first and checked on the way out; a broken one is
+    discarded and replaced. Beyond min_size, connections idle for more than
+    max_idle seconds are closed, and every connection is closed once it has
+    been open for max_lifetime seconds.
+    """
+
+    def __init__(self, connect, check=None, min_size=2, max_size=10, timeout=10.0, max_idle=300.0,
+                 max_lifetime=3600.0):
+        if max_size < 1 or min_size < 0:
+            raise ValueError('A pool needs a max_size of at least 1 and a min_size of at least 0')
+        self.connect = connect
+        self.check = check
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Condition()
+        # (connection, opened at, released at), most recently released last
+        self._idle = []
+        # id(connection) -> opened at, for connections handed out
+        self._in_use = {}
+        self._opening = 0
+        self._waiting = 0
+        self._stats = dict.fromkeys((
+            'requests_num', 'requests_queued', 'requests_wait_ms', 'requests_errors', 'returns_bad',
+            'connections_num', 'connections_ms', 'connections_errors', 'connections_lost',
+        ), 0)
+
+    @property
+    def size(self):
+        """Connections open or being opened"""
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def getconn(self):
+        """Hand out a connection, waiting up to timeout for one to be free"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._lock:
+            self._stats['requests_num'] += 1
+            queued = False
+            while True:
+                self._close_stale(time.monotonic())
+                if self._idle:
+                    connection, opened, _ = self._idle.pop()
+                elif self.size < self.max_size:
+                    connection, opened = None, None
+                    self._opening += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['requests_errors'] += 1
+                        raise PoolTimeout(
+                            f'No database connection became free within {self.timeout}s '
+                            f'(all {self.max_size} in use)'
+                        )
+                    if not queued:
+                        queued = True
+                        self._stats['requests_queued'] += 1
+                    self._waiting += 1
+                    self._lock.wait(remaining)
+                    self._waiting -= 1
+                    continue
+
+                if connection is None:
+                    connection, opened = self._open()
+                elif not self._usable(connection):
+                    continue
+                self._in_use[id(connection)] = opened
+                if queued:
+                    self._stats['requests_wait_ms'] += int((time.monotonic() - started) * 1000)
+                return connection
+
+    def putconn(self, connection):
+        """Take a connection back; one left in a transaction is rolled back"""
+        with self._lock:
+            opened = self._in_use.pop(id(connection), None)
+            if opened is None:
+                # Handed out before a fork, or by another pool
+                return
+            now = time.monotonic()
+            try:
+                if getattr(connection, 'in_transaction', True):
+                    connection.rollback()
+            except Exception:
+                self._stats['returns_bad'] += 1
+                self._discard(connection)
+            else:
+                if now - opened > self.max_lifetime:
+                    self._discard(connection)
+                else:
+                    self._idle.append((connection, opened, now))
+            self._lock.notify()
+
+    def close(self):
+        """Close the idle connections; those in use are closed as they come back"""
+        with self._lock:
+            for connection, _, _ in self._idle:
+                self._discard(connection)
+            self._idle = []
+            self.max_lifetime = -1
+            self._lock.notify_all()
+
+    def get_stats(self):
+        """The pool's figures, named as psycopg_pool's get_stats() names them"""
+        with self._lock:
+            return {
+                'pool_min': self.min_size,
+                'pool_max': self.max_size,
+                'pool_size': self.size,
+                'pool_available': len(self._idle),
+                'requests_waiting': self._waiting,
+                **self._stats,
+            }
+
+    def _open(self):
+        # Connect without holding the lock, so other threads can take and return connections
+        self._lock.release()
+        try:
+            started = time.monotonic()
+            connection = self.connect()
+        except Exception:
+            self._lock.acquire()
+            self._opening -= 1
+            self._stats['connections_errors'] += 1
+            self._lock.notify()
+            raise
+        self._lock.acquire()
+        self._opening -= 1
+        self._stats['connections_num'] += 1
+        self._stats['connections_ms'] += int((time.monotonic() - started) * 1000)
+        return connection, time.monotonic()
+
+    def _usable(self, connection):
+        if self.check is None:
+            return True
+        try:
+            self.check(connection)
+        except Exception:
+            self._stats['connections_lost'] += 1
+            self._discard(connection)
+            return False
+        return True
+
+    def _close_stale(self, now):
+        """Close connections past max_lifetime, and those idle past max_idle beyond min_size"""
+        keep = []
+        surplus = len(self._idle) + len(self._in_use) - self.min_size
+        # Oldest releases first, so the most recently used connections stay
+        for connection, opened, released in self._idle:
+            if now - opened > self.max_lifetime or (surplus > 0 and now - released > self.max_idle):
+                self._discard(connection)
+                surplus -= 1
+            else:
+                keep.append((connection, opened, released))
+        self._idle = keep
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def get_pool(key, create):
+    """The process-wide pool for key, made by calling create() on first use"""
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = create()
+    return pool
+
+
+def close_pools():
+    """Close every pool; the next connection starts a new one"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def _forget_after_fork():
+    # A child process must not use, or close, its parent's connections
+    for pool in _pools.values():
+        pool._reset()
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
+
+
+def configure_pool(database, options=None):
+    """Turn on connection pooling for a DATABASES entry, in place, and return it.
+
+    options override DEFAULT_OPTIONS. Databases that cannot be pooled are
+    given persistent connections with health checks instead.
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    engine = database['ENGINE']
+    # Pooled connections are checked as they are handed out, persistent ones once per request
+    database['CONN_HEALTH_CHECKS'] = True
+    if engine in ('django.db.backends.sqlite3', 'store.backends.sqlite3'):
+        database['ENGINE'] = 'store.backends.sqlite3'
+    elif engine != 'django.db.backends.postgresql' or not _psycopg_pool():
+        database['CONN_MAX_AGE'] = database.get('CONN_MAX_AGE') or 600
+        return database
+    database.setdefault('OPTIONS', {})['pool'] = options
+    database['CONN_MAX_AGE'] = 0
+    return database
+
+
+def _psycopg_pool():
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def pool_stats(connections):
+    """Map each pooled database alias to its pool's get_stats()"""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def render(connections):
+    """The pools' figures in the Prometheus text exposition format"""
+    stats = pool_stats(connections)
+    if not stats:
+        return ''
+    lines = []
+    for name, description in FIGURES.items():
+        gauge = name in GAUGES
+        metric = f'bikestore_db_pool_{name}' if gauge else f'bikestore_db_pool_{name}_total'
+        lines += [
+            f'# HELP {metric} {description}, by database alias.',
+            f'# TYPE {metric} {"gauge" if gauge else "counter"}',
+        ]
+        for alias, figures in sorted(stats.items()):
+            lines.append(f'{metric}{{alias="{alias}"}} {figures.get(name, 0)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,92 @@
+"""
+Reorder planning across the whole catalogue.
+
+A bike needs reordering when its stock is at or below its reorder point, and
+is reordered up to its maximum stock; bikes without an ``Inventory`` row use
+the model's default levels. ``reorder_lines`` selects every such bike in one
+query, with the levels joined in and the quantity to order computed by the
+database, so planning reads only the bikes that are short however large the
+catalogue is, and never loads a bike per inventory row.
+
+``draft_orders`` streams those lines grouped into one draft purchase order
+per supplier; ``supplier_summary`` totals them per supplier with a single
+GROUP BY.
+"""
+from collections import namedtuple
+from decimal import Decimal
+from itertools import groupby
+
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Bike, Inventory
+
+DEFAULT_REORDER_POINT = Inventory._meta.get_field('reorder_point').default
+DEFAULT_MAXIMUM_STOCK = Inventory._meta.get_field('maximum_stock').default
+# Lines fetched from the database at a time
+CHUNK_SIZE = 2000
+
+LINE_FIELDS = [
+    'pk', 'brand', 'model', 'color', 'type', 'price', 'stock_quantity',
+    'reorder_point', 'maximum_stock', 'order_quantity', 'supplier_id', 'supplier__name',
+]
+
+# One supplier's share of the plan; supplier_id is None for bikes without one
+DraftOrder = namedtuple('DraftOrder', ['supplier_id', 'supplier_name', 'lines', 'units', 'value'])
+
+
+def reorder_lines(supplier=None):
+    """Bikes at or below their reorder point, ordered by supplier.
+
+    Each bike is annotated with its reorder_point, maximum_stock and the
+    order_quantity that brings it back up to maximum_stock. supplier
+    restricts the lines to one supplier's primary key; pass 0 for bikes
+    without a supplier.
+    """
+    bikes = Bike.objects.annotate(
+        reorder_point=Coalesce('inventory__reorder_point', Value(DEFAULT_REORDER_POINT)),
+        maximum_stock=Coalesce('inventory__maximum_stock', Value(DEFAULT_MAXIMUM_STOCK)),
+    ).filter(
+        stock_quantity__lte=F('reorder_point'),
+    ).annotate(
+        order_quantity=F('maximum_stock') - F('stock_quantity'),
+    ).filter(order_quantity__gt=0)
+    if supplier == 0:
+        bikes = bikes.filter(supplier__isnull=True)
+    elif supplier is not None:
+        bikes = bikes.filter(supplier_id=supplier)
+    return bikes.order_by(
+        F('supplier__name').asc(nulls_last=True), 'supplier_id', 'brand', 'model', 'color', 'pk'
+    )
+
+
+def draft_orders(supplier=None, chunk_size=CHUNK_SIZE):
+    """Yield a DraftOrder per supplier with bikes to reorder, valued at list price.
+
+    The lines are read as named rows (LINE_FIELDS) in chunks, so memory
+    holds one supplier's order at a time.
+    """
+    rows = reorder_lines(supplier).values_list(*LINE_FIELDS, named=True).iterator(chunk_size=chunk_size)
+    for supplier_id, lines in groupby(rows, key=lambda line: line.supplier_id):
+        lines = list(lines)
+        yield DraftOrder(
+            supplier_id=supplier_id,
+            supplier_name=lines[0].supplier__name,
+            lines=lines,
+            units=sum(line.order_quantity for line in lines),
+            value=sum((line.order_quantity * line.price for line in lines), Decimal('0.00')),
+        )
+
+
+def supplier_summary():
+    """Per supplier: the number of bikes to reorder, units to order and their list value"""
+    return list(
+        reorder_lines()
+        .values('supplier_id', 'supplier__name')
+        .annotate(
+            bikes=Count('pk'),
+            units=Sum('order_quantity'),
+            value=Sum(F('order_quantity') * F('price')),
+        )
+        .order_by(F('supplier__name').asc(nulls_last=True), 'supplier_id')
+    )
@@ -0,0 +1,309 @@
+"""
+Incrementally maintained sales rollups.
+
+Every saved or deleted ``Sale`` adjusts the per-day, per-month and
+per-bike-type totals, and the sales counters stored on its ``Bike``
+(``units_sold``, ``revenue``) and ``Customer`` (``purchase_count``,
+``lifetime_spend``, ``last_purchase_at``), with a single ``F()`` update per
+row in the sale's own transaction, so the dashboard, reports and lists read
+a handful of stored values instead of aggregating the whole sales history.
+``rebuild_rollups`` recomputes everything from scratch and
+``reconcile_counters`` finds and repairs counters that have drifted.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Count, DateTimeField, DecimalField, F, IntegerField, Max, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from . import caching, timeseries
+from .models import (
+    Bike, Customer, Sale, DailySalesRollup, MonthlySalesRollup, BikeTypeSalesRollup,
+)
+
+ROLLUP_MODELS = [
+    DailySalesRollup,
+    MonthlySalesRollup,
+    BikeTypeSalesRollup,
+]
+COUNTER_MODELS = [Bike, Customer]
+
+# The values a sale contributes to the rollups, captured so an edited sale
+# can be reversed with the figures it was originally counted under.
+SaleContribution = namedtuple(
+    'SaleContribution',
+    ['day', 'sale_date', 'bike_id', 'bike_type', 'customer_id', 'quantity', 'amount'],
+)
+
+
+def sale_day(sale_date):
+    """Return the local calendar day a sale timestamp falls on"""
+    if timezone.is_aware(sale_date):
+        sale_date = timezone.localtime(sale_date)
+    return sale_date.date()
+
+
+def contribution_for(sale):
+    """Build the rollup contribution for a saved sale"""
+    return SaleContribution(
+        day=sale_day(sale.sale_date),
+        sale_date=sale.sale_date,
+        bike_id=sale.bike_id,
+        bike_type=sale.bike.type,
+        customer_id=sale.customer_id,
+        quantity=sale.quantity,
+        amount=sale.quantity * sale.sale_price,
+    )
+
+
+def _bump(model, lookup, sale_count, units, amount):
+    """Add (or, with negative figures, subtract) totals to the rollup row matching lookup"""
+    changes = {
+        'sale_count': F('sale_count') + sale_count,
+        'units_sold': F('units_sold') + units,
+        'revenue': F('revenue') + amount,
+        'updated_at': timezone.now(),
+    }
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    # Never create rows on the way down: a missing row while subtracting means
+    # the parent bike or customer is being deleted along with its rollup.
+    if sale_count > 0:
+        _, created = model.objects.get_or_create(
+            **lookup, defaults={'sale_count': sale_count, 'units_sold': units, 'revenue': amount}
+        )
+        if not created:
+            model.objects.filter(**lookup).update(**changes)
+
+
+def _latest_purchase(customer_id):
+    """The customer's latest remaining sale date, as an expression for UPDATE"""
+    return Subquery(
+        Sale.objects.filter(customer_id=customer_id).order_by('-sale_date').values('sale_date')[:1],
+        output_field=DateTimeField(),
+    )
+
+
+def apply_contributions(contributions, sign=1):
+    """Add (sign=1) or remove (sign=-1) many sales from every rollup table
+    and from the counters of their bikes and customers.
+
+    Contributions are summed per rollup row, bike and customer first, so a
+    batch touching the same day, bike or customer many times still issues
+    one UPDATE per row.
+    """
+    grouped = defaultdict(lambda: [0, 0, Decimal('0.00')])
+    bikes = defaultdict(lambda: [0, Decimal('0.00')])
+    customers = defaultdict(lambda: [0, Decimal('0.00'), None])
+    for contribution in contributions:
+        amount = sign * Decimal(contribution.amount)
+        for key in (
+            (DailySalesRollup, 'day', contribution.day),
+            (MonthlySalesRollup, 'month', contribution.day.replace(day=1)),
+            (BikeTypeSalesRollup, 'bike_type', contribution.bike_type),
+        ):
+            totals = grouped[key]
+            totals[0] += sign
+            totals[1] += sign * contribution.quantity
+            totals[2] += amount
+
+        bike = bikes[contribution.bike_id]
+        bike[0] += sign * contribution.quantity
+        bike[1] += amount
+        customer = customers[contribution.customer_id]
+        customer[0] += sign
+        customer[1] += amount
+        if customer[2] is None or contribution.sale_date > customer[2]:
+            customer[2] = contribution.sale_date
+
+    with transaction.atomic():
+        for (model, field, value), (sale_count, units, amount) in grouped.items():
+            _bump(model, {field: value}, sale_count, units, amount)
+        for bike_id, (units, amount) in bikes.items():
+            Bike.objects.filter(pk=bike_id).update(
+                units_sold=F('units_sold') + units,
+                revenue=F('revenue') + amount,
+            )
+        for customer_id, (sale_count, amount, latest) in customers.items():
+            if sign > 0:
+                latest = Value(latest, output_field=DateTimeField())
+                last_purchase_at = Greatest(Coalesce('last_purchase_at', latest), latest)
+            else:
+                # The removed sales are already gone, so look up what is left
+                last_purchase_at = _latest_purchase(customer_id)
+            Customer.objects.filter(pk=customer_id).update(
+                purchase_count=F('purchase_count') + sale_count,
+                lifetime_spend=F('lifetime_spend') + amount,
+                last_purchase_at=last_purchase_at,
+            )
+        caching.invalidate('rollups')
+
+
+def apply_contribution(contribution, sign=1):
+    """Add (sign=1) or remove (sign=-1) a sale from every rollup table"""
+    apply_contributions([contribution], sign)
+
+
+def move_bike_type(bike_id, old_type, new_type):
+    """Shift a bike's accumulated sales from one bike type rollup to another"""
+    totals = Sale.objects.filter(bike_id=bike_id).aggregate(
+        sale_count=Count('pk'),
+        units_sold=Sum('quantity'),
+        revenue=Sum(F('quantity') * F('sale_price')),
+    )
+    if not totals['sale_count']:
+        return
+    with transaction.atomic():
+        _bump(BikeTypeSalesRollup, {'bike_type': old_type},
+              -totals['sale_count'], -totals['units_sold'], -totals['revenue'])
+        _bump(BikeTypeSalesRollup, {'bike_type': new_type},
+              totals['sale_count'], totals['units_sold'], totals['revenue'])
+        caching.invalidate('rollups')
+
+
+def sales_totals():
+    """Overall sale count and revenue, summed from the per-type rollup"""
+    totals = BikeTypeSalesRollup.objects.aggregate(
+        total_sales=Sum('sale_count'),
+        total_units=Sum('units_sold'),
+        total_revenue=Sum('revenue'),
+    )
+    return {
+        'total_sales': totals['total_sales'] or 0,
+        'total_units': totals['total_units'] or 0,
+        'total_revenue': totals['total_revenue'] or Decimal('0.00'),
+    }
+
+
+def _grouped_totals(*group_by, **annotations):
+    return (
+        Sale.objects.order_by()
+        .annotate(**annotations)
+        .values(*group_by)
+        .annotate(
+            sale_count=Count('id'),
+            units_sold=Sum('quantity'),
+            revenue=Sum(F('quantity') * F('sale_price')),
+        )
+    )
+
+
+@transaction.atomic
+def rebuild_rollups(batch_size=1000):
+    """Recompute every rollup table and sales counter from the full sales history.
+
+    The stored time-series periods are dropped too, to be recomputed on use.
+    Returns a mapping of model name to the number of rows written.
+    """
+    for model in ROLLUP_MODELS:
+        model.objects.all().delete()
+
+    daily = [
+        DailySalesRollup(day=row['day'], sale_count=row['sale_count'],
+                         units_sold=row['units_sold'], revenue=row['revenue'])
+        for row in _grouped_totals('day', day=TruncDate('sale_date'))
+    ]
+
+    monthly = {}
+    for day_rollup in daily:
+        month = day_rollup.day.replace(day=1)
+        rollup = monthly.setdefault(month, MonthlySalesRollup(month=month))
+        rollup.sale_count += day_rollup.sale_count
+        rollup.units_sold += day_rollup.units_sold
+        rollup.revenue += day_rollup.revenue
+
+    by_type = [
+        BikeTypeSalesRollup(bike_type=row['bike__type'], sale_count=row['sale_count'],
+                            units_sold=row['units_sold'], revenue=row['revenue'])
+        for row in _grouped_totals('bike__type')
+    ]
+    caching.invalidate('rollups')
+    timeseries.invalidate_all()
+
+    written = {}
+    for model, rows in (
+        (DailySalesRollup, daily),
+        (MonthlySalesRollup, list(monthly.values())),
+        (BikeTypeSalesRollup, by_type),
+    ):
+        model.objects.bulk_create(rows, batch_size=batch_size)
+        written[model.__name__] = len(rows)
+    for model in COUNTER_MODELS:
+        _, written[model.__name__] = reconcile_counters(model, fix=True, batch_size=batch_size)
+    return written
+
+
+def true_counters(model):
+    """Expressions computing the sales counters of each Bike or Customer row from its sales"""
+    field = 'bike' if model is Bike else 'customer'
+    sales = Sale.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    money = DecimalField(max_digits=16, decimal_places=2)
+
+    def total(aggregate, output_field):
+        return Subquery(sales.annotate(total=aggregate).values('total'), output_field=output_field)
+
+    revenue = Coalesce(total(Sum(F('quantity') * F('sale_price')), money), Decimal('0.00'), output_field=money)
+    if model is Bike:
+        return {
+            'units_sold': Coalesce(total(Sum('quantity'), IntegerField()), 0),
+            'revenue': revenue,
+        }
+    return {
+        'purchase_count': Coalesce(total(Count('pk'), IntegerField()), 0),
+        'lifetime_spend': revenue,
+        'last_purchase_at': total(Max('sale_date'), DateTimeField()),
+    }
+
+
+def reconcile_counters(model, fix=False, batch_size=1000, report=None):
+    """Compare every stored sales counter of model (Bike or Customer) with its sales.
+
+    Rows are read in batches with their true counters computed alongside by
+    the database; with fix, rows that differ are written back with
+    bulk_update, under a row lock so sales made meanwhile still land on top.
+    report(pk, field, stored, actual) is called for each differing value.
+    Returns (rows checked, rows that differed).
+    """
+    names = list(model.counter_fields)
+    expressions = true_counters(model)
+    # Computed sums come back unrounded; compare them as the column stores them
+    places = [
+        Decimal(1).scaleb(-field.decimal_places) if isinstance(field, DecimalField) else None
+        for field in map(model._meta.get_field, names)
+    ]
+    checked = drifted = 0
+    repairs = []
+    with transaction.atomic():
+        rows = model.objects.order_by('pk').annotate(
+            **{f'true_{name}': expressions[name] for name in names}
+        )
+        if fix:
+            rows = rows.select_for_update()
+        for pk, *values in rows.values_list('pk', *names, *[f'true_{name}' for name in names]).iterator(
+            chunk_size=batch_size
+        ):
+            checked += 1
+            stored = values[:len(names)]
+            actual = [
+                value.quantize(exponent) if exponent and value is not None else value
+                for value, exponent in zip(values[len(names):], places)
+            ]
+            if list(stored) == actual:
+                continue
+            drifted += 1
+            if report is not None:
+                for name, was, correct in zip(names, stored, actual):
+                    if was != correct:
+                        report(pk, name, was, correct)
+            if fix:
+                repairs.append(model(pk=pk, **dict(zip(names, actual))))
+                if len(repairs) >= batch_size:
+                    model.objects.bulk_update(repairs, names)
+                    repairs = []
+        if repairs:
+            model.objects.bulk_update(repairs, names)
+    return checked, drifted
@@ -0,0 +1,265 @@
+"""
+Full-text search for the bike and customer lists.
+
+``search(queryset, text)`` narrows a Bike or Customer queryset to the rows
+matching every word of text (each word also matches as a prefix), best match
+first, with a ``search_rank`` on each row where higher is better, and can be
+sliced and paginated in SQL like any queryset. ``matches(queryset, text)``
+only filters, so the queryset keeps its own ordering.
+
+The engine depends on the database:
+
+* SQLite uses FTS5 tables with the model table as external content, kept in
+  sync by triggers, so bulk inserts and ``update()`` calls are indexed too.
+* PostgreSQL uses GIN indexes over a ``tsvector`` and a trigram expression
+  of the searchable fields; the indexes are on expressions, so there is
+  nothing to keep in sync.
+* Anything else falls back to ``icontains`` filters.
+
+``STORE_SEARCH_BACKEND`` may name another ``SearchBackend`` subclass by dotted
+path. ``install_search_index`` is run after every ``migrate`` and creates
+whatever the backend needs; it is idempotent and recreates the SQLite
+triggers if a table rebuild in a later migration dropped them.
+"""
+from functools import reduce
+import operator
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Bike, Customer
+
+# Columns searched for each model, in ranking weight order
+SEARCH_FIELDS = {
+    Bike: ['brand', 'model', 'type'],
+    Customer: ['name', 'email', 'phone'],
+}
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(text):
+    """Split free text into lower-cased words, dropping punctuation"""
+    return [word.lower() for word in _WORD.findall(text or '')]
+
+
+class SearchBackend:
+    """Match a queryset against free text with the icontains fallback.
+
+    Subclasses override install() to create their index structures, and
+    matches() and search() to use them.
+    """
+
+    def install(self, connection):
+        """Create or repair the backend's index structures"""
+
+    def rebuild(self, connection):
+        """Reindex every row from the model tables"""
+
+    def matches(self, queryset, terms):
+        """Filter queryset to the matching rows, leaving its ordering alone"""
+        fields = SEARCH_FIELDS[queryset.model]
+        for term in terms:
+            queryset = queryset.filter(
+                reduce(operator.or_, (Q(**{f'{field}__icontains': term}) for field in fields))
+            )
+        return queryset
+
+    def search(self, queryset, terms):
+        """Matching rows best first, each with a search_rank"""
+        return self.matches(queryset, terms).annotate(search_rank=Value(0))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 tables over the model tables, ranked by bm25"""
+
+    @staticmethod
+    def fts_table(model):
+        return f'{model._meta.db_table}_fts'
+
+    def install(self, connection):
+        existing = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            for model, fields in SEARCH_FIELDS.items():
+                table = model._meta.db_table
+                if table not in existing:
+                    continue
+                fts = self.fts_table(model)
+                columns = ', '.join(fields)
+                new = ', '.join(f'new.{field}' for field in fields)
+                old = ', '.join(f'old.{field}' for field in fields)
+                cursor.execute(
+                    "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+                    [table, f'{fts}_%'],
+                )
+                missing = cursor.fetchone()[0] < 3
+
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                    f"{columns}, content='{table}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+                    f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END"
+                )
+                # A new index, or one whose triggers were lost, starts from the table
+                if missing:
+                    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            for model in SEARCH_FIELDS:
+                fts = self.fts_table(model)
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    @staticmethod
+    def match_expression(terms):
+        return ' AND '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+    def matching_ids(self, model, terms):
+        fts = self.fts_table(model)
+        return RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [self.match_expression(terms)])
+
+    def matches(self, queryset, terms):
+        return queryset.filter(pk__in=self.matching_ids(queryset.model, terms))
+
+    def search(self, queryset, terms):
+        fts = self.fts_table(queryset.model)
+        meta = queryset.model._meta
+        # The matches drive the query through matches(), and each row's rank
+        # is looked up in the ranks of every match. LIMIT -1 keeps SQLite
+        # from flattening that subquery into a MATCH for every row, so it is
+        # ranked in one pass and searched by rowid through an automatic index.
+        ranks = f'SELECT rowid, -rank AS search_rank FROM {fts} WHERE {fts} MATCH %s LIMIT -1'
+        return self.matches(queryset, terms).annotate(
+            search_rank=RawSQL(
+                f'SELECT ranks.search_rank FROM ({ranks}) AS ranks '
+                f'WHERE ranks.rowid = {meta.db_table}.{meta.pk.column}',
+                [self.match_expression(terms)], output_field=FloatField(),
+            ),
+        ).order_by('-search_rank', 'pk')
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector and trigram GIN expression indexes, ranked by ts_rank"""
+
+    CONFIG = 'simple'
+    WEIGHTS = ['A', 'B', 'C']
+
+    def vector(self, fields):
+        from django.contrib.postgres.search import SearchVector
+        return reduce(operator.add, (
+            SearchVector(field, weight=weight, config=self.CONFIG)
+            for field, weight in zip(fields, self.WEIGHTS)
+        ))
+
+    def text(self, fields):
+        from django.db.models.functions import Concat, Lower
+        parts = []
+        for field in fields:
+            parts.extend([field, Value(' ')])
+        return Lower(Concat(*parts[:-1]))
+
+    def indexes(self, model):
+        from django.contrib.postgres.indexes import GinIndex, OpClass
+        fields = SEARCH_FIELDS[model]
+        table = model._meta.db_table
+        return [
+            GinIndex(self.vector(fields), name=f'{table}_search_idx'),
+            GinIndex(OpClass(self.text(fields), name='gin_trgm_ops'), name=f'{table}_trgm_idx'),
+        ]
+
+    def install(self, connection):
+        existing_tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        with connection.schema_editor() as editor:
+            for model in SEARCH_FIELDS:
+                table = model._meta.db_table
+                if table not in existing_tables:
+                    continue
+                with connection.cursor() as cursor:
+                    existing = connection.introspection.get_constraints(cursor, table)
+                for index in self.indexes(model):
+                    if index.name not in existing:
+                        editor.add_index(model, index)
+
+    def query(self, terms):
+        from django.contrib.postgres.search import SearchQuery
+        return SearchQuery(
+            ' & '.join(f"'{term}':*" for term in terms), search_type='raw', config=self.CONFIG
+        )
+
+    def matches(self, queryset, terms):
+        from django.contrib.postgres.lookups import TrigramWordSimilar
+        fields = SEARCH_FIELDS[queryset.model]
+        return queryset.alias(
+            search_vector=self.vector(fields),
+            search_text=self.text(fields),
+        ).filter(
+            Q(search_vector=self.query(terms))
+            | Q(TrigramWordSimilar(F('search_text'), Value(' '.join(terms))))
+        )
+
+    def search(self, queryset, terms):
+        from django.contrib.postgres.search import SearchRank, TrigramWordSimilarity
+        fields = SEARCH_FIELDS[queryset.model]
+        return self.matches(queryset, terms).annotate(
+            search_rank=SearchRank(self.vector(fields), self.query(terms))
+            + TrigramWordSimilarity(' '.join(terms), self.text(fields)),
+        ).order_by('-search_rank', 'pk')
+
+
+_DEFAULT_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(connection):
+    path = getattr(settings, 'STORE_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return _DEFAULT_BACKENDS.get(connection.vendor, SearchBackend)()
+
+
+def install_search_index(using='default'):
+    get_backend(connections[using]).install(connections[using])
+
+
+def rebuild_search_index(using='default'):
+    get_backend(connections[using]).rebuild(connections[using])
+
+
+def _backend_for(queryset):
+    return get_backend(connections[queryset.db or router.db_for_read(queryset.model)])
+
+
+def matches(queryset, text):
+    """Filter a Bike or Customer queryset to rows matching text, keeping its ordering"""
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    return _backend_for(queryset).matches(queryset, terms)
+
+
+def search(queryset, text):
+    """Filter a Bike or Customer queryset to rows matching text, best first"""
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    return _backend_for(queryset).search(queryset, terms)
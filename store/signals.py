@@ -0,0 +1,125 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from .models import Bike, Customer, Sale, Supplier
+from . import caching, events, metrics, rollups, search, timeseries
+
+
+@receiver(pre_save, sender=Sale)
+def remember_sale_contribution(sender, instance, raw=False, **kwargs):
+    """Capture what an existing sale contributed before it is edited"""
+    instance._previous_contribution = None
+    if raw or not instance.pk:
+        return
+    previous = Sale.objects.select_related('bike').filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._previous_contribution = rollups.contribution_for(previous)
+
+
+@receiver(post_save, sender=Sale)
+def update_rollups_on_sale_save(sender, instance, raw=False, **kwargs):
+    """Fold a new or edited sale into the sales rollups"""
+    if raw:
+        return
+    previous = getattr(instance, '_previous_contribution', None)
+    if previous is not None:
+        rollups.apply_contribution(previous, sign=-1)
+    rollups.apply_contribution(rollups.contribution_for(instance))
+
+
+@receiver(post_delete, sender=Sale)
+def update_rollups_on_sale_delete(sender, instance, **kwargs):
+    """Remove a deleted sale from the sales rollups"""
+    rollups.apply_contribution(rollups.contribution_for(instance), sign=-1)
+
+
+@receiver(post_save, sender=Bike)
+def move_rollups_on_type_change(sender, instance, raw=False, **kwargs):
+    """Keep the per-type rollup in step when a bike is re-categorised.
+
+    Bike.save leaves the previous type, stock and supplier on the instance.
+    """
+    previous_type = getattr(instance, '_previous_type', None)
+    if raw or previous_type is None or previous_type == instance.type:
+        return
+    rollups.move_bike_type(instance.pk, previous_type, instance.type)
+
+
+@receiver(post_save, sender=Sale)
+def invalidate_periods_on_sale_save(sender, instance, raw=False, **kwargs):
+    """Forget the stored sales periods of the sale's day, and of the day it was moved from"""
+    if raw:
+        return
+    timeseries.invalidate(rollups.sale_day(instance.sale_date))
+    previous = getattr(instance, '_previous_contribution', None)
+    if previous is not None:
+        timeseries.invalidate(previous.day)
+
+
+@receiver(post_delete, sender=Sale)
+def invalidate_periods_on_sale_delete(sender, instance, **kwargs):
+    timeseries.invalidate(rollups.sale_day(instance.sale_date))
+
+
+@receiver(post_save, sender=Bike)
+def invalidate_periods_on_bike_change(sender, instance, raw=False, **kwargs):
+    """Stored sales periods are split by type and supplier, so re-file the bike's sales"""
+    previous_type = getattr(instance, '_previous_type', None)
+    if raw or previous_type is None:
+        return
+    if previous_type != instance.type or instance._previous_supplier != instance.supplier_id:
+        timeseries.invalidate_bike(instance.pk)
+
+
+@receiver(post_delete, sender=Supplier)
+def invalidate_periods_on_supplier_delete(sender, instance, **kwargs):
+    """The supplier's buckets went with it, so every stored period is short"""
+    timeseries.invalidate_all()
+
+
+@receiver([post_save, post_delete], sender=Bike)
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=Supplier)
+def invalidate_caches(sender, instance, **kwargs):
+    """Drop cached responses built from the table or the row"""
+    name = sender._meta.model_name
+    caching.invalidate(name, f'{name}:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Sale)
+def invalidate_sale_caches(sender, instance, created=False, **kwargs):
+    """Drop cached responses built from sales, and from the bike a new sale took stock from"""
+    topics = ['sale', f'sale:{instance.pk}']
+    if created:
+        topics += ['bike', f'bike:{instance.bike_id}']
+    caching.invalidate(*topics)
+
+
+@receiver(post_save, sender=Sale)
+def publish_new_sale(sender, instance, created=False, raw=False, **kwargs):
+    """Push a new sale to the live dashboards once it commits"""
+    if created and not raw:
+        events.on_commit(events.publish_sales, [instance])
+
+
+@receiver(post_save, sender=Bike)
+def publish_stock_change(sender, instance, created=False, raw=False, **kwargs):
+    """Push a new bike or an edited stock level to the live dashboards"""
+    previous = getattr(instance, '_previous_stock', None)
+    if raw or not (created or previous != instance.stock_quantity):
+        return
+    events.on_commit(events.publish_stock, {instance.pk: previous})
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using='default', **kwargs):
+    """Create or repair the full-text search index after every migrate"""
+    if sender.name == 'store':
+        search.install_search_index(using)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Count every query towards the request metrics"""
+    metrics.install(connection)
@@ -0,0 +1,93 @@
+"""
+Headline store statistics in a single query.
+
+The dashboard, its JSON API and the reports page show the same figures:
+catalogue size and stock, customers, and sales totals overall and per bike
+type. ``store_stats()`` reads all of them in one round trip. The query runs
+over the per-type sales rollup (one row per bike type) with a conditional
+``SUM ... FILTER`` per type for the breakdown, and the catalogue and
+customer figures ride along as scalar subqueries.
+
+Every query here groups by a constant, which leaves no GROUP BY at all: it
+returns exactly one row even over an empty table, and the subqueries are
+plain annotations rather than aggregates.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q, Subquery, Sum, Value
+
+from .models import Bike, BikeTypeSalesRollup, Customer
+
+LOW_STOCK_LEVEL = 5
+
+
+def _totals(queryset):
+    """queryset aggregated into one row"""
+    return queryset.order_by().values(all=Value(1))
+
+
+def _scalar(queryset, aggregate):
+    return Subquery(_totals(queryset).annotate(value=aggregate).values('value'))
+
+
+def _figures():
+    figures = {
+        'total_sales': Sum('sale_count'),
+        'total_units': Sum('units_sold'),
+        'total_revenue': Sum('revenue'),
+    }
+    for index, (bike_type, _) in enumerate(Bike.BIKE_TYPES):
+        in_type = Q(bike_type=bike_type)
+        figures[f'type{index}_sales'] = Sum('sale_count', filter=in_type)
+        figures[f'type{index}_units'] = Sum('units_sold', filter=in_type)
+        figures[f'type{index}_revenue'] = Sum('revenue', filter=in_type)
+    bikes = Bike.objects.all()
+    figures.update(
+        total_bikes=_scalar(bikes, Count('pk')),
+        total_stock=_scalar(bikes, Sum('stock_quantity')),
+        low_stock_count=_scalar(bikes.filter(stock_quantity__lt=LOW_STOCK_LEVEL), Count('pk')),
+        total_customers=_scalar(Customer.objects.all(), Count('pk')),
+    )
+    return figures
+
+
+def _query():
+    return _totals(BikeTypeSalesRollup.objects.all()).annotate(**_figures())
+
+
+def _stats(row):
+    stats = {
+        'total_bikes': row['total_bikes'] or 0,
+        'total_stock': row['total_stock'] or 0,
+        'low_stock_count': row['low_stock_count'] or 0,
+        'total_customers': row['total_customers'] or 0,
+        'total_sales': row['total_sales'] or 0,
+        'total_units': row['total_units'] or 0,
+        'total_revenue': row['total_revenue'] or Decimal('0.00'),
+        'sales_by_type': [],
+    }
+    # Bike types in the rollup's own order, leaving out those without sales
+    for index, bike_type in sorted(enumerate(code for code, _ in Bike.BIKE_TYPES), key=lambda item: item[1]):
+        if row[f'type{index}_sales']:
+            stats['sales_by_type'].append({
+                'type': bike_type,
+                'sale_count': row[f'type{index}_sales'],
+                'units_sold': row[f'type{index}_units'],
+                'revenue': row[f'type{index}_revenue'],
+            })
+    return stats
+
+
+def store_stats():
+    """Every headline figure, and sales per bike type.
+
+    Returns total_bikes, total_stock, low_stock_count, total_customers,
+    total_sales, total_units, total_revenue and sales_by_type, a list of
+    {"type", "sale_count", "units_sold", "revenue"} for types with sales.
+    """
+    return _stats(_query().get())
+
+
+async def astore_stats():
+    """store_stats() for async views"""
+    return _stats(await _query().aget())
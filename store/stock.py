@@ -0,0 +1,145 @@
+"""
+The stock ledger.
+
+Every change to a bike's ``stock_quantity`` is recorded as a ``StockMovement``
+in the transaction that makes it: sales (``Sale.save`` and ``place_order``),
+restocks and returns (``restock`` and ``return_sale`` below) and adjustments
+(bike edits in the forms and the admin, and bike imports). The movements are
+never changed, so a bike's stock is always the sum of its movements.
+
+``take_snapshots``, run periodically by the ``snapshot_stock`` command,
+stores each bike's stock as of a moment in a ``StockSnapshot``. ``stock_at``
+then reads a bike's stock at any time as its latest snapshot at or before
+that time plus the movements since, a tail no longer than the interval
+between snapshots, instead of replaying the whole ledger.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import DateTimeField, Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Bike, Inventory, StockMovement, StockSnapshot
+from . import caching, events
+
+# Movements are stamped before their transaction commits, so snapshots are
+# taken this far behind the clock to be sure every earlier movement is in
+SNAPSHOT_DELAY = timedelta(minutes=5)
+# Lower bound for bikes without a snapshot
+BEGINNING = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _lock(bike_id):
+    """Lock the bike's row for the rest of the transaction; returns its stock"""
+    stock = Bike.objects.select_for_update().filter(pk=bike_id).values_list('stock_quantity', flat=True).first()
+    if stock is None:
+        raise Bike.DoesNotExist(f'No bike with id {bike_id}')
+    return stock
+
+
+def _move(bike_id, previous, kind, quantity, sale=None, note=''):
+    """Change a locked bike's stock by quantity and record the movement"""
+    now = timezone.now()
+    Bike.objects.filter(pk=bike_id).update(stock_quantity=F('stock_quantity') + quantity, updated_at=now)
+    movement = StockMovement.objects.create(
+        bike_id=bike_id, kind=kind, quantity=quantity, sale=sale, note=note, created_at=now
+    )
+    caching.invalidate('bike', f'bike:{bike_id}')
+    events.on_commit(events.publish_stock, {bike_id: previous})
+    return movement
+
+
+def restock(bike_id, quantity, note=''):
+    """Add quantity units of a bike to stock and mark its inventory as restocked"""
+    if quantity < 1:
+        raise ValueError('A restock adds at least one unit')
+    with transaction.atomic():
+        movement = _move(bike_id, _lock(bike_id), StockMovement.RESTOCK, quantity, note=note)
+        Inventory.objects.filter(bike_id=bike_id).update(last_restocked=movement.created_at)
+    return movement
+
+
+def return_sale(sale, quantity=None, note=''):
+    """Put units of a sale back into stock, by default all that are not yet returned.
+
+    The sale itself stays on the books; only the stock changes.
+    """
+    with transaction.atomic():
+        previous = _lock(sale.bike_id)
+        returned = StockMovement.objects.filter(sale=sale, kind=StockMovement.RETURN).aggregate(
+            total=Coalesce(Sum('quantity'), 0)
+        )['total']
+        returnable = sale.quantity - returned
+        if quantity is None:
+            quantity = returnable
+        if not 0 < quantity <= returnable:
+            raise ValueError(f'Only {returnable} units of this sale can be returned')
+        return _move(sale.bike_id, previous, StockMovement.RETURN, quantity, sale=sale, note=note)
+
+
+def record_opening_stock(bikes, batch_size=1000):
+    """Record the stock of bikes inserted without Bike.save, e.g. by bulk_create"""
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(bike_id=bike.pk, kind=StockMovement.ADJUSTMENT, quantity=bike.stock_quantity,
+                          note='Opening stock')
+            for bike in bikes if bike.stock_quantity
+        ],
+        batch_size=batch_size,
+    )
+
+
+def ledger(at, bikes=None):
+    """Bikes annotated with their stock at the moment at, read from the ledger.
+
+    Each bike carries its latest snapshot at or before at (snapshot_at,
+    snapshot_quantity), the sum of its movements after that up to at
+    (movements) and their total (ledger_stock). bikes restricts the result
+    to those primary keys.
+    """
+    snapshots = StockSnapshot.objects.filter(bike=OuterRef('pk'), taken_at__lte=at).order_by('-taken_at')
+    tail = StockMovement.objects.filter(
+        bike=OuterRef('pk'), created_at__gt=OuterRef('snapshot_at'), created_at__lte=at
+    ).order_by().values('bike').annotate(total=Sum('quantity')).values('total')
+    queryset = Bike.objects.order_by('pk')
+    if bikes is not None:
+        queryset = queryset.filter(pk__in=bikes)
+    return queryset.annotate(
+        snapshot_at=Coalesce(
+            Subquery(snapshots.values('taken_at')[:1]), Value(BEGINNING, output_field=DateTimeField())
+        ),
+        snapshot_quantity=Coalesce(Subquery(snapshots.values('quantity')[:1]), 0),
+    ).annotate(
+        movements=Coalesce(Subquery(tail), 0),
+    ).annotate(
+        ledger_stock=F('snapshot_quantity') + F('movements'),
+    )
+
+
+def stock_at(at, bikes=None):
+    """Map each bike's primary key to its stock at the moment at"""
+    return dict(ledger(at, bikes).values_list('pk', 'ledger_stock'))
+
+
+def take_snapshots(at=None, batch_size=1000):
+    """Snapshot the stock as of at of every bike that has moved since its last snapshot.
+
+    at defaults to SNAPSHOT_DELAY ago. Returns the number of snapshots taken.
+    """
+    at = at or timezone.now() - SNAPSHOT_DELAY
+    moved = StockMovement.objects.filter(
+        bike=OuterRef('pk'), created_at__gt=OuterRef('snapshot_at'), created_at__lte=at
+    )
+    # Read in full before writing: new snapshots would change what the query returns
+    snapshots = [
+        StockSnapshot(bike_id=pk, taken_at=at, quantity=quantity)
+        for pk, quantity in ledger(at).filter(Exists(moved)).values_list('pk', 'ledger_stock')
+    ]
+    StockSnapshot.objects.bulk_create(snapshots, batch_size=batch_size, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def drifted(at=None):
+    """Bikes whose stored stock differs from their ledger as of at (default now)"""
+    return ledger(at or timezone.now()).filter(~Q(ledger_stock=F('stock_quantity')))
@@ -0,0 +1,262 @@
+"""
+Synthetic store data for performance tests and local load testing.
+
+Rows are written in chunks with ``bulk_create``. Each chunk draws from its own
+random generator seeded from (seed, table, chunk number), so a given seed
+always produces the same catalogue and sales history however many worker
+processes share the work; only the primary keys depend on insert order.
+
+Sales are inserted as history: they carry back-dated ``sale_date`` values
+drawn from a seasonal, weekday and trading-hours weighted calendar with
+steady growth, favour a long tail of popular bikes and repeat customers, and
+do not touch stock. Each bike's starting stock goes into the stock ledger.
+The sales rollups are rebuilt once at the end.
+"""
+from collections import namedtuple
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+import multiprocessing
+import random
+import time
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import caching
+from .models import Bike, Customer, Sale, Supplier
+from .rollups import rebuild_rollups
+from .stock import record_opening_stock
+
+BRANDS = ['Trek', 'Giant', 'Specialized', 'Cannondale', 'Scott', 'Hero', 'Firefox', 'Btwin']
+COLORS = ['Black', 'White', 'Red', 'Blue', 'Green', 'Orange', 'Grey', 'Yellow']
+PRICE_RANGES = {
+    'Mountain': (40000, 330000),
+    'Road': (45000, 300000),
+    'Hybrid': (30000, 80000),
+    'Electric': (120000, 250000),
+    'BMX': (30000, 45000),
+    'Cruiser': (20000, 35000),
+}
+TYPE_WEIGHTS = [30, 20, 25, 10, 8, 7]
+
+# Relative sales volume by month (January first), weekday (Monday first)
+# and opening hour; the shop trades 09:00-20:59.
+MONTH_WEIGHTS = [0.7, 0.75, 0.95, 1.1, 1.2, 1.25, 1.2, 1.1, 1.0, 0.9, 0.85, 1.15]
+WEEKDAY_WEIGHTS = [0.85, 0.85, 0.9, 0.95, 1.05, 1.5, 1.25]
+HOUR_WEIGHTS = [3, 5, 7, 8, 7, 6, 6, 8, 9, 8, 5, 3]
+OPENING_HOUR = 9
+# Daily volume at the end of the window relative to the start
+GROWTH = 1.5
+
+QUANTITIES = [1, 2, 3]
+QUANTITY_WEIGHTS = [80, 15, 5]
+
+TableStats = namedtuple('TableStats', ['rows', 'seconds'])
+
+# Per-process generation state, set in the parent before work is handed out
+# and copied into each worker by _init_worker.
+_state = {}
+
+
+def _cumulative(weights):
+    return list(accumulate(weights))
+
+
+def sale_calendar(days, today):
+    """Return (first day, cumulative weights) for the days ending yesterday"""
+    first_day = today - timedelta(days=days)
+    weights = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        trend = 1 + (GROWTH - 1) * offset / max(days - 1, 1)
+        weights.append(MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] * trend)
+    return first_day, _cumulative(weights)
+
+
+def _popularity(rng, count, exponent):
+    """Zipf-like weights over count items in a seeded random order"""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return _cumulative(1 / rank ** exponent for rank in ranks)
+
+
+def _build_suppliers(rng, start, stop):
+    tag = _state['tag']
+    return [
+        Supplier(name=f'Supplier {tag}-{i}', contact_person=f'Contact {i}',
+                 email=f'supplier-{tag}-{i}@example.com', phone='0000000000',
+                 address=f'{i} Industrial Estate')
+        for i in range(start, stop)
+    ]
+
+
+def _build_bikes(rng, start, stop):
+    tag = _state['tag']
+    supplier_ids = _state['supplier_ids']
+    types = rng.choices(list(PRICE_RANGES), weights=TYPE_WEIGHTS, k=stop - start)
+    rows = []
+    for i, bike_type in zip(range(start, stop), types):
+        low, high = PRICE_RANGES[bike_type]
+        rows.append(Bike(
+            brand=rng.choice(BRANDS),
+            model=f'{bike_type} {tag}-{i}',
+            type=bike_type,
+            price=Decimal(rng.randrange(low, high, 500)),
+            stock_quantity=rng.randint(0, 60),
+            color=rng.choice(COLORS),
+            supplier_id=rng.choice(supplier_ids) if supplier_ids else None,
+        ))
+    return rows
+
+
+def _build_customers(rng, start, stop):
+    tag = _state['tag']
+    return [
+        Customer(name=f'Customer {tag}-{i}', email=f'customer-{tag}-{i}@example.com',
+                 phone=f'9{rng.randrange(10 ** 9):09d}', address=f'{i} Main Road')
+        for i in range(start, stop)
+    ]
+
+
+def _build_sales(rng, start, stop):
+    count = stop - start
+    bikes = _state['bikes']
+    customer_ids = _state['customer_ids']
+    first_day = _state['first_day']
+    tz = timezone.get_current_timezone()
+
+    bike_picks = rng.choices(bikes, cum_weights=_state['bike_weights'], k=count)
+    customer_picks = rng.choices(customer_ids, cum_weights=_state['customer_weights'], k=count)
+    day_offsets = rng.choices(range(len(_state['day_weights'])), cum_weights=_state['day_weights'], k=count)
+    hours = rng.choices(range(len(HOUR_WEIGHTS)), cum_weights=_state['hour_weights'], k=count)
+    quantities = rng.choices(QUANTITIES, weights=QUANTITY_WEIGHTS, k=count)
+
+    rows = []
+    for (bike_id, price), customer_id, offset, hour, quantity in zip(
+        bike_picks, customer_picks, day_offsets, hours, quantities
+    ):
+        sold_at = datetime.combine(
+            first_day + timedelta(days=offset),
+            dt_time(OPENING_HOUR + hour, rng.randrange(60), rng.randrange(60)),
+        )
+        rows.append(Sale(
+            customer_id=customer_id,
+            bike_id=bike_id,
+            quantity=quantity,
+            sale_price=(price * Decimal(rng.uniform(0.85, 1.0))).quantize(Decimal('0.01')),
+            sale_date=timezone.make_aware(sold_at, tz),
+        ))
+    return rows
+
+
+_TABLES = {
+    'suppliers': (Supplier, _build_suppliers),
+    'bikes': (Bike, _build_bikes),
+    'customers': (Customer, _build_customers),
+    'sales': (Sale, _build_sales),
+}
+
+
+def _insert_chunk(job):
+    """Build and insert one chunk; return the new (pk, price) pairs for bikes,
+    the new pks for suppliers and customers and the row count for sales"""
+    table, index, start, stop = job
+    model, build = _TABLES[table]
+    rows = build(random.Random(f'{_state["seed"]}:{table}:{index}'), start, stop)
+    with transaction.atomic():
+        if table == 'sales':
+            model.objects.bulk_create(rows, batch_size=_state['batch_size'])
+            return len(rows)
+        rows = model.objects.bulk_create(rows, batch_size=_state['batch_size'])
+        if table == 'bikes':
+            record_opening_stock(rows, batch_size=_state['batch_size'])
+    if table == 'bikes':
+        return [(bike.pk, bike.price) for bike in rows]
+    return [row.pk for row in rows]
+
+
+def _init_worker(state):
+    # Connections inherited from the parent must not be shared
+    connections.close_all()
+    _state.clear()
+    _state.update(state)
+
+
+def _run(table, total, chunk_size, workers, progress):
+    """Insert total rows of table in chunks, in parallel when workers > 1.
+
+    Results are returned in chunk order so the row order is stable.
+    """
+    jobs = [
+        (table, index, start, min(start + chunk_size, total))
+        for index, start in enumerate(range(0, total, chunk_size))
+    ]
+    results = []
+    done = 0
+    if workers > 1 and len(jobs) > 1:
+        connections.close_all()
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(dict(_state),)) as pool:
+            for job, result in zip(jobs, pool.imap(_insert_chunk, jobs)):
+                results.append(result)
+                done += job[3] - job[2]
+                if progress:
+                    progress(table, done, total)
+    else:
+        for job in jobs:
+            results.append(_insert_chunk(job))
+            done += job[3] - job[2]
+            if progress:
+                progress(table, done, total)
+    return results
+
+
+def generate_dataset(suppliers=10, bikes=200, customers=300, sales=3000, days=730,
+                     seed=0, batch_size=1000, chunk_size=10000, workers=1,
+                     rollups=True, progress=None):
+    """Insert a synthetic catalogue and sales history.
+
+    workers > 1 spreads the chunks over that many processes, each with its
+    own database connection. progress, if given, is called with
+    (table, rows done, rows total) after every chunk. Returns a mapping of
+    model name to TableStats(rows, seconds).
+    """
+    rng = random.Random(seed)
+    first_day, day_weights = sale_calendar(days, timezone.localdate())
+    _state.clear()
+    _state.update(
+        seed=seed,
+        tag=f'{rng.getrandbits(32):08x}',
+        batch_size=batch_size,
+        first_day=first_day,
+        day_weights=day_weights,
+        hour_weights=_cumulative(HOUR_WEIGHTS),
+    )
+    stats = {}
+
+    def timed(name, table, total):
+        started = time.perf_counter()
+        results = _run(table, total, chunk_size, workers, progress)
+        stats[name] = TableStats(total, time.perf_counter() - started)
+        return results
+
+    _state['supplier_ids'] = [pk for chunk in timed('Supplier', 'suppliers', suppliers) for pk in chunk]
+    _state['bikes'] = [bike for chunk in timed('Bike', 'bikes', bikes) for bike in chunk]
+    _state['customer_ids'] = [pk for chunk in timed('Customer', 'customers', customers) for pk in chunk]
+
+    if not (_state['bikes'] and _state['customer_ids']):
+        sales = 0
+    # A few bikes and a few loyal customers account for most of the sales
+    _state['bike_weights'] = _popularity(rng, len(_state['bikes']), 0.8)
+    _state['customer_weights'] = _cumulative(rng.paretovariate(1.5) for _ in _state['customer_ids'])
+    timed('Sale', 'sales', sales)
+
+    if rollups:
+        started = time.perf_counter()
+        written = rebuild_rollups(batch_size=batch_size)
+        stats['Rollups'] = TableStats(sum(written.values()), time.perf_counter() - started)
+
+    _state.clear()
+    # bulk_create sends no signals, so nothing else drops the cached responses
+    caching.invalidate(*caching.TABLES)
+    return stats
@@ -1,3 +1,1654 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from xml.etree import ElementTree
+from datetime import timedelta
+from decimal import Decimal
+from statistics import NormalDist
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Bike, Customer, Sale, Supplier, Inventory, InsufficientStockError, BikeTypeSalesRollup,
+    DailySalesRollup, MonthlySalesRollup, SalesPeriod, StockMovement, StockSnapshot, ImportCheckpoint,
+)
+from .checks import check_shared_cache
+from .importer import import_files
+from .orders import place_order
+from .pagination import KeysetPaginator
+from .pooling import ConnectionPool, PoolTimeout, configure_pool
+from .perf import explain_plan, load_budgets, measure, route_requests, write_baseline
+from .reorders import draft_orders, supplier_summary
+from .rollups import COUNTER_MODELS, ROLLUP_MODELS, rebuild_rollups, reconcile_counters
+from .stats import store_stats
+from .stock import drifted, restock, return_sale, stock_at, take_snapshots
+from .synthetic import generate_dataset
+from .timeseries import period_start, sales_series
+from .typeahead import typeahead
+from . import caching, events, metrics, nplusone, search as search_engine, views
+from . import urls
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def make_bike(**overrides):
+    data = {
+        'brand': 'Trek',
+        'model': 'Marlin 7',
+        'type': 'Mountain',
+        'price': Decimal('58000.00'),
+        'stock_quantity': 20,
+        'color': 'Orange',
+    }
+    data.update(overrides)
+    return Bike.objects.create(**data)
+
+
+def make_customer(**overrides):
+    data = {
+        'name': 'Rajesh Kumar',
+        'email': 'rajesh.kumar@email.com',
+        'phone': '9876543210',
+        'address': 'A-123, Sector 15, Noida, UP',
+    }
+    data.update(overrides)
+    return Customer.objects.create(**data)
+
+
+def make_supplier(**overrides):
+    data = {
+        'name': 'Hero Cycles',
+        'contact_person': 'Rajesh Kumar',
+        'email': 'contact@herocycles.com',
+        'phone': '011-12345678',
+        'address': 'Ludhiana, Punjab',
+    }
+    data.update(overrides)
+    return Supplier.objects.create(**data)
+
+
+def rollup_snapshot():
+    """Every rollup row and sales counter as comparable tuples, keyed by model name"""
+    snapshot = {}
+    for model in ROLLUP_MODELS:
+        key = [f.attname for f in model._meta.concrete_fields
+               if f.attname not in ('id', 'sale_count', 'units_sold', 'revenue', 'updated_at')][0]
+        snapshot[model.__name__] = sorted(
+            model.objects.filter(sale_count__gt=0).values_list(key, 'sale_count', 'units_sold', 'revenue')
+        )
+    for model in COUNTER_MODELS:
+        snapshot[model.__name__] = sorted(model.objects.values_list('pk', *model.counter_fields))
+    return snapshot
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.mountain = make_bike()
+        self.road = make_bike(model='Domane AL 2', type='Road', price=Decimal('45000.00'), color='Blue')
+        self.customer = make_customer()
+        self.other_customer = make_customer(name='Priya Sharma', email='priya.sharma@email.com')
+
+    def sell(self, bike, customer, quantity=1, price=None):
+        return Sale.objects.create(
+            customer=customer, bike=bike, quantity=quantity, sale_price=price or bike.price
+        )
+
+    def test_sale_updates_every_rollup(self):
+        self.sell(self.mountain, self.customer, quantity=2)
+        self.sell(self.road, self.customer)
+
+        type_rollup = BikeTypeSalesRollup.objects.get(bike_type='Mountain')
+        self.assertEqual(type_rollup.sale_count, 1)
+        self.assertEqual(type_rollup.units_sold, 2)
+        self.assertEqual(type_rollup.revenue, Decimal('116000.00'))
+
+        second = Sale.objects.latest('pk')
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.purchase_count, 2)
+        self.assertEqual(self.customer.lifetime_spend, Decimal('161000.00'))
+        self.assertEqual(self.customer.last_purchase_at, second.sale_date)
+        self.road.refresh_from_db()
+        self.assertEqual((self.road.units_sold, self.road.revenue), (1, Decimal('45000.00')))
+        self.assertEqual(DailySalesRollup.objects.get().sale_count, 2)
+        self.assertEqual(MonthlySalesRollup.objects.get().revenue, Decimal('161000.00'))
+
+    def test_edit_and_delete_reverse_previous_contribution(self):
+        sale = self.sell(self.mountain, self.customer)
+        sale.customer = self.other_customer
+        sale.quantity = 3
+        sale.save()
+
+        self.customer.refresh_from_db()
+        self.other_customer.refresh_from_db()
+        self.assertEqual((self.customer.purchase_count, self.customer.last_purchase_at), (0, None))
+        self.assertEqual(self.other_customer.purchase_count, 1)
+        self.assertEqual(self.other_customer.lifetime_spend, Decimal('174000.00'))
+        self.mountain.refresh_from_db()
+        self.assertEqual(self.mountain.units_sold, 3)
+
+        sale.delete()
+        self.assertEqual(BikeTypeSalesRollup.objects.get(bike_type='Mountain').sale_count, 0)
+        self.assertEqual(MonthlySalesRollup.objects.get().revenue, Decimal('0.00'))
+
+    def test_bike_type_change_moves_type_totals(self):
+        self.sell(self.mountain, self.customer, quantity=2)
+        self.mountain.type = 'Hybrid'
+        with CaptureQueriesContext(connection) as captured:
+            self.mountain.save()
+        # The previous type and stock come from the one locked read in Bike.save
+        reads = [query['sql'] for query in captured.captured_queries
+                 if query['sql'].startswith('SELECT') and 'FROM "store_bike"' in query['sql']]
+        self.assertEqual(len(reads), 1, reads)
+
+        self.assertEqual(BikeTypeSalesRollup.objects.get(bike_type='Mountain').units_sold, 0)
+        self.assertEqual(BikeTypeSalesRollup.objects.get(bike_type='Hybrid').units_sold, 2)
+
+    def test_deleting_bike_cascades_cleanly(self):
+        self.sell(self.mountain, self.customer)
+        self.mountain.delete()
+
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.purchase_count, self.customer.lifetime_spend), (0, Decimal('0.00')))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.sell(self.mountain, self.customer, quantity=2)
+        self.sell(self.road, self.other_customer, price=Decimal('40000.00'))
+        self.sell(self.mountain, self.other_customer)
+        incremental = rollup_snapshot()
+
+        rebuild_rollups()
+        self.assertEqual(rollup_snapshot(), incremental)
+
+    def test_saving_a_stale_instance_keeps_counters(self):
+        stale = Customer.objects.get(pk=self.customer.pk)
+        self.sell(self.mountain, self.customer)
+        stale.phone = '9123456780'
+        stale.save()
+
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.phone, self.customer.purchase_count), ('9123456780', 1))
+
+    def test_reconcile_counters_reports_and_repairs_drift(self):
+        self.sell(self.mountain, self.customer, quantity=2)
+        self.sell(self.road, self.other_customer)
+        expected = rollup_snapshot()
+        Bike.objects.filter(pk=self.mountain.pk).update(units_sold=7)
+        Customer.objects.filter(pk=self.other_customer.pk).update(last_purchase_at=None, lifetime_spend=0)
+
+        drifted = []
+        self.assertEqual(reconcile_counters(Customer, report=lambda *args: drifted.append(args)), (2, 1))
+        self.assertEqual([args[:2] for args in drifted], [(self.other_customer.pk, 'lifetime_spend'),
+                                                         (self.other_customer.pk, 'last_purchase_at')])
+        self.assertNotEqual(rollup_snapshot(), expected)
+
+        out = io.StringIO()
+        call_command('reconcile_counters', '--fix', stdout=out)
+        self.assertIn('Repaired the counters of 2 rows', out.getvalue())
+        self.assertEqual(rollup_snapshot(), expected)
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('All sales counters match the sales', out.getvalue())
+
+    def test_views_read_from_rollups(self):
+        self.sell(self.mountain, self.customer, quantity=2)
+
+        response = self.client.get(reverse('store:api_dashboard'))
+        self.assertEqual(response.json()['total_sales'], 1)
+        self.assertEqual(response.json()['total_revenue'], 116000.0)
+
+        response = self.client.get(reverse('store:api_sales_by_bike_type'))
+        self.assertEqual(response.json(), {'Mountain': 1})
+
+        response = self.client.get(reverse('store:reports'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_bikes_sold'], 2)
+        self.assertEqual(list(response.context['top_customers']), [self.customer])
+
+
+class SaleStockTests(TestCase):
+    def setUp(self):
+        self.bike = make_bike(stock_quantity=3)
+        self.customer = make_customer()
+
+    def test_sale_decrements_stock(self):
+        sale = Sale.objects.create(customer=self.customer, bike=self.bike, quantity=2, sale_price=Decimal('1.00'))
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.stock_quantity, 1)
+        self.assertEqual(sale.bike.stock_quantity, 1)
+
+    def test_insufficient_stock_leaves_no_trace(self):
+        with self.assertRaises(InsufficientStockError) as raised:
+            Sale.objects.create(customer=self.customer, bike=self.bike, quantity=4, sale_price=Decimal('1.00'))
+        self.assertEqual(raised.exception.available, 3)
+        self.assertEqual(str(raised.exception), 'Insufficient stock. Available: 3')
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.stock_quantity, 3)
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(self.bike.units_sold, 0)
+
+    def test_sale_does_not_overwrite_concurrent_price_edit(self):
+        stale = Bike.objects.get(pk=self.bike.pk)
+        Bike.objects.filter(pk=self.bike.pk).update(price=Decimal('99.00'))
+        Sale.objects.create(customer=self.customer, bike=stale, quantity=1, sale_price=Decimal('1.00'))
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.price, Decimal('99.00'))
+        self.assertEqual(self.bike.stock_quantity, 2)
+
+
+class ConcurrentSaleTests(TransactionTestCase):
+    """Many threads racing to buy the same bike must never oversell"""
+    workers = 8
+    attempts_per_worker = 5
+    initial_stock = 12
+
+    def test_parallel_checkouts_never_oversell(self):
+        bike = make_bike(stock_quantity=self.initial_stock)
+        customer = make_customer()
+        barrier = threading.Barrier(self.workers)
+        outcomes = []
+        lock = threading.Lock()
+
+        def checkout():
+            barrier.wait()
+            try:
+                for _ in range(self.attempts_per_worker):
+                    try:
+                        Sale.objects.create(customer_id=customer.pk, bike_id=bike.pk, quantity=1,
+                                            sale_price=Decimal('1.00'))
+                        result = 'sold'
+                    except InsufficientStockError:
+                        result = 'rejected'
+                    with lock:
+                        outcomes.append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        bike.refresh_from_db()
+        self.assertEqual(len(outcomes), self.workers * self.attempts_per_worker)
+        self.assertEqual(outcomes.count('sold'), self.initial_stock)
+        self.assertEqual(bike.stock_quantity, 0)
+        self.assertEqual(Sale.objects.filter(bike=bike).count(), self.initial_stock)
+        self.assertEqual(bike.units_sold, self.initial_stock)
+
+
+class OrderTests(TestCase):
+    def setUp(self):
+        self.mountain = make_bike(stock_quantity=5)
+        self.road = make_bike(model='Domane AL 2', type='Road', price=Decimal('45000.00'),
+                              color='Blue', stock_quantity=2)
+        self.customer = make_customer()
+
+    def test_order_writes_sales_stock_and_rollups(self):
+        lines = [
+            {'customer': self.customer.pk, 'bike': self.mountain.pk, 'quantity': 2},
+            {'customer': self.customer.pk, 'bike': self.road.pk, 'quantity': 1, 'sale_price': '40000.00'},
+            {'customer': self.customer.pk, 'bike': self.mountain.pk, 'quantity': 3},
+        ]
+        results = place_order(lines)
+
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(Sale.objects.count(), 3)
+        self.mountain.refresh_from_db()
+        self.road.refresh_from_db()
+        self.assertEqual((self.mountain.stock_quantity, self.road.stock_quantity), (0, 1))
+        self.assertEqual(Sale.objects.get(pk=results[1]['sale_id']).sale_price, Decimal('40000.00'))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.lifetime_spend, Decimal('330000.00'))
+        self.assertEqual(self.customer.purchase_count, 3)
+        incremental = rollup_snapshot()
+        rebuild_rollups()
+        self.assertEqual(rollup_snapshot(), incremental)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self.mountain.stock_quantity = 1000
+        self.mountain.save()
+        line = {'customer': self.customer.pk, 'bike': self.mountain.pk, 'quantity': 1}
+        place_order([line])
+
+        # lock bikes, check customers, insert, stock update, stock movements,
+        # five rollup updates, plus the savepoints around them
+        with self.assertNumQueries(14):
+            place_order([line] * 10)
+        with self.assertNumQueries(14):
+            place_order([line] * 150)
+
+    def test_one_bad_line_rejects_whole_order(self):
+        results = place_order([
+            {'customer': self.customer.pk, 'bike': self.road.pk, 'quantity': 2},
+            {'customer': self.customer.pk, 'bike': self.road.pk, 'quantity': 1},
+            {'customer': 999, 'bike': self.mountain.pk, 'quantity': 0},
+        ])
+
+        self.assertFalse(any(result['success'] for result in results))
+        self.assertIn('Insufficient stock', results[1]['errors']['quantity'][0])
+        self.assertEqual(set(results[2]['errors']), {'quantity'})
+        self.assertFalse(Sale.objects.exists())
+        self.road.refresh_from_db()
+        self.assertEqual(self.road.stock_quantity, 2)
+
+    def test_partial_order_keeps_valid_lines(self):
+        results = place_order([
+            {'customer': self.customer.pk, 'bike': self.road.pk, 'quantity': 2},
+            {'customer': 999, 'bike': self.mountain.pk, 'quantity': 1},
+        ], allow_partial=True)
+
+        self.assertEqual([result['success'] for result in results], [True, False])
+        self.assertEqual(results[1]['errors'], {'customer': ['Unknown customer.']})
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_order_api(self):
+        response = self.client.post(
+            reverse('store:api_create_order'),
+            data=json.dumps({'lines': [{'customer': self.customer.pk, 'bike': self.road.pk, 'quantity': 1}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+
+        response = self.client.post(reverse('store:api_create_order'), data='[]',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryBudgetMixin:
+    """Assert that a page costs a fixed number of queries, whatever its size"""
+
+    def count_queries(self, url):
+        # Measure the cold path, including any cached row counts
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def assertQueryBudget(self, url, budget, grow):
+        """Check url stays within budget before and after grow() adds rows"""
+        small = self.count_queries(url)
+        grow()
+        large = self.count_queries(url)
+        self.assertEqual(small, large, f'{url} query count grew from {small} to {large} with page size')
+        self.assertLessEqual(large, budget, f'{url} issued {large} queries (budget {budget})')
+
+
+class ListPageQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.bike = make_bike(stock_quantity=1000)
+        self.add_rows(0, 2)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@bikestore.com', None))
+
+    def add_rows(self, start, stop):
+        for i in range(start, stop):
+            customer = make_customer(name=f'Customer {i}', email=f'customer{i}@email.com')
+            Sale.objects.create(customer=customer, bike=self.bike, quantity=1, sale_price=Decimal('10.00'))
+            supplier = make_supplier(name=f'Supplier {i}')
+            make_bike(model=f'Model {i}', supplier=supplier)
+
+    def grow(self):
+        self.add_rows(2, 20)
+
+    def test_customer_list(self):
+        self.assertQueryBudget(reverse('store:customer_list'), 3, self.grow)
+
+    def test_supplier_list(self):
+        self.assertQueryBudget(reverse('store:supplier_list'), 3, self.grow)
+
+    def test_customer_admin_changelist(self):
+        self.assertQueryBudget(reverse('admin:store_customer_changelist'), 6, self.grow)
+
+    def test_supplier_admin_changelist(self):
+        self.assertQueryBudget(reverse('admin:store_supplier_changelist'), 6, self.grow)
+
+    def test_purchase_figures_are_stored(self):
+        customer = Customer.objects.get(email='customer0@email.com')
+        with self.assertNumQueries(0):
+            self.assertEqual(customer.purchase_count, 1)
+            self.assertEqual(customer.total_purchases, Decimal('10.00'))
+
+
+class RoutePerformanceTests(TestCase):
+    """Every store route stays within its budget in perf_budgets.json.
+
+    PERF_SCALE multiplies the seeded dataset, PERF_TIME_FACTOR loosens the
+    wall-time budgets on slow machines and PERF_BASELINE_PATH writes the
+    measurements out as JSON.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.scale = int(os.environ.get('PERF_SCALE', 1))
+        generate_dataset(suppliers=10 * cls.scale, bikes=200 * cls.scale,
+                         customers=300 * cls.scale, sales=3000 * cls.scale, seed=1)
+
+    def setUp(self):
+        cache.clear()
+        self.routes = route_requests(
+            Bike.objects.order_by('pk').first(),
+            Customer.objects.order_by('pk').first(),
+            Supplier.objects.order_by('pk').first(),
+            Sale.objects.order_by('pk').first(),
+        )
+
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(set(self.routes), names)
+        self.assertEqual(set(load_budgets()), names)
+
+    def test_routes_within_budget(self):
+        budgets = load_budgets()
+        time_factor = float(os.environ.get('PERF_TIME_FACTOR', 1))
+        results = {}
+        for name, (method, url, body) in self.routes.items():
+            with self.subTest(route=name):
+                result = results[name] = measure(self.client, method, url, body)
+                self.assertLess(result['status'], 400)
+                self.assertLessEqual(result['queries'], budgets[name]['queries'],
+                                     f'{name} issued {result["queries"]} queries')
+                self.assertLessEqual(result['ms'], budgets[name]['ms'] * time_factor,
+                                     f'{name} took {result["ms"]}ms')
+
+        baseline_path = os.environ.get('PERF_BASELINE_PATH')
+        if baseline_path:
+            write_baseline(baseline_path, results, scale=self.scale)
+
+    def test_broad_search_within_the_list_budget(self):
+        # Every synthetic customer matches, so ranking must not fetch them all
+        budget = load_budgets()['customer_list']
+        url = f"{reverse('store:customer_list')}?search=cus"
+        with CaptureQueriesContext(connection) as captured:
+            result = measure(self.client, 'get', url)
+        self.assertEqual(result['status'], 200)
+        self.assertLessEqual(result['queries'], budget['queries'])
+        self.assertLessEqual(result['ms'], budget['ms'] * float(os.environ.get('PERF_TIME_FACTOR', 1)))
+        pages = [query['sql'] for query in captured.captured_queries if 'COUNT(' not in query['sql']]
+        self.assertTrue(pages)
+        self.assertTrue(all('LIMIT 21' in sql for sql in pages), pages)
+
+
+class SyntheticDataTests(TestCase):
+    def snapshot(self):
+        return list(Sale.objects.order_by('pk').values_list(
+            'bike__model', 'customer__email', 'quantity', 'sale_price', 'sale_date'
+        ))
+
+    def test_same_seed_reproduces_the_dataset(self):
+        stats = generate_dataset(suppliers=2, bikes=20, customers=30, sales=250, days=60,
+                                 seed=5, chunk_size=100)
+        self.assertEqual(stats['Sale'].rows, 250)
+        self.assertEqual(DailySalesRollup.objects.aggregate(n=Sum('sale_count'))['n'], 250)
+        first = self.snapshot()
+
+        Sale.objects.all().delete()
+        Bike.objects.all().delete()
+        Customer.objects.all().delete()
+        Supplier.objects.all().delete()
+        generate_dataset(suppliers=2, bikes=20, customers=30, sales=250, days=60,
+                         seed=5, chunk_size=100)
+        self.assertEqual(self.snapshot(), first)
+
+        today = timezone.localdate()
+        self.assertTrue(all(
+            today - timedelta(days=60) <= sold_at.date() < today for *_, sold_at in first
+        ))
+
+
+    def test_sales_keep_a_given_date(self):
+        # Inserted history needs no change to the field, which other threads share
+        sold_at = timezone.now() - timedelta(days=400)
+        sale = Sale.objects.create(customer=make_customer(), bike=make_bike(), quantity=1, sale_date=sold_at)
+        sale.refresh_from_db()
+        self.assertEqual(sale.sale_date, sold_at)
+        self.assertFalse(Sale._meta.get_field('sale_date').auto_now_add)
+
+
+class QueryPlanTests(TestCase):
+    def plan(self, queryset):
+        return '\n'.join(explain_plan(*queryset.query.sql_with_params()))
+
+    def test_sale_access_paths_use_indexes(self):
+        customer = make_customer()
+        bike = make_bike()
+        if connection.vendor != 'sqlite':
+            self.skipTest('index names are asserted against the SQLite planner')
+        self.assertIn('store_sale_cust_date_idx', self.plan(customer.sales.order_by('-sale_date')))
+        self.assertIn('store_sale_bike_date_idx', self.plan(bike.sales.order_by('-sale_date')))
+        self.assertIn('store_sale_date_id_idx', self.plan(Sale.objects.order_by('-sale_date', '-pk')[:20]))
+        self.assertIn('store_bike_low_stock_idx', self.plan(Bike.objects.filter(stock_quantity__lt=5).order_by()))
+        self.assertIn('store_bike_type_price_idx',
+                      self.plan(Bike.objects.filter(type='Road', price__gte=1000).order_by()))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.marlin = make_bike()
+        self.domane = make_bike(model='Domane AL 2', type='Road', price=Decimal('72000.00'))
+        self.talon = make_bike(brand='Giant', model='Talon 3', stock_quantity=0)
+
+    def found(self, text, queryset=None):
+        return [bike.pk for bike in search_engine.search(queryset or Bike.objects.all(), text)]
+
+    def test_words_match_as_prefixes_and_all_must_match(self):
+        self.assertCountEqual(self.found('tre'), [self.marlin.pk, self.domane.pk])
+        self.assertEqual(self.found('trek dom'), [self.domane.pk])
+        self.assertEqual(self.found('giant road'), [])
+
+    def test_search_respects_other_filters(self):
+        self.assertEqual(self.found('mountain', Bike.objects.filter(stock_quantity__gt=0)), [self.marlin.pk])
+
+    def test_index_follows_saves_deletes_and_bulk_inserts(self):
+        self.talon.brand = 'Scott'
+        self.talon.save()
+        self.assertEqual(self.found('giant'), [])
+        self.assertEqual(self.found('scott'), [self.talon.pk])
+        self.talon.delete()
+        self.assertEqual(self.found('scott'), [])
+        Bike.objects.bulk_create([Bike(brand='Btwin', model='Rockrider', price=Decimal('20000.00'))])
+        self.assertEqual(len(self.found('rockrider')), 1)
+
+    def test_results_carry_a_rank_best_first(self):
+        make_bike(brand='Road Works', model='Road Master', type='Road', color='Red')
+        results = search_engine.search(Bike.objects.all(), 'road')
+        ranks = [bike.search_rank for bike in results]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertEqual(results[0].brand, 'Road Works')
+
+    @override_settings(STORE_SEARCH_BACKEND='store.search.SearchBackend')
+    def test_icontains_fallback_backend(self):
+        self.assertCountEqual(self.found('tre'), [self.marlin.pk, self.domane.pk])
+        self.assertEqual(self.found('trek dom'), [self.domane.pk])
+
+    def test_list_views_search(self):
+        make_customer()
+        make_customer(name='Priya Sharma', email='priya@email.com', phone='9123456780')
+        response = self.client.get(reverse('store:customer_list'), {'search': 'priya'})
+        self.assertEqual([c.name for c in response.context['customers']], ['Priya Sharma'])
+        response = self.client.get(reverse('store:bike_list'), {'search': 'talon', 'type': 'Mountain'})
+        self.assertEqual([b.pk for b in response.context['bikes']], [self.talon.pk])
+
+    def test_ranked_results_page_by_cursor(self):
+        for i in range(25):
+            make_customer(name=f'Walker {i}' if i % 5 else f'Walker Walker {i}', email=f'walker{i}@email.com')
+        url = reverse('store:customer_list')
+        response = self.client.get(url, {'search': 'walker'})
+        first = list(response.context['customers'])
+        self.assertEqual(len(first), 20)
+        self.assertTrue(all(c.name.startswith('Walker Walker') for c in first[:5]))
+        response = self.client.get(url, {'search': 'walker', 'cursor': response.context['page_obj'].next_cursor})
+        rest = list(response.context['customers'])
+        self.assertEqual(len({c.pk for c in first + rest}), 25)
+        self.assertEqual(response.context['total_customers'], 25)
+
+
+class SearchAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.marlin = make_bike()
+        self.domane = make_bike(model='Domane AL 2', type='Road', price=Decimal('72000.00'))
+        self.customer = make_customer()
+        self.sale = Sale.objects.create(customer=self.customer, bike=self.domane, quantity=1)
+        make_supplier()
+
+    def post(self, search_type, body):
+        return self.client.post(reverse('store:api_search', args=[search_type]),
+                                data=json.dumps(body), content_type='application/json')
+
+    def test_results_in_the_shape_search_js_expects(self):
+        response = self.post('bikes', {'query': 'trek', 'filters': {}, 'sort': {'field': 'price', 'order': 'desc'}})
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual([item['id'] for item in data['results']], [self.domane.pk, self.marlin.pk])
+        self.assertEqual(set(data['results'][0]), {'type', 'id', 'title', 'description', 'metadata', 'viewUrl', 'editUrl'})
+        self.assertEqual(data['suggestions'], ['Trek Domane AL 2', 'Trek Marlin 7'])
+
+    def test_filters_limit_and_has_more(self):
+        data = self.post('bikes', {'query': 'trek', 'filters': {'type': 'Road'}}).json()
+        self.assertEqual([item['id'] for item in data['results']], [self.domane.pk])
+        data = self.post('bikes', {'query': 'trek', 'limit': 1}).json()
+        self.assertEqual(data['count'], 1)
+        self.assertTrue(data['has_more'])
+        response = self.post('bikes', {'query': 'trek', 'filters': {'type': 'Unicycle'}})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+    def test_every_search_type(self):
+        self.assertEqual(self.post('customers', {'query': 'rajesh'}).json()['results'][0]['id'], self.customer.pk)
+        self.assertEqual(self.post('suppliers', {'query': 'hero'}).json()['count'], 1)
+        self.assertEqual(self.post('sales', {'query': 'domane'}).json()['results'][0]['id'], self.sale.pk)
+        self.assertEqual(self.post('sales', {'query': f'#{self.sale.pk}'}).json()['count'], 1)
+        types = {item['type'] for item in self.post('general', {'query': 'rajesh'}).json()['results']}
+        self.assertEqual(types, {'customer', 'supplier'})
+        self.assertEqual(self.post('widgets', {'query': 'x'}).status_code, 404)
+
+    def test_entered_text_is_escaped(self):
+        name = '<img src=x onerror=alert(1)> Sharma'
+        customer = make_customer(name=name, email='sharma@email.com')
+        Sale.objects.create(customer=customer, bike=self.marlin, quantity=1)
+        make_supplier(name=name, email='sales@sharma.com')
+        for search_type in ('customers', 'suppliers', 'sales'):
+            result = self.post(search_type, {'query': 'sharma'}).json()['results'][0]
+            self.assertNotIn('<img', result['title'])
+            self.assertIn('&lt;img src=x onerror=alert(1)&gt; Sharma', result['title'])
+
+    def test_every_sort_is_limited_in_sql(self):
+        for field in ('relevance', 'name'):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                typeahead('customers', 'rajesh', sort={'field': field}, limit=5)
+            self.assertEqual(len(captured), 1)
+            self.assertIn('LIMIT 6', captured[0]['sql'])
+
+    def test_repeated_queries_are_served_from_cache(self):
+        self.post('bikes', {'query': 'Trek  '})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post('bikes', {'query': 'trek'}).json()['count'], 2)
+        make_bike(model='Madone SL 6')
+        self.assertEqual(self.post('bikes', {'query': 'trek'}).json()['count'], 3)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        bike = make_bike(stock_quantity=1000)
+        customer = make_customer()
+        for _ in range(45):
+            Sale.objects.create(customer=customer, bike=bike, quantity=1)
+        # Equal sale dates exercise the primary key tie-break
+        Sale.objects.filter(pk__lte=Sale.objects.order_by('pk')[10].pk).update(sale_date=timezone.now())
+        self.paginator = KeysetPaginator(Sale.objects.order_by('-sale_date', '-pk'), 20)
+        self.expected = list(Sale.objects.order_by('-sale_date', '-pk').values_list('pk', flat=True))
+
+    def test_walks_forward_and_back_through_every_row(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual([sale.pk for page in pages for sale in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = self.paginator.page(pages[2].previous_cursor)
+        self.assertEqual([sale.pk for sale in back], self.expected[20:40])
+        first = self.paginator.page(back.previous_cursor)
+        self.assertEqual([sale.pk for sale in first], self.expected[:20])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        page = self.paginator.page(self.paginator.page().next_cursor + 'x')
+        self.assertEqual([sale.pk for sale in page], self.expected[:20])
+
+    def test_orders_by_an_annotation(self):
+        # As the PostgreSQL search backend orders customers by search_rank
+        queryset = Sale.objects.annotate(units=F('quantity') * 1.0).order_by('-units', 'pk')
+        paginator = KeysetPaginator(queryset, 20)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([sale.pk for page in pages for sale in page], sorted(self.expected))
+        back = paginator.page(pages[1].previous_cursor)
+        self.assertEqual([sale.pk for sale in back], sorted(self.expected)[:20])
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        url = reverse('store:sale_list')
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url)
+        self.assertEqual(response.context['total_sales'], 45)
+        with CaptureQueriesContext(connection) as deeper:
+            response = self.client.get(url, {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(deeper), len(first))
+        self.assertEqual([sale.pk for sale in response.context['sales']], self.expected[20:40])
+        self.assertNotIn('COUNT(', ' '.join(query['sql'] for query in deeper.captured_queries))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bike = make_bike(stock_quantity=10)
+        self.other = make_bike(model='Domane AL 2', type='Road')
+        self.customer = make_customer()
+
+    def get(self, name, *args):
+        return self.client.get(reverse(f'store:{name}', args=args)).json()
+
+    def test_dashboard_polls_are_free_between_writes(self):
+        self.assertEqual(self.get('api_dashboard')['total_sales'], 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('api_dashboard')['total_bikes'], 2)
+
+        Sale.objects.create(customer=self.customer, bike=self.bike, quantity=2)
+        data = self.get('api_dashboard')
+        self.assertEqual(data['total_sales'], 1)
+        self.assertEqual(data['sales_by_type'][0]['count'], 1)
+        self.assertEqual(self.get('api_bike_inventory')['Mountain'], 8)
+
+    def test_writes_only_invalidate_dependent_entries(self):
+        self.get('api_sales_by_bike_type')
+        self.get('api_bike_price', self.bike.pk)
+        self.get('api_bike_price', self.other.pk)
+
+        make_customer(email='second@example.com')
+        self.bike.price = Decimal('51000.00')
+        self.bike.save()
+        with self.assertNumQueries(0):
+            self.get('api_sales_by_bike_type')
+            self.get('api_bike_price', self.other.pk)
+        self.assertEqual(self.get('api_bike_price', self.bike.pk)['price'], 51000.0)
+
+    def test_bulk_orders_invalidate_the_bikes_they_sell(self):
+        self.assertEqual(self.get('api_bike_price', self.bike.pk)['stock'], 10)
+        place_order([{'customer': self.customer.pk, 'bike': self.bike.pk, 'quantity': 3}])
+        self.assertEqual(self.get('api_bike_price', self.bike.pk)['stock'], 7)
+        self.assertEqual(self.get('api_dashboard')['total_sales'], 1)
+
+    @override_settings(STORE_CACHE_TTLS={'bike_inventory': 0})
+    def test_ttl_per_endpoint(self):
+        self.get('api_bike_inventory')
+        with self.assertNumQueries(1):
+            self.get('api_bike_inventory')
+
+    def test_counts_follow_the_tables_they_join(self):
+        self.assertEqual(caching.table_topics(Sale.objects.filter(bike__type='Road')), ['bike', 'sale'])
+
+    def test_deploy_check_warns_about_a_per_process_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['store.W001'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': 'unused',
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bike = make_bike(stock_quantity=3)
+        Sale.objects.create(customer=make_customer(), bike=self.bike, quantity=1)
+
+    def test_views_answer_the_asgi_client(self):
+        async def fetch():
+            client = AsyncClient()
+            return [
+                await client.get(reverse('store:dashboard')),
+                await client.get(reverse('store:api_dashboard')),
+                await client.get(reverse('store:api_bike_price', args=[self.bike.pk])),
+                await client.get(reverse('store:api_bike_price', args=[0])),
+            ]
+
+        dashboard, data, price, missing = async_to_sync(fetch)()
+        self.assertEqual(dashboard.context['total_sales'], 1)
+        self.assertEqual([bike.pk for bike in dashboard.context['low_stock_bikes']], [self.bike.pk])
+        self.assertEqual(data.json()['low_stock_count'], 1)
+        self.assertEqual(price.json()['stock'], 2)
+        self.assertFalse(missing.json()['success'])
+
+
+class APIBenchmarkTests(TransactionTestCase):
+    def test_benchmark_reports_both_handlers(self):
+        make_bike()
+        out = io.StringIO()
+        call_command('benchmark_api', 'api_dashboard', 'api_bike_price', requests=20, concurrency=4, stdout=out)
+        self.assertRegex(out.getvalue(), r'WSGI \(threads\)\s+\d+\s+[\d.]+\s+[\d.]+\s+0\n')
+        self.assertRegex(out.getvalue(), r'ASGI \(event loop\)\s+\d+\s+[\d.]+\s+[\d.]+\s+0\n')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bike = make_bike(stock_quantity=10)
+        self.customer = make_customer()
+
+    def test_unchanged_data_gets_304_without_queries(self):
+        for name, args in [
+            ('api_dashboard', []),
+            ('api_sales_by_bike_type', []),
+            ('api_bike_inventory', []),
+            ('api_bike_price', [self.bike.pk]),
+        ]:
+            url = reverse(f'store:{name}', args=args)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, name)
+
+    def test_writes_change_the_etag(self):
+        url = reverse('store:api_dashboard')
+        etag = self.client.get(url)['ETag']
+        Sale.objects.create(customer=self.customer, bike=self.bike, quantity=1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total_sales'], 1)
+
+
+class LiveEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bike = make_bike(stock_quantity=6)
+        self.customer = make_customer()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.subscription, _ = events.broker.subscribe(loop=self.loop)
+        self.addCleanup(events.broker.unsubscribe, self.subscription)
+
+    def received(self):
+        # Let the loop run the deliveries handed over by publish()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        queue = self.subscription.queue
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    def test_one_event_object_is_shared_by_every_subscriber(self):
+        others = [events.broker.subscribe(loop=self.loop)[0] for _ in range(3)]
+        for other in others:
+            self.addCleanup(events.broker.unsubscribe, other)
+        event = events.broker.publish('stock', {'bikes': []})
+        self.assertEqual(self.received(), [event])
+        for other in others:
+            self.assertIs(other.queue.get_nowait(), event)
+
+    def test_sale_publishes_totals_stock_and_low_stock_alert_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(customer=self.customer, bike=self.bike, quantity=2)
+            self.assertEqual(self.received(), [])
+        sale, stock, low_stock = self.received()
+        self.assertEqual((sale.type, stock.type, low_stock.type), ('sale', 'stock', 'low_stock'))
+        self.assertEqual(sale.data['total_sales'], 1)
+        self.assertEqual(stock.data['bikes'][0]['stock'], 4)
+        self.assertEqual(low_stock.data['low_stock_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order([{'customer': self.customer.pk, 'bike': self.bike.pk, 'quantity': 1}])
+        # Already low, so no second alert
+        self.assertEqual([event.type for event in self.received()], ['sale', 'stock'])
+
+    def test_stock_edits_publish_only_when_stock_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bike.price = Decimal('49000.00')
+            self.bike.save()
+        self.assertEqual(self.received(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bike.stock_quantity = 20
+            self.bike.save()
+        self.assertEqual([event.type for event in self.received()], ['stock'])
+
+    def test_reconnecting_clients_replay_from_history(self):
+        first = events.broker.publish('stock', {'bikes': []})
+        second = events.broker.publish('stock', {'bikes': []})
+        _, missed = events.broker.subscribe(first.id, loop=self.loop)
+        self.assertEqual(missed, [second])
+        events.broker.skip()
+        _, missed = events.broker.subscribe(second.id, loop=self.loop)
+        self.assertIsNone(missed)
+
+    def test_stream_sends_snapshot_then_events(self):
+        events.broker.unsubscribe(self.subscription)
+
+        async def read():
+            response = await AsyncClient().get(reverse('store:api_events'))
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = aiter(response.streaming_content)
+            self.assertEqual(await anext(chunks), b'retry: 5000\n\n')
+            snapshot = await anext(chunks)
+            event = events.broker.publish('stock', {'bikes': []})
+            self.assertEqual(await anext(chunks), event.encoded)
+            await chunks.aclose()
+            return snapshot
+
+        snapshot = async_to_sync(read)()
+        self.assertIn(b'event: snapshot', snapshot)
+        self.assertIn(b'"total_bikes":1', snapshot)
+        self.assertFalse(events.broker.has_subscribers())
+
+    def poll(self, last_event_id=None):
+        headers = {} if last_event_id is None else {'Last-Event-ID': last_event_id}
+        return self.client.get(reverse('store:api_events'), headers=headers).content
+
+    def test_wsgi_requests_get_what_is_new_and_reconnect(self):
+        events.broker.unsubscribe(self.subscription)
+        response = self.client.get(reverse('store:api_events'))
+        self.assertNotIsInstance(response, StreamingHttpResponse)
+        self.assertTrue(response.content.startswith(b'retry: 5000\n\n'))
+        self.assertIn(b'event: snapshot', response.content)
+        version = re.search(rb'^id: (.+)$', response.content, re.MULTILINE).group(1).decode()
+        self.assertEqual(self.poll(version), b'retry: 5000\n\n')
+        self.assertFalse(events.broker.has_subscribers())
+
+    def test_wsgi_polls_do_not_depend_on_the_worker(self):
+        events.broker.unsubscribe(self.subscription)
+        self.addCleanup(setattr, events, 'broker', events.broker)
+        # Each worker counts its own event IDs, so another's can match this one's
+        events.broker = events.Broker()
+        events.broker.publish('stock', {'bikes': []})
+        content = self.poll(str(events.broker.last_id))
+        self.assertIn(b'event: snapshot', content)
+        version = re.search(rb'^id: (.+)$', content, re.MULTILINE).group(1).decode()
+
+        # A sale made in another worker
+        events.broker = events.Broker()
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(customer=self.customer, bike=self.bike, quantity=1)
+        events.broker = events.Broker()
+        self.assertIn(b'"total_sales":1', self.poll(version))
+
+
+class StoreStatsTests(TestCase):
+    def test_every_figure_in_one_query(self):
+        mountain = make_bike(stock_quantity=3)
+        road = make_bike(model='Domane AL 2', type='Road', price=Decimal('72000.00'), stock_quantity=8)
+        customer = make_customer()
+        make_customer(email='second@example.com')
+        Sale.objects.create(customer=customer, bike=mountain, quantity=2)
+        Sale.objects.create(customer=customer, bike=road, quantity=1)
+        Sale.objects.create(customer=customer, bike=road, quantity=1)
+
+        with self.assertNumQueries(1):
+            stats = store_stats()
+        self.assertEqual(stats['total_bikes'], 2)
+        self.assertEqual(stats['total_stock'], 7)
+        self.assertEqual(stats['low_stock_count'], 1)
+        self.assertEqual(stats['total_customers'], 2)
+        self.assertEqual(stats['total_sales'], Sale.objects.count())
+        self.assertEqual(stats['total_units'], 4)
+        self.assertEqual(stats['total_revenue'], sum(sale.total_amount for sale in Sale.objects.all()))
+        self.assertEqual(
+            [(row['type'], row['sale_count'], row['units_sold']) for row in stats['sales_by_type']],
+            [('Mountain', 1, 2), ('Road', 2, 2)],
+        )
+
+    def test_empty_store(self):
+        stats = store_stats()
+        self.assertEqual((stats['total_bikes'], stats['total_sales'], stats['sales_by_type']), (0, 0, []))
+        self.assertEqual(stats['total_revenue'], Decimal('0.00'))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.mountain = make_bike(stock_quantity=5)
+        self.road = make_bike(brand='Giant', model='TCR', type='Road', price=Decimal('90000.00'), stock_quantity=0)
+        self.customer = make_customer()
+        for quantity in (1, 2, 1):
+            Sale.objects.create(customer=self.customer, bike=self.mountain, quantity=quantity)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(f'store:{name}'), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_applies_the_list_filters(self):
+        response, content = self.export('bike_export', type='Road')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="bikes-', response['Content-Disposition'])
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], 'id,brand,model,type,color,price,stock_quantity,supplier,created_at')
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['Giant'])
+
+        _, content = self.export('bike_export', search='gia', in_stock_only='true')
+        self.assertEqual(len(content.decode().splitlines()), 1)
+        _, content = self.export('customer_export', search='rajesh')
+        self.assertIn('rajesh.kumar@email.com', content.decode())
+
+    def test_ndjson_has_one_object_per_sale_newest_first(self):
+        _, content = self.export('sale_export', format='ndjson')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['quantity'] for row in rows], [1, 2, 1])
+        self.assertEqual([row['id'] for row in rows], sorted((row['id'] for row in rows), reverse=True))
+        self.assertEqual(Decimal(rows[1]['total_amount']), 2 * self.mountain.price)
+        self.assertEqual(rows[0]['customer_email'], self.customer.email)
+
+    def test_xlsx_is_a_workbook_with_one_row_per_customer(self):
+        response, content = self.export('customer_export', format='xlsx')
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        workbook = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(workbook.testzip())
+        sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('s:sheetData/s:row', ns)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0].find('s:c/s:is/s:t', ns).text, 'id')
+        cells = rows[1].findall('s:c', ns)
+        self.assertEqual(cells[1].find('s:is/s:t', ns).text, self.customer.name)
+        self.assertEqual(cells[5].find('s:v', ns).text, '3')
+
+    def test_rows_are_written_a_chunk_at_a_time(self):
+        request = RequestFactory().get(reverse('store:sale_export'))
+        response = views.SaleExportView.as_view(chunk_size=2)(request)
+        parts = list(response.streaming_content)
+        # Header, two chunks of rows, footer
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(b''.join(parts).count(b'\n'), 4)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('store:sale_export'), {'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_asgi_streams_from_an_async_iterator(self):
+        async def fetch():
+            response = await AsyncClient().get(reverse('store:sale_export'), {'format': 'ndjson'})
+            self.assertTrue(response.is_async)
+            return b''.join([part async for part in response.streaming_content])
+
+        self.assertEqual(len(async_to_sync(fetch)().splitlines()), 3)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def catalogue(self):
+        return {
+            'suppliers': self.write('suppliers.csv', (
+                'name,contact_person,email,phone,address\n'
+                'Hero Cycles,Amit,sales@hero.example,9811111111,Ludhiana\n'
+            )),
+            'bikes': self.write('bikes.csv', (
+                'brand,model,color,type,price,stock_quantity,supplier\n'
+                'Trek,Marlin 7,Orange,Mountain,58000.00,20,Hero Cycles\n'
+                'Giant,TCR,Black,Road,90000.00,4,\n'
+            )),
+            'customers': self.write('customers.ndjson', (
+                '{"email": "rajesh.kumar@email.com", "name": "Rajesh Kumar", "phone": "9876543210", "address": "Noida"}\n'
+            )),
+        }
+
+    def test_upserts_on_natural_keys_and_inserts_sales_as_history(self):
+        import_files(self.catalogue())
+        sales = self.write('sales.csv', (
+            'sale_date,customer_email,bike_brand,bike_model,bike_color,quantity,sale_price\n'
+            '2024-03-01 10:00:00,rajesh.kumar@email.com,Trek,Marlin 7,Orange,2,57000.00\n'
+            '2024-03-02T11:30:00+00:00,rajesh.kumar@email.com,Giant,TCR,,1,90000.00\n'
+        ))
+        import_files({
+            'bikes': self.write('prices.csv', 'brand,model,color,type,price,stock_quantity\nTrek,Marlin 7,Orange,Road,61000.00,15\n'),
+            'customers': self.write('moved.csv', 'email,name,phone,address\nrajesh.kumar@email.com,Rajesh Kumar,9876543210,Gurgaon\n'),
+            'sales': sales,
+        })
+
+        self.assertEqual((Supplier.objects.count(), Bike.objects.count(), Customer.objects.count()), (1, 2, 1))
+        trek = Bike.objects.get(brand='Trek')
+        self.assertEqual((trek.type, trek.price, trek.stock_quantity), ('Road', Decimal('61000.00'), 15))
+        self.assertIsNone(trek.supplier)
+        self.assertEqual(Customer.objects.get().address, 'Gurgaon')
+        # History keeps its dates and leaves stock alone
+        self.assertEqual(
+            [(sale.sale_date.date().isoformat(), sale.quantity) for sale in Sale.objects.order_by('sale_date')],
+            [('2024-03-01', 2), ('2024-03-02', 1)],
+        )
+        self.assertEqual(Bike.objects.get(brand='Giant').stock_quantity, 4)
+        # The stock changes the imports made are in the ledger
+        self.assertEqual(list(trek.stock_movements.values_list('kind', 'quantity')),
+                         [('adjustment', 20), ('adjustment', -5)])
+
+        incremental = {model: list(model.objects.values_list('sale_count', 'units_sold', 'revenue').order_by('pk'))
+                       for model in ROLLUP_MODELS}
+        rebuild_rollups()
+        self.assertEqual(
+            incremental,
+            {model: list(model.objects.values_list('sale_count', 'units_sold', 'revenue').order_by('pk'))
+             for model in ROLLUP_MODELS},
+        )
+
+    def test_rebuilt_rollups_follow_bike_type_changes(self):
+        import_files(self.catalogue())
+        import_files({'sales': self.write('sales.csv', (
+            'sale_date,customer_email,bike_brand,bike_model,bike_color,quantity,sale_price\n'
+            '2024-03-01 10:00:00,rajesh.kumar@email.com,Trek,Marlin 7,Orange,2,57000.00\n'
+        ))})
+        import_files({
+            'bikes': self.write('types.csv', 'brand,model,color,type,price,stock_quantity\nTrek,Marlin 7,Orange,Road,58000.00,20\n'),
+        }, rebuild_rollups=True)
+        self.assertEqual(
+            dict(BikeTypeSalesRollup.objects.filter(sale_count__gt=0).values_list('bike_type', 'units_sold')),
+            {'Road': 2},
+        )
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        files = self.catalogue()
+        files['sales'] = self.write('sales.ndjson', (
+            '{"sale_date": "2024-03-01", "customer_email": "rajesh.kumar@email.com", "bike_brand": "Trek", '
+            '"bike_model": "Marlin 7", "bike_color": "Orange", "quantity": 1, "sale_price": "58000.00"}\n'
+            '{"sale_date": "2024-03-01", "customer_email": "rajesh.kumar@email.com", "bike_brand": "Trek", '
+            '"bike_model": "Marlin 7", "bike_color": "Orange", "quantity": 0, "sale_price": "58000.00"}\n'
+            '{"sale_date": "2024-03-01", "customer_email": "nobody@example.com", "bike_brand": "Trek", '
+            '"bike_model": "Marlin 7", "bike_color": "Red", "quantity": 1, "sale_price": "58000.00"}\n'
+            'not json\n'
+        ))
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_store_data', *[f'--{table}={path}' for table, path in files.items()],
+                     checkpoint='test', stdout=out, stderr=err)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertIn('sales line 2: quantity: Ensure this value is greater than or equal to 1.', err.getvalue())
+        self.assertIn(
+            'sales line 3: customer_email: Unknown customer "nobody@example.com"; '
+            'bike: Unknown bike "Trek Marlin 7 (Red)"', err.getvalue()
+        )
+        self.assertIn('sales line 4: Not a JSON object', err.getvalue())
+        self.assertRegex(out.getvalue(), r'sales\s+4\s+3\s')
+
+    def test_resumes_after_the_last_committed_batch(self):
+        import_files(self.catalogue())
+        sales = self.write('sales.csv', 'sale_date,customer_email,bike_brand,bike_model,bike_color,quantity,sale_price\n' + ''.join(
+            f'2024-03-{day:02d} 10:00:00,rajesh.kumar@email.com,Trek,Marlin 7,Orange,1,58000.00\n' for day in range(1, 8)
+        ))
+
+        def fail(table, done, rate):
+            raise RuntimeError('connection lost')
+
+        with self.assertRaises(RuntimeError):
+            import_files({'sales': sales}, batch_size=3, checkpoint='sales', progress=fail)
+        self.assertEqual(Sale.objects.count(), 3)
+        # Committed with the batch, before anything after it could fail
+        self.assertEqual(ImportCheckpoint.objects.get(name='sales').done, {'sales': 3})
+
+        stats = import_files({'sales': sales}, batch_size=3, checkpoint='sales')
+        self.assertEqual(stats['sales'].rows, 4)
+        self.assertEqual(Sale.objects.count(), 7)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+
+class TimeSeriesTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.supplier = make_supplier()
+        self.mountain = make_bike(supplier=self.supplier)
+        self.road = make_bike(model='Domane AL 2', type='Road', price=Decimal('45000.00'), color='Blue')
+        self.customer = make_customer()
+        self.other_customer = make_customer(name='Priya Sharma', email='priya.sharma@email.com')
+
+    def sell(self, bike, customer, days_ago, quantity=1):
+        sale = Sale.objects.create(customer=customer, bike=bike, quantity=quantity, sale_price=bike.price)
+        if days_ago:
+            sale.sale_date -= timedelta(days=days_ago)
+            sale.save()
+        return sale
+
+    def revenue(self, start, end, granularity, **filters):
+        return {row['period']: row['revenue'] for row in sales_series(start, end, granularity, **filters)
+                if row['sale_count']}
+
+    def test_bucketed_series_matches_the_sales(self):
+        sales = [
+            self.sell(self.mountain, self.customer, 400, quantity=2),
+            self.sell(self.road, self.customer, 95),
+            self.sell(self.mountain, self.other_customer, 40),
+            self.sell(self.road, self.other_customer, 3),
+            self.sell(self.mountain, self.customer, 0),
+        ]
+        start = self.today - timedelta(days=500)
+        for granularity in ('day', 'week', 'month', 'quarter'):
+            for filters in ({}, {'bike_type': 'Road'}, {'supplier': self.supplier.pk},
+                            {'customer': self.other_customer.pk}):
+                with self.subTest(granularity=granularity, filters=filters):
+                    expected = {}
+                    for sale in sales:
+                        if (filters.get('bike_type', sale.bike.type) != sale.bike.type
+                                or filters.get('supplier', sale.bike.supplier_id) != sale.bike.supplier_id
+                                or filters.get('customer', sale.customer_id) != sale.customer_id):
+                            continue
+                        period = period_start(timezone.localdate(sale.sale_date), granularity)
+                        expected[period] = expected.get(period, 0) + sale.total_amount
+                    # Once computed, then from the stored buckets
+                    self.assertEqual(self.revenue(start, self.today, granularity, **filters), expected)
+                    self.assertEqual(self.revenue(start, self.today, granularity, **filters), expected)
+        self.assertTrue(SalesPeriod.objects.filter(granularity='quarter').exists())
+
+        # A range that cuts through periods counts only its own days
+        cut = self.today - timedelta(days=39)
+        series = sales_series(cut, self.today, 'quarter')
+        self.assertEqual(series[0]['period'], period_start(cut, 'quarter'))
+        self.assertEqual(sum(row['sale_count'] for row in series), 2)
+
+    def test_long_range_costs_no_more_than_a_short_one(self):
+        bike = make_bike(model='Marlin 5', stock_quantity=100)
+        for days_ago in range(30, 1800, 45):
+            self.sell(bike, self.customer, days_ago)
+        last_month = period_start(self.today, 'month') - timedelta(days=1)
+        week = (last_month - timedelta(days=6), last_month)
+        five_years = (period_start(last_month.replace(year=last_month.year - 5), 'month'), last_month)
+        sales_series(*week, 'day')
+        sales_series(*five_years, 'month')
+
+        with CaptureQueriesContext(connection) as short:
+            sales_series(*week, 'day')
+        with CaptureQueriesContext(connection) as long:
+            series = sales_series(*five_years, 'month')
+        self.assertEqual(len(long), len(short))
+        self.assertEqual(sum(row['sale_count'] for row in series), Sale.objects.count())
+
+    def test_edits_to_closed_periods_are_recomputed(self):
+        sale = self.sell(self.mountain, self.customer, 100)
+        start = self.today - timedelta(days=200)
+        self.assertEqual(sum(self.revenue(start, self.today, 'month').values()), Decimal('58000.00'))
+
+        sale.quantity = 3
+        sale.save()
+        self.assertEqual(sum(self.revenue(start, self.today, 'month').values()), Decimal('174000.00'))
+
+        sale.sale_date -= timedelta(days=60)
+        sale.save()
+        self.assertEqual(self.revenue(start, self.today, 'day'),
+                         {timezone.localdate(sale.sale_date): Decimal('174000.00')})
+
+        self.mountain.type = 'Hybrid'
+        self.mountain.save()
+        self.assertEqual(self.revenue(start, self.today, 'quarter', bike_type='Mountain'), {})
+        self.assertEqual(sum(self.revenue(start, self.today, 'quarter', bike_type='Hybrid').values()),
+                         Decimal('174000.00'))
+
+        self.mountain.supplier = None
+        self.mountain.save()
+        self.assertEqual(self.revenue(start, self.today, 'week', supplier=self.supplier.pk), {})
+
+        sale.delete()
+        self.assertEqual(self.revenue(start, self.today, 'month'), {})
+
+    def test_open_period_is_read_live(self):
+        self.sell(self.road, self.customer, 0)
+        start = self.today.replace(month=1, day=1)
+        self.assertEqual(self.revenue(start, self.today, 'month'), {period_start(self.today, 'month'): Decimal('45000.00')})
+
+        self.sell(self.road, self.other_customer, 0)
+        self.assertEqual(self.revenue(start, self.today, 'month'), {period_start(self.today, 'month'): Decimal('90000.00')})
+
+    def test_reports_and_api_take_the_range_and_filters(self):
+        self.sell(self.mountain, self.customer, 10)
+        self.sell(self.road, self.customer, 10)
+        start = (self.today - timedelta(days=20)).isoformat()
+        query = {'start_date': start, 'end_date': self.today.isoformat(), 'granularity': 'week', 'bike_type': 'Road'}
+
+        response = self.client.get(reverse('store:reports'), query)
+        self.assertEqual(response.context['total_revenue'], Decimal('45000.00'))
+        self.assertEqual(response.context['granularity'], 'Week')
+
+        data = self.client.get(reverse('store:api_sales_series'), query).json()
+        self.assertEqual(data['periods'][0], period_start(self.today - timedelta(days=20), 'week').isoformat())
+        self.assertEqual(sum(data['revenue']), 45000.0)
+
+        response = self.client.get(reverse('store:api_sales_series'), {'start_date': self.today.isoformat(),
+                                                                        'end_date': start})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('store:reports'), {'customer': 'nobody@example.com'})
+        self.assertIn('customer', response.context['form'].errors)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        cache.clear()
+        make_bike()
+
+    def test_requests_are_timed_and_their_queries_counted(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('store:bike_list'))
+        queries = len(captured)
+        async_to_sync(AsyncClient().get)(reverse('store:api_dashboard'))
+
+        self.assertEqual(metrics.registry.requests[('store:bike_list', 'GET', 200)], 1)
+        self.assertEqual(metrics.registry.queries['store:bike_list'].sum, queries)
+        # Async views query the database from worker threads
+        self.assertGreater(metrics.registry.queries['store:api_dashboard'].sum, 0)
+
+        response = self.client.get(reverse('store:metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('bikestore_requests_total{view="store:bike_list",method="GET",status="200"} 1\n', body)
+        self.assertIn('bikestore_request_duration_seconds_bucket{view="store:bike_list",method="GET",le="+Inf"} 1\n', body)
+        self.assertIn(f'bikestore_request_queries_sum{{view="store:bike_list"}} {queries}', body)
+        self.assertRegex(body, r'bikestore_slow_query_duration_seconds\{view="store:\w+",sql="SELECT [^\n]*"\} ')
+
+    @override_settings(STORE_METRICS_LOG=True)
+    def test_requests_are_logged_as_json(self):
+        with self.assertLogs('store.metrics') as logs:
+            self.client.get(reverse('store:bike_detail', args=[Bike.objects.get().pk]))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['view'], entry['status']), ('store:bike_detail', 200))
+        self.assertGreater(entry['queries'], 0)
+
+    @override_settings(STORE_METRICS_TOKEN='s3cret')
+    def test_token_guards_the_endpoint(self):
+        self.assertEqual(self.client.get(reverse('store:metrics')).status_code, 403)
+        response = self.client.get(reverse('store:metrics'), headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryInspectionTests(TestCase):
+    def setUp(self):
+        for i in range(6):
+            supplier = make_supplier(name=f'Supplier {i}')
+            bike = make_bike(model=f'Model {i}', supplier=supplier)
+            customer = make_customer(name=f'Customer {i}', email=f'customer{i}@email.com')
+            Sale.objects.create(customer=customer, bike=bike, quantity=1, sale_price=bike.price)
+
+    def test_normalise_collapses_literals_and_lists(self):
+        self.assertEqual(
+            nplusone.normalise('SELECT * FROM "store_bike" WHERE "id" IN (%s, %s, %s) AND name = \'x\'  LIMIT 21'),
+            'SELECT * FROM "store_bike" WHERE "id" IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_repeated_shapes_are_traced_to_their_origin(self):
+        with nplusone.inspect(threshold=3) as inspection:
+            for customer in Customer.objects.all():
+                customer.sales.count()
+        finding, = inspection.findings
+        self.assertEqual(finding.count, 6)
+        self.assertRegex(finding.source, r'^store/tests\.py:\d+ in test_repeated_shapes_are_traced_to_their_origin$')
+
+        template = Template('{% for supplier in suppliers %}\n{{ supplier.bike_set.count }}\n{% endfor %}')
+        with nplusone.inspect(threshold=3) as inspection:
+            template.render(Context({'suppliers': Supplier.objects.all()}))
+        finding, = inspection.findings
+        self.assertEqual(finding.template, '<unknown source>:2')
+
+        with override_settings(STORE_NPLUSONE_ALLOW=['<unknown source>:2']):
+            self.assertEqual(inspection.findings, [])
+
+    @override_settings(STORE_QUERY_INSPECTION='strict')
+    def test_strict_mode_fails_requests_with_repeated_queries(self):
+        def view(request):
+            for bike in Bike.objects.all():
+                bike.supplier.name
+            return HttpResponse()
+
+        with self.assertLogs('store.nplusone', 'WARNING'), self.assertRaises(nplusone.NPlusOneError):
+            nplusone.QueryInspectionMiddleware(view)(RequestFactory().get('/'))
+
+    @override_settings(STORE_QUERY_INSPECTION='strict')
+    def test_store_pages_have_no_repeated_queries(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@bikestore.com', None))
+        routes = route_requests(Bike.objects.first(), Customer.objects.first(), Supplier.objects.first(),
+                                Sale.objects.first())
+        for name, (method, url, body) in routes.items():
+            with self.subTest(route=name):
+                if body is None:
+                    getattr(self.client, method)(url)
+                else:
+                    getattr(self.client, method)(url, data=json.dumps(body), content_type='application/json')
+        for model in ('bike', 'customer', 'sale', 'supplier', 'inventory'):
+            with self.subTest(admin=model):
+                self.client.get(reverse(f'admin:store_{model}_changelist'))
+
+
+class ReorderPlanTests(TestCase):
+    def setUp(self):
+        self.hero = make_supplier()
+        self.atlas = make_supplier(name='Atlas Cycles', email='sales@atlas.com')
+        # Below its own reorder point of 4: ordered up to 12
+        self.short = make_bike(stock_quantity=3, supplier=self.hero)
+        Inventory.objects.create(bike=self.short, reorder_point=4, maximum_stock=12)
+        # No inventory row: the default levels (10 and 50) apply
+        self.default = make_bike(model='Marlin 5', stock_quantity=10, supplier=self.atlas)
+        self.unsupplied = make_bike(model='Roscoe 7', stock_quantity=0)
+        # Above its reorder point
+        self.stocked = make_bike(model='Fuel EX', stock_quantity=6, supplier=self.hero)
+        Inventory.objects.create(bike=self.stocked, reorder_point=5, maximum_stock=20)
+
+    def test_lines_and_drafts_are_planned_in_one_query(self):
+        with self.assertNumQueries(1):
+            orders = list(draft_orders())
+        self.assertEqual(
+            [(order.supplier_name, [line.pk for line in order.lines], order.units) for order in orders],
+            [('Atlas Cycles', [self.default.pk], 40), ('Hero Cycles', [self.short.pk], 9),
+             (None, [self.unsupplied.pk], 50)],
+        )
+        self.assertEqual(orders[1].value, 9 * self.short.price)
+        self.assertEqual([order.supplier_id for order in draft_orders(supplier=0)], [None])
+
+        summary = {row['supplier_id']: (row['bikes'], row['units']) for row in supplier_summary()}
+        self.assertEqual(summary, {self.atlas.pk: (1, 40), self.hero.pk: (1, 9), None: (1, 50)})
+
+    def test_view_and_export(self):
+        response = self.client.get(reverse('store:reorder_plan'), {'supplier': self.hero.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['lines']), [self.short])
+        self.assertEqual(response.context['total_units'], 99)
+
+        response = self.client.get(reverse('store:reorder_export'), {'supplier': 'none'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'supplier,bike_id,brand,model,color,stock_quantity,reorder_point,'
+                                   'maximum_stock,order_quantity,price')
+        self.assertEqual(lines[1].split(',')[1:3], [str(self.unsupplied.pk), 'Trek'])
+
+    def test_command_writes_a_file_per_supplier(self):
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('plan_reorders', output_dir=directory, stdout=out)
+            self.assertEqual(sorted(os.listdir(directory)),
+                             sorted(['reorder-0.csv', f'reorder-{self.atlas.pk}.csv', f'reorder-{self.hero.pk}.csv']))
+            with open(os.path.join(directory, f'reorder-{self.hero.pk}.csv')) as draft:
+                self.assertEqual(len(draft.read().splitlines()), 2)
+        self.assertIn('Planned 3 draft orders for 3 bikes (99 units)', out.getvalue())
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.bike = make_bike(stock_quantity=20)
+        self.customer = make_customer()
+
+    def ledger(self):
+        return list(self.bike.stock_movements.values_list('kind', 'quantity'))
+
+    def test_every_stock_change_is_recorded_with_it(self):
+        sale = Sale.objects.create(customer=self.customer, bike=self.bike, quantity=2)
+        place_order([{'customer': self.customer.pk, 'bike': self.bike.pk, 'quantity': 3}])
+        self.bike.refresh_from_db()
+        self.bike.stock_quantity = 30
+        self.bike.save()
+        Inventory.objects.create(bike=self.bike)
+        restock(self.bike.pk, 5, note='PO 17')
+        return_sale(sale, 1)
+        with self.assertRaises(ValueError):
+            return_sale(sale, 2)
+
+        self.assertEqual(self.ledger(), [
+            ('adjustment', 20), ('sale', -2), ('sale', -3), ('adjustment', 15), ('restock', 5), ('return', 1),
+        ])
+        self.assertEqual(StockMovement.objects.filter(kind='sale', sale__isnull=False).count(), 2)
+        self.assertIsNotNone(Inventory.objects.get(bike=self.bike).last_restocked)
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.stock_quantity, 36)
+        self.assertFalse(drifted().exists())
+
+        # Saves that leave stock alone add nothing, and the ledger cannot be rewritten
+        self.bike.price = Decimal('60000.00')
+        self.bike.save()
+        self.assertEqual(len(self.ledger()), 6)
+        movement = StockMovement.objects.first()
+        movement.quantity = 0
+        with self.assertRaises(ValueError):
+            movement.save()
+
+    def test_stock_at_reads_the_latest_snapshot_and_the_movements_since(self):
+        now = timezone.now()
+        StockMovement.objects.update(created_at=now - timedelta(days=3))
+        for days_ago, quantity in ((2, 4), (1, 1)):
+            sale = Sale.objects.create(customer=self.customer, bike=self.bike, quantity=quantity)
+            StockMovement.objects.filter(sale=sale).update(created_at=now - timedelta(days=days_ago))
+
+        self.assertEqual(take_snapshots(at=now - timedelta(days=1.5)), 1)
+        # Nothing has moved since
+        self.assertEqual(take_snapshots(at=now - timedelta(days=1.25)), 0)
+        self.assertEqual(StockSnapshot.objects.get().quantity, 16)
+        Sale.objects.create(customer=self.customer, bike=self.bike, quantity=3)
+
+        with self.assertNumQueries(1):
+            stock = stock_at(now - timedelta(days=0.5))
+        self.assertEqual(stock, {self.bike.pk: 15})
+        expected = {4: 0, 2.5: 20, 1.5: 16, 0.5: 15}
+        self.assertEqual(
+            {days: stock_at(now - timedelta(days=days))[self.bike.pk] for days in expected}, expected
+        )
+        self.assertEqual(stock_at(timezone.now()), {self.bike.pk: 12})
+
+    def test_back_dated_sales_move_stock_when_they_are_made(self):
+        StockMovement.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(take_snapshots(), 1)
+        Sale.objects.create(customer=self.customer, bike=self.bike, quantity=2,
+                            sale_date=timezone.now() - timedelta(days=7))
+        self.assertEqual(stock_at(timezone.now()), {self.bike.pk: 18})
+        self.assertFalse(drifted().exists())
+
+    def test_command_snapshots_and_reports_drift(self):
+        StockMovement.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        Bike.objects.filter(pk=self.bike.pk).update(stock_quantity=25)
+        out = io.StringIO()
+        call_command('snapshot_stock', check=True, stdout=out)
+        self.assertIn('Took 1 stock snapshots', out.getvalue())
+        self.assertIn('1 bikes differ from their stock ledger', out.getvalue())
+        self.assertEqual(StockSnapshot.objects.get().quantity, 20)
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    def make_pool(self, **options):
+        pool = ConnectionPool(lambda: sqlite3.connect(':memory:', check_same_thread=False),
+                              check=lambda conn: conn.execute('SELECT 1'), **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_connections_are_reused_up_to_max_size(self):
+        pool = self.make_pool(max_size=2, timeout=0.05)
+        first, second = pool.getconn(), pool.getconn()
+        self.assertIsNot(first, second)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        stats = pool.get_stats()
+        self.assertEqual((stats['pool_size'], stats['pool_available'], stats['connections_num']), (2, 0, 2))
+        self.assertEqual((stats['requests_num'], stats['requests_errors']), (4, 1))
+
+    def test_waiting_threads_get_returned_connections(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        held = pool.getconn()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+        waiter.start()
+        while not pool.get_stats()['requests_waiting']:
+            threading.Event().wait(0.001)
+        pool.putconn(held)
+        waiter.join()
+        self.assertEqual(got, [held])
+        self.assertEqual(pool.get_stats()['requests_queued'], 1)
+
+    def test_broken_and_stale_connections_are_replaced(self):
+        pool = self.make_pool(min_size=0, max_idle=60)
+        conn = pool.getconn()
+        conn.execute('BEGIN')
+        pool.putconn(conn)
+        # Returned connections are rolled back
+        self.assertFalse(conn.in_transaction)
+        conn.close()
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(pool.get_stats()['connections_lost'], 1)
+
+        pool.max_idle = 0
+        pool.putconn(replacement)
+        self.assertIsNot(pool.getconn(), replacement)
+        self.assertEqual(pool.get_stats()['connections_num'], 3)
+
+    def test_django_connections_come_from_the_pool(self):
+        if getattr(connection, 'pool', None) is None:
+            self.skipTest('connection pooling is turned off')
+        connection.close()
+        connection.ensure_connection()
+        raw = connection.connection
+        connection.close()
+        Bike.objects.count()
+        self.assertIs(connection.connection, raw)
+
+        body = self.client.get(reverse('store:metrics')).content.decode()
+        self.assertRegex(body, r'bikestore_db_pool_pool_size\{alias="default"\} [1-9]')
+        self.assertIn('# TYPE bikestore_db_pool_requests_num_total counter', body)
+
+    def test_configure_pool_per_engine(self):
+        sqlite = configure_pool({'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'x'}, {'max_size': 4})
+        self.assertEqual(sqlite['ENGINE'], 'store.backends.sqlite3')
+        self.assertEqual((sqlite['CONN_MAX_AGE'], sqlite['OPTIONS']['pool']['max_size']), (0, 4))
+        mysql = configure_pool({'ENGINE': 'django.db.backends.mysql', 'NAME': 'x'})
+        self.assertEqual((mysql['CONN_MAX_AGE'], mysql['CONN_HEALTH_CHECKS']), (600, True))
+
+
+@skipUnless(numpy, 'forecasting needs numpy')
+class ForecastingTests(TestCase):
+    def setUp(self):
+        self.busy = make_bike(stock_quantity=100)
+        self.quiet = make_bike(model='Marlin 5')
+        customer = make_customer()
+        # Units sold, by days ago
+        self.history = {1: 3, 2: 1, 5: 2, 10: 4, 40: 1}
+        for days_ago, quantity in self.history.items():
+            sale = Sale.objects.create(customer=customer, bike=self.busy, quantity=quantity, sale_price=Decimal('1.00'))
+            sale.sale_date -= timedelta(days=days_ago)
+            sale.save()
+        # Today is still open, so it is left out
+        Sale.objects.create(customer=customer, bike=self.busy, quantity=5, sale_price=Decimal('1.00'))
+
+    def test_forecast_matches_a_day_by_day_computation(self):
+        from .forecasting import forecast_all
+
+        days, alpha = 60, 0.3
+        result = forecast_all(days=days, alpha=alpha, lead_time=7, service_level=0.95)
+        self.assertEqual(list(result.bike_ids), [self.busy.pk, self.quiet.pk])
+
+        series = [self.history.get(days - offset, 0) for offset in range(days)]
+        level = 0
+        for units in series:
+            level = alpha * units + (1 - alpha) * level
+        mean = sum(series) / days
+        deviation = (sum((units - mean) ** 2 for units in series) / days) ** 0.5
+        self.assertAlmostEqual(result.average_7[0], sum(series[-7:]) / 7)
+        self.assertAlmostEqual(result.average_28[0], sum(series[-28:]) / 28)
+        self.assertAlmostEqual(result.smoothed[0], level)
+        self.assertAlmostEqual(result.deviation[0], deviation)
+        self.assertEqual(result.reorder_point[0],
+                         math.ceil(level * 7 + NormalDist().inv_cdf(0.95) * deviation * 7 ** 0.5))
+        self.assertEqual((result.smoothed[1], result.reorder_point[1]), (0, 0))
+
+    def test_command_stores_reorder_points_in_bulk(self):
+        Inventory.objects.create(bike=self.busy, minimum_stock=1, maximum_stock=2, reorder_point=1)
+        out = io.StringIO()
+        call_command('forecast_demand', days=60, stdout=out)
+        self.assertIn('Stored 2 changed reorder points', out.getvalue())
+
+        busy = Inventory.objects.get(bike=self.busy)
+        self.assertGreater(busy.reorder_point, 1)
+        self.assertEqual(busy.maximum_stock, busy.reorder_point + 1)
+        # No demand: the reorder point rests at the default minimum stock
+        quiet = Inventory.objects.get(bike=self.quiet)
+        self.assertEqual((quiet.minimum_stock, quiet.reorder_point, quiet.maximum_stock), (5, 5, 50))
+
+        call_command('forecast_demand', days=60, stdout=out)
+        self.assertIn('Stored 0 changed reorder points', out.getvalue())
@@ -0,0 +1,254 @@
+"""
+Sales over time, by day, week, month or quarter, for any date range.
+
+A closed period (one that ended before today) can no longer gain sales, so
+its totals are computed once, per bike type and supplier, into
+``SalesPeriodBucket`` rows under a ``SalesPeriod`` marker, and read back from
+there on every later request. ``sales_series`` answers a range from:
+
+* the buckets of every closed period the range covers whole,
+* day buckets for the days of periods it covers only in part,
+* the sales table itself only for the open period's days from today on.
+
+A five-year monthly chart therefore reads sixty bucketed periods and a
+one-week daily chart seven, however many sales they hold. Buckets are made
+on first use. Weeks start on Monday and all periods follow local time.
+
+Buckets hold the bike's current type and supplier, so anything that changes
+the sales of a closed period or re-categorises sold bikes calls
+``invalidate`` (or ``invalidate_all``) and the affected periods are
+computed again on their next use; the model signals do this for saves and
+deletes. A customer filter is answered from the sales table: a single
+customer's sales are few and indexed by customer and date.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import Sale, SalesPeriod, SalesPeriodBucket
+
+GRANULARITIES = [code for code, _ in SalesPeriod.GRANULARITIES]
+# Most periods a report may chart
+MAX_PERIODS = 2000
+
+
+def period_start(day, granularity):
+    """First day of the period containing day"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day
+
+
+def next_period(start, granularity):
+    """First day of the period after the one starting on start"""
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    months = 3 if granularity == 'quarter' else 1
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def periods(start, end, granularity):
+    """Starts of the periods overlapping the dates start to end inclusive"""
+    result = []
+    current = period_start(start, granularity)
+    while current <= end:
+        result.append(current)
+        current = next_period(current, granularity)
+    return result
+
+
+def period_count(start, end, granularity):
+    """Number of periods overlapping the dates start to end inclusive"""
+    first, last = period_start(start, granularity), period_start(end, granularity)
+    if granularity in ('day', 'week'):
+        return (last - first).days // (7 if granularity == 'week' else 1) + 1
+    months = (last.year - first.year) * 12 + last.month - first.month
+    return months // (3 if granularity == 'quarter' else 1) + 1
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _totals(queryset, sales=True):
+    """Sum the rows of queryset per 'key', from the sales table or from buckets"""
+    if sales:
+        aggregates = {
+            'sale_count': Count('pk'),
+            'units_sold': Sum('quantity'),
+            'revenue': Sum(F('quantity') * F('sale_price')),
+        }
+    else:
+        aggregates = {name: Sum(name) for name in ('sale_count', 'units_sold', 'revenue')}
+    return queryset.order_by().values('key').annotate(**aggregates)
+
+
+def sales_in_range(start, end, bike_type=None, supplier=None, customer=None):
+    """Sales made on the dates start to end inclusive, optionally filtered as sales_series is"""
+    sales = Sale.objects.filter(sale_date__gte=_midnight(start), sale_date__lt=_midnight(end + timedelta(days=1)))
+    if bike_type:
+        sales = sales.filter(bike__type=bike_type)
+    if supplier:
+        sales = sales.filter(bike__supplier_id=supplier)
+    if customer:
+        sales = sales.filter(customer_id=customer)
+    return sales
+
+
+def _sales(first, last, granularity, **filters):
+    """Live totals per period from the sales of the days first to last"""
+    return _totals(
+        sales_in_range(first, last, **filters).annotate(key=Trunc('sale_date', granularity, output_field=DateField()))
+    )
+
+
+def _materialize(granularity, starts):
+    """Compute and store the buckets of the closed periods starting on starts not stored yet"""
+    stored = set(
+        SalesPeriod.objects.filter(granularity=granularity, start__in=starts).values_list('start', flat=True)
+    )
+    missing = sorted(set(starts) - stored)
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            created = {
+                period.start: period
+                for period in SalesPeriod.objects.bulk_create(
+                    [SalesPeriod(granularity=granularity, start=start) for start in missing]
+                )
+            }
+            rows = (
+                Sale.objects.filter(
+                    sale_date__gte=_midnight(missing[0]),
+                    sale_date__lt=_midnight(next_period(missing[-1], granularity)),
+                )
+                .annotate(period_start=Trunc('sale_date', granularity, output_field=DateField()))
+                .order_by()
+                .values('period_start', 'bike__type', 'bike__supplier')
+                .annotate(sale_count=Count('pk'), units_sold=Sum('quantity'),
+                          revenue=Sum(F('quantity') * F('sale_price')))
+            )
+            SalesPeriodBucket.objects.bulk_create([
+                SalesPeriodBucket(
+                    period=created[row['period_start']],
+                    bike_type=row['bike__type'],
+                    supplier_id=row['bike__supplier'],
+                    sale_count=row['sale_count'],
+                    units_sold=row['units_sold'],
+                    revenue=row['revenue'],
+                )
+                for row in rows if row['period_start'] in created
+            ], batch_size=1000)
+    except IntegrityError:
+        # A concurrent request stored some of the same periods first
+        pass
+
+
+def _buckets(granularity, starts, filters):
+    """Bucketed totals per period start for closed periods"""
+    _materialize(granularity, starts)
+    return _totals(
+        SalesPeriodBucket.objects.filter(
+            period__granularity=granularity, period__start__in=starts, **filters
+        ).annotate(key=F('period__start')),
+        sales=False,
+    )
+
+
+def sales_series(start, end, granularity='month', bike_type=None, supplier=None, customer=None):
+    """Sales totals per period for the dates start to end, inclusive.
+
+    supplier and customer are primary keys. Returns one dict per period in
+    order, empty periods included, with the period's start date as
+    "period" and its sale_count, units_sold and revenue within the range.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity {granularity!r}')
+    starts = periods(start, end, granularity)
+    totals = {period: [0, 0, Decimal('0.00')] for period in starts}
+    filters = {}
+    if bike_type:
+        filters['bike_type'] = bike_type
+    if supplier:
+        filters['supplier_id'] = supplier
+
+    def add(rows, period_of=lambda key: key):
+        for row in rows:
+            figures = totals[period_of(row['key'])]
+            figures[0] += row['sale_count']
+            figures[1] += row['units_sold'] or 0
+            figures[2] += row['revenue'] or 0
+
+    if customer:
+        add(_sales(start, end, granularity, bike_type=bike_type, supplier=supplier, customer=customer))
+    else:
+        today = timezone.localdate()
+        whole = []
+        days = {}
+        for period in starts:
+            following = next_period(period, granularity)
+            if period >= start and following <= end + timedelta(days=1) and following <= today:
+                whole.append(period)
+                continue
+            day = max(period, start)
+            while day < min(following, end + timedelta(days=1), today):
+                days[day] = period
+                day += timedelta(days=1)
+        if whole:
+            add(_buckets(granularity, whole, filters))
+        if days:
+            add(_buckets('day', list(days), filters), days.get)
+        if end >= today:
+            add(_sales(max(start, today), end, granularity, bike_type=bike_type, supplier=supplier))
+
+    return [
+        {'period': period, 'sale_count': sale_count, 'units_sold': units, 'revenue': revenue}
+        for period, (sale_count, units, revenue) in totals.items()
+    ]
+
+
+def period_label(period, granularity):
+    """Chart label for the period starting on period"""
+    if granularity == 'month':
+        return period.strftime('%b %Y')
+    if granularity == 'quarter':
+        return f'Q{(period.month - 1) // 3 + 1} {period.year}'
+    return period.isoformat()
+
+
+def invalidate(first, last=None):
+    """Forget the stored periods of every granularity overlapping the days first to last"""
+    last = last or first
+    if first >= timezone.localdate():
+        # Periods reaching today are never stored
+        return
+    for granularity in GRANULARITIES:
+        SalesPeriod.objects.filter(
+            granularity=granularity,
+            start__gte=period_start(first, granularity),
+            start__lte=period_start(last, granularity),
+        ).delete()
+
+
+def invalidate_bike(bike_id):
+    """Forget the stored periods holding any sale of the bike"""
+    dates = Sale.objects.filter(bike_id=bike_id).aggregate(first=Min('sale_date'), last=Max('sale_date'))
+    if dates['first'] is not None:
+        invalidate(timezone.localdate(dates['first']), timezone.localdate(dates['last']))
+
+
+def invalidate_all():
+    """Forget every stored period"""
+    SalesPeriod.objects.all().delete()
@@ -0,0 +1,242 @@
+"""
+Typeahead search behind /api/search/<type>/ (static/js/search.js).
+
+Each search type reads only the columns its results show, matches bikes and
+customers through the full-text index in ``search.py``, and fetches at most
+``limit + 1`` rows: ranking, ordering and the limit all run in one query, so
+no more rows reach Python however many match.
+Responses are cached for a short time under a key built from the normalised
+query, filters, sort and limit, and dropped as soon as a model they read
+changes. Titles and descriptions are HTML-escaped because search.js renders
+them as markup.
+"""
+from functools import reduce
+import json
+import operator
+
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.html import escape
+
+from .forms import BikeSearchForm
+from .models import Bike, Customer, Sale, Supplier
+from . import caching, search
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MAX_SUGGESTIONS = 5
+
+# sort field -> ORDER BY columns; None means best match first
+BIKE_SORTS = {
+    'relevance': None,
+    'name': ['brand', 'model', 'pk'],
+    'price': ['price', 'pk'],
+    'stock': ['stock_quantity', 'pk'],
+}
+CUSTOMER_SORTS = {
+    'relevance': None,
+    'name': ['name', 'pk'],
+    'date': ['created_at', 'pk'],
+}
+SUPPLIER_SORTS = {
+    'name': ['name', 'pk'],
+    'date': ['created_at', 'pk'],
+}
+SALE_SORTS = {
+    'date': ['-sale_date', '-pk'],
+}
+
+
+def _ordering(sorts, sort):
+    """ORDER BY columns for the requested sort, falling back to the first option"""
+    field = sort.get('field')
+    if field not in sorts:
+        field = next(iter(sorts))
+    columns = sorts[field]
+    if columns is None or sort.get('order') != 'desc':
+        return columns
+    return [column[1:] if column.startswith('-') else f'-{column}' for column in columns]
+
+
+def _page(results, limit):
+    """The first limit results and whether there were more"""
+    return results[:limit], len(results) > limit
+
+
+def _limited(queryset, text, ordering, limit):
+    """Matching rows in the requested order, at most limit + 1 of them, in one query"""
+    if ordering is None:
+        return list(search.search(queryset, text)[:limit + 1])
+    return list(search.matches(queryset, text).order_by(*ordering)[:limit + 1])
+
+
+def _bikes(text, filters, sort, limit):
+    form = BikeSearchForm(filters)
+    if not form.is_valid():
+        raise ValueError('; '.join(f'{field}: {errors[0]}' for field, errors in form.errors.items()))
+    queryset = Bike.objects.only('id', 'brand', 'model', 'color', 'type', 'price', 'stock_quantity')
+    data = form.cleaned_data
+    if data.get('type'):
+        queryset = queryset.filter(type=data['type'])
+    if data.get('min_price') is not None:
+        queryset = queryset.filter(price__gte=data['min_price'])
+    if data.get('max_price') is not None:
+        queryset = queryset.filter(price__lte=data['max_price'])
+    if data.get('in_stock_only'):
+        queryset = queryset.filter(stock_quantity__gt=0)
+
+    bikes = _limited(queryset, text, _ordering(BIKE_SORTS, sort), limit)
+    return _page([
+        {
+            'type': 'bike',
+            'id': bike.pk,
+            'title': escape(str(bike)),
+            'description': escape(f'{bike.get_type_display()} - ₹{bike.price:,.2f}'),
+            'metadata': {'Type': bike.type, 'Price': f'{bike.price:.2f}', 'Stock': bike.stock_quantity},
+            'viewUrl': reverse('store:bike_detail', args=[bike.pk]),
+            'editUrl': reverse('store:bike_update', args=[bike.pk]),
+            'suggestion': f'{bike.brand} {bike.model}',
+        }
+        for bike in bikes
+    ], limit)
+
+
+def _customers(text, filters, sort, limit):
+    queryset = Customer.objects.only('id', 'name', 'email', 'phone')
+    customers = _limited(queryset, text, _ordering(CUSTOMER_SORTS, sort), limit)
+    return _page([
+        {
+            'type': 'customer',
+            'id': customer.pk,
+            'title': escape(customer.name),
+            'description': escape(f'{customer.email} - {customer.phone}'),
+            'metadata': None,
+            'viewUrl': reverse('store:customer_detail', args=[customer.pk]),
+            'editUrl': reverse('store:customer_update', args=[customer.pk]),
+            'suggestion': customer.name,
+        }
+        for customer in customers
+    ], limit)
+
+
+def _suppliers(text, filters, sort, limit):
+    # The supplier list is short enough for plain icontains filters
+    queryset = Supplier.objects.all()
+    for term in search.search_terms(text):
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(contact_person__icontains=term) | Q(email__icontains=term)
+        )
+    suppliers = queryset.order_by(*_ordering(SUPPLIER_SORTS, sort)).values(
+        'id', 'name', 'contact_person', 'email'
+    )[:limit + 1]
+    return _page([
+        {
+            'type': 'supplier',
+            'id': supplier['id'],
+            'title': escape(supplier['name']),
+            'description': escape(f"{supplier['contact_person']} - {supplier['email']}"),
+            'metadata': None,
+            'viewUrl': reverse('store:supplier_detail', args=[supplier['id']]),
+            'editUrl': reverse('store:supplier_update', args=[supplier['id']]),
+            'suggestion': supplier['name'],
+        }
+        for supplier in suppliers
+    ], limit)
+
+
+def _sales(text, filters, sort, limit):
+    matched = [
+        Q(customer__in=search.matches(Customer.objects.all(), text).values('pk')),
+        Q(bike__in=search.matches(Bike.objects.all(), text).values('pk')),
+    ]
+    if text.strip().lstrip('#').isdigit():
+        matched.append(Q(pk=int(text.strip().lstrip('#'))))
+    sales = Sale.objects.filter(reduce(operator.or_, matched)).order_by(
+        *_ordering(SALE_SORTS, sort)
+    ).values(
+        'id', 'quantity', 'sale_price', 'sale_date', 'customer__name',
+        'bike__brand', 'bike__model', 'bike__color',
+    )[:limit + 1]
+    return _page([
+        {
+            'type': 'sale',
+            'id': sale['id'],
+            'title': escape(f"Sale #{sale['id']} - {sale['customer__name']}"),
+            'description': escape(
+                f"{sale['quantity']} x {sale['bike__brand']} {sale['bike__model']} ({sale['bike__color']})"
+                f" - ₹{sale['quantity'] * sale['sale_price']:,.2f}"
+            ),
+            'metadata': {'Date': f"{sale['sale_date']:%Y-%m-%d}"},
+            'viewUrl': reverse('store:sale_detail', args=[sale['id']]),
+            'editUrl': None,
+            'suggestion': sale['customer__name'],
+        }
+        for sale in sales
+    ], limit)
+
+
+def _general(text, filters, sort, limit):
+    # A few of each kind rather than a merged ranking
+    share = max(limit // 3, 1)
+    groups = [find(text, {}, {}, share) for find in (_bikes, _customers, _suppliers)]
+    return (
+        [item for results, _ in groups for item in results],
+        any(has_more for _, has_more in groups),
+    )
+
+
+SEARCH_TYPES = {
+    'bikes': _bikes,
+    'customers': _customers,
+    'suppliers': _suppliers,
+    'sales': _sales,
+    'general': _general,
+}
+
+# Models whose changes can alter each search type's results
+SEARCH_TOPICS = {
+    'bikes': ('bike',),
+    'customers': ('customer',),
+    'suppliers': ('supplier',),
+    'sales': ('sale', 'customer', 'bike'),
+    'general': ('bike', 'customer', 'supplier'),
+}
+
+
+def _normalised(search_type, text, filters, sort, limit):
+    return json.dumps(
+        [search_type, search.search_terms(text), filters, sort.get('field'), sort.get('order'), limit],
+        sort_keys=True, default=str,
+    )
+
+
+def typeahead(search_type, text, filters=None, sort=None, limit=DEFAULT_LIMIT):
+    """Search one result type for text.
+
+    Returns {"results", "suggestions", "count", "has_more"}. Raises KeyError
+    for an unknown search type and ValueError for invalid filters.
+    """
+    find = SEARCH_TYPES[search_type]
+    filters = {key: value for key, value in (filters or {}).items() if value not in (None, '')}
+    sort = sort or {}
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+    if not search.search_terms(text):
+        return {'results': [], 'suggestions': [], 'count': 0, 'has_more': False}
+
+    def respond():
+        results, has_more = find(text, filters, sort, limit)
+        suggestions = []
+        for item in results:
+            suggestion = item.pop('suggestion')
+            if suggestion not in suggestions and len(suggestions) < MAX_SUGGESTIONS:
+                suggestions.append(suggestion)
+        return {
+            'results': results,
+            'suggestions': suggestions,
+            'count': len(results),
+            'has_more': has_more,
+        }
+
+    return caching.cached(
+        'search', SEARCH_TOPICS[search_type], respond, _normalised(search_type, text, filters, sort, limit)
+    )
@@ -13,6 +13,7 @@ urlpatterns = [
     path('bikes/add/', views.BikeCreateView.as_view(), name='bike_create'),
     path('bikes/<int:pk>/edit/', views.BikeUpdateView.as_view(), name='bike_update'),
     path('bikes/<int:pk>/delete/', views.BikeDeleteView.as_view(), name='bike_delete'),
+    path('bikes/export/', views.BikeExportView.as_view(), name='bike_export'),
     
     # Customer URLs
     path('customers/', views.CustomerListView.as_view(), name='customer_list'),
@@ -20,11 +21,13 @@ urlpatterns = [
     path('customers/add/', views.CustomerCreateView.as_view(), name='customer_create'),
     path('customers/<int:pk>/edit/', views.CustomerUpdateView.as_view(), name='customer_update'),
     path('customers/<int:pk>/delete/', views.CustomerDeleteView.as_view(), name='customer_delete'),
+    path('customers/export/', views.CustomerExportView.as_view(), name='customer_export'),
     
     # Sale URLs
     path('sales/', views.SaleListView.as_view(), name='sale_list'),
     path('sales/<int:pk>/', views.SaleDetailView.as_view(), name='sale_detail'),
     path('sales/add/', views.SaleCreateView.as_view(), name='sale_create'),
+    path('sales/export/', views.SaleExportView.as_view(), name='sale_export'),
     
     # Supplier URLs
     path('suppliers/', views.SupplierListView.as_view(), name='supplier_list'),
@@ -33,6 +36,10 @@ urlpatterns = [
     path('suppliers/<int:pk>/edit/', views.SupplierUpdateView.as_view(), name='supplier_update'),
     path('suppliers/<int:pk>/delete/', views.SupplierDeleteView.as_view(), name='supplier_delete'),
     
+    # Reorder planning
+    path('reorders/', views.ReorderPlanView.as_view(), name='reorder_plan'),
+    path('reorders/export/', views.ReorderExportView.as_view(), name='reorder_export'),
+
     # Reports
     path('reports/', views.reports, name='reports'),
     
@@ -40,5 +47,11 @@ urlpatterns = [
     path('api/bike/<int:bike_id>/price/', views.api_bike_price, name='api_bike_price'),
     path('api/dashboard/', views.api_dashboard_data, name='api_dashboard'),
     path('api/sales-by-bike-type/', views.api_sales_by_bike_type, name='api_sales_by_bike_type'),
+    path('api/sales-series/', views.api_sales_series, name='api_sales_series'),
     path('api/bike-inventory/', views.api_bike_inventory, name='api_bike_inventory'),
+    path('api/events/', views.api_events, name='api_events'),
+    path('api/orders/', views.api_create_order, name='api_create_order'),
+    path('api/search/<str:search_type>/', views.api_search, name='api_search'),
+    # Scraped by Prometheus at its default path, without a trailing slash
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
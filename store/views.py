@@ -1,34 +1,76 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.db.models import Q, Sum, F, Count
+from django.db import connections
+from django.db.models import Sum, F, Count, DecimalField, ExpressionWrapper
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
-from .models import Bike, Customer, Sale, Supplier, Inventory
-from .forms import BikeForm, CustomerForm, SaleForm, SupplierForm, InventoryForm, BikeSearchForm
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from .models import Bike, Customer, Sale, Supplier, Inventory, BikeTypeSalesRollup, SalesPeriod
+from .forms import BikeForm, CustomerForm, SaleForm, SupplierForm, InventoryForm, BikeSearchForm, ReportForm
+from .orders import place_order, MAX_ORDER_LINES
+from .reorders import reorder_lines, supplier_summary
+from .rollups import sales_totals
+from .stats import LOW_STOCK_LEVEL, astore_stats, store_stats
+from .timeseries import period_label, sales_in_range, sales_series
+from . import caching, events, metrics, pooling, search as search_engine
+from .typeahead import typeahead, SEARCH_TYPES
+from .pagination import KeysetPaginationMixin
+from .exports import ExportMixin
+from datetime import timedelta
 from decimal import Decimal
+import asyncio
 import json
 
 
 # Dashboard View
-def dashboard(request):
+# Cached dashboard figures depend on these tables; sale totals come from the rollups
+DASHBOARD_TOPICS = ('bike', 'customer', 'rollups')
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _dashboard_stats():
+    stats = await astore_stats()
+    return {
+        'total_bikes': stats['total_bikes'],
+        'total_customers': stats['total_customers'],
+        'total_sales': stats['total_sales'],
+        'total_revenue': stats['total_revenue'],
+        'sales_by_type': [
+            {
+                'type': row['type'],
+                'total_sales': row['sale_count'],
+                'total_revenue': row['revenue'],
+            }
+            for row in stats['sales_by_type']
+        ]
+    }
+
+
+async def dashboard(request):
     """Main dashboard view with statistics and charts"""
+    stats, low_stock_bikes, recent_sales = await asyncio.gather(
+        caching.acached('dashboard', DASHBOARD_TOPICS, _dashboard_stats),
+        _alist(Bike.objects.filter(stock_quantity__lt=LOW_STOCK_LEVEL)),
+        _alist(Sale.objects.select_related('customer', 'bike')[:5]),
+    )
     context = {
-        'total_bikes': Bike.objects.count(),
-        'total_customers': Customer.objects.count(),
-        'total_sales': Sale.objects.count(),
-        'total_revenue': Sale.objects.aggregate(
-            revenue=Sum(F('quantity') * F('sale_price'))
-        )['revenue'] or Decimal('0.00'),
-        'low_stock_bikes': Bike.objects.filter(stock_quantity__lt=5),
-        'recent_sales': Sale.objects.select_related('customer', 'bike')[:5],
-        'sales_by_type': Bike.objects.values('type').annotate(
-            total_sales=Count('sales'),
-            total_revenue=Sum(F('sales__quantity') * F('sales__sale_price'))
-        ).filter(total_sales__gt=0)
+        **stats,
+        'low_stock_bikes': low_stock_bikes,
+        'recent_sales': recent_sales,
     }
-    return render(request, 'store/dashboard.html', context)
+    # Context processors read the session, which is sync-only
+    return await sync_to_async(render)(request, 'store/dashboard.html', context)
 
 
 # Bike Views
@@ -50,13 +92,6 @@ class BikeListView(ListView):
             max_price = form.cleaned_data.get('max_price')
             in_stock_only = form.cleaned_data.get('in_stock_only')
 
-            if search:
-                queryset = queryset.filter(
-                    Q(brand__icontains=search) |
-                    Q(model__icontains=search) |
-                    Q(type__icontains=search)
-                )
-            
             if bike_type:
                 queryset = queryset.filter(type=bike_type)
             
@@ -69,8 +104,15 @@ class BikeListView(ListView):
             if in_stock_only:
                 queryset = queryset.filter(stock_quantity__gt=0)
 
+            # Search goes last: it ranks the already filtered bikes
+            if search:
+                queryset = self.search(queryset, search)
+
         return queryset
 
+    def search(self, queryset, text):
+        return search_engine.search(queryset, text)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_form'] = BikeSearchForm(self.request.GET)
@@ -87,9 +129,8 @@ class BikeDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         bike = self.get_object()
         context['recent_sales'] = bike.sales.select_related('customer')[:5]
-        context['total_sold'] = bike.sales.aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
+        context['stock_movements'] = bike.stock_movements.order_by('-created_at', '-id')[:5]
+        context['total_sold'] = bike.units_sold
         return context
 
 
@@ -128,7 +169,7 @@ class BikeDeleteView(DeleteView):
 
 
 # Customer Views
-class CustomerListView(ListView):
+class CustomerListView(KeysetPaginationMixin, ListView):
     """List all customers"""
     model = Customer
     template_name = 'store/customer_list.html'
@@ -139,13 +180,17 @@ class CustomerListView(ListView):
         queryset = Customer.objects.all()
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(email__icontains=search) |
-                Q(phone__icontains=search)
-            )
+            queryset = self.search(queryset, search)
         return queryset
 
+    def search(self, queryset, text):
+        return search_engine.search(queryset, text)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['total_customers'] = context['paginator'].count
+        return context
+
 
 class CustomerDetailView(DetailView):
     """Detailed view of a single customer"""
@@ -157,7 +202,7 @@ class CustomerDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         customer = self.get_object()
         context['sales'] = customer.sales.select_related('bike')[:10]
-        context['total_spent'] = customer.total_purchases
+        context['total_spent'] = customer.lifetime_spend
         context['total_bikes'] = customer.sales.aggregate(
             total=Sum('quantity')
         )['total'] or 0
@@ -199,7 +244,7 @@ class CustomerDeleteView(DeleteView):
 
 
 # Sale Views
-class SaleListView(ListView):
+class SaleListView(KeysetPaginationMixin, ListView):
     """List all sales"""
     model = Sale
     template_name = 'store/sale_list.html'
@@ -207,13 +252,20 @@ class SaleListView(ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        return Sale.objects.select_related('customer', 'bike').order_by('-sale_date')
+        return Sale.objects.select_related('customer', 'bike').order_by('-sale_date', '-pk')
+
+    @cached_property
+    def sales_totals(self):
+        return sales_totals()
+
+    def get_keyset_count(self):
+        # The rollups already hold the exact number of sales
+        return lambda: self.sales_totals['total_sales']
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_revenue'] = Sale.objects.aggregate(
-            revenue=Sum(F('quantity') * F('sale_price'))
-        )['revenue'] or Decimal('0.00')
+        context['total_sales'] = self.sales_totals['total_sales']
+        context['total_revenue'] = self.sales_totals['total_revenue']
         return context
 
 
@@ -247,13 +299,21 @@ class SaleCreateView(CreateView):
 
 
 # Supplier Views
-class SupplierListView(ListView):
+class SupplierListView(KeysetPaginationMixin, ListView):
     """List all suppliers"""
     model = Supplier
     template_name = 'store/supplier_list.html'
     context_object_name = 'suppliers'
     paginate_by = 20
 
+    def get_queryset(self):
+        return Supplier.objects.with_bike_counts().order_by('name', 'pk')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['total_suppliers'] = context['paginator'].count
+        return context
+
 
 class SupplierDetailView(DetailView):
     """Detailed view of a single supplier"""
@@ -302,105 +362,413 @@ class SupplierDeleteView(DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+# Reorder Planning
+class ReorderPlanView(ListView):
+    """Bikes at or below their reorder point, as draft purchase orders per supplier"""
+    template_name = 'store/reorder_plan.html'
+    context_object_name = 'lines'
+    paginate_by = 50
+
+    @cached_property
+    def supplier(self):
+        """The supplier pk to show, 0 for bikes without one, or None for all"""
+        value = self.request.GET.get('supplier', '')
+        if value == 'none':
+            return 0
+        return int(value) if value.isdigit() else None
+
+    def get_queryset(self):
+        return reorder_lines(self.supplier).select_related('supplier')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        drafts = supplier_summary()
+        context['drafts'] = drafts
+        context['selected_supplier'] = self.supplier
+        context['total_units'] = sum(draft['units'] for draft in drafts)
+        context['total_value'] = sum((draft['value'] for draft in drafts), Decimal('0.00'))
+        return context
+
+
+# Export Views
+class BikeExportView(ExportMixin, BikeListView):
+    """Stream every bike the bike list's filters select"""
+    export_name = 'bikes'
+    export_fields = {
+        'id': 'pk',
+        'brand': 'brand',
+        'model': 'model',
+        'type': 'type',
+        'color': 'color',
+        'price': 'price',
+        'stock_quantity': 'stock_quantity',
+        'supplier': 'supplier__name',
+        'created_at': 'created_at',
+    }
+
+
+class CustomerExportView(ExportMixin, CustomerListView):
+    """Stream every customer the customer list's search selects"""
+    export_name = 'customers'
+    export_fields = {
+        'id': 'pk',
+        'name': 'name',
+        'email': 'email',
+        'phone': 'phone',
+        'address': 'address',
+        'purchases': 'purchase_count',
+        'amount_spent': 'lifetime_spend',
+        'last_purchase_at': 'last_purchase_at',
+        'created_at': 'created_at',
+    }
+
+
+class SaleExportView(ExportMixin, SaleListView):
+    """Stream the full sales history, newest first"""
+    export_name = 'sales'
+    export_fields = {
+        'id': 'pk',
+        'sale_date': 'sale_date',
+        'customer': 'customer__name',
+        'customer_email': 'customer__email',
+        'bike_brand': 'bike__brand',
+        'bike_model': 'bike__model',
+        'bike_color': 'bike__color',
+        'quantity': 'quantity',
+        'sale_price': 'sale_price',
+        'total_amount': ExpressionWrapper(
+            F('quantity') * F('sale_price'), output_field=DecimalField(max_digits=16, decimal_places=2)
+        ),
+        'notes': 'notes',
+    }
+
+
+class ReorderExportView(ExportMixin, ReorderPlanView):
+    """Stream the reorder plan's lines, supplier by supplier"""
+    export_name = 'reorders'
+    export_fields = {
+        'supplier': 'supplier__name',
+        'bike_id': 'pk',
+        'brand': 'brand',
+        'model': 'model',
+        'color': 'color',
+        'stock_quantity': 'stock_quantity',
+        'reorder_point': 'reorder_point',
+        'maximum_stock': 'maximum_stock',
+        'order_quantity': 'order_quantity',
+        'price': 'price',
+    }
+
+
 # Reports and Analytics
+def _growth(current, previous):
+    """Percentage change from previous to current, or None without a previous figure"""
+    if not previous:
+        return None
+    return float((current - previous) / previous * 100)
+
+
+def _report_totals(series):
+    sale_count = sum(row['sale_count'] for row in series)
+    revenue = sum(row['revenue'] for row in series)
+    return {
+        'sale_count': sale_count,
+        'units_sold': sum(row['units_sold'] for row in series),
+        'revenue': revenue,
+        'avg_sale': revenue / sale_count if sale_count else Decimal('0.00'),
+    }
+
+
+def _report_options(cleaned_data):
+    """(start, end, granularity, filters) for sales_series from a valid ReportForm"""
+    filters = {
+        'bike_type': cleaned_data['bike_type'],
+        'supplier': cleaned_data['supplier'] and cleaned_data['supplier'].pk,
+        'customer': cleaned_data['customer'] and cleaned_data['customer'].pk,
+    }
+    return cleaned_data['start_date'], cleaned_data['end_date'], cleaned_data['granularity'], filters
+
+
 def reports(request):
-    """Generate various reports and analytics"""
-    # Sales by month
-    from django.db.models import DateTrunc
-    monthly_sales = Sale.objects.annotate(
-        month=DateTrunc('month', 'sale_date')
-    ).values('month').annotate(
-        total_sales=Count('id'),
-        total_revenue=Sum(F('quantity') * F('sale_price'))
-    ).order_by('month')
+    """Sales over a date range by day, week, month or quarter, compared with the range before"""
+    today = timezone.localdate()
+    defaults = {'start_date': today.replace(month=1, day=1), 'end_date': today, 'granularity': 'month'}
+    form = ReportForm({**defaults, **request.GET.dict()})
+    if form.is_valid():
+        options = form.cleaned_data
+    else:
+        # Report on the defaults and show the form's errors
+        fallback = ReportForm(defaults)
+        fallback.is_valid()
+        options = fallback.cleaned_data
+    start, end, granularity, filters = _report_options(options)
+
+    series = sales_series(start, end, granularity, **filters)
+    length = end - start + timedelta(days=1)
+    totals = _report_totals(series)
+    previous = _report_totals(sales_series(start - length, start - timedelta(days=1), granularity, **filters))
 
     # Top selling bikes
-    top_bikes = Bike.objects.annotate(
-        total_sold=Sum('sales__quantity'),
-        total_revenue=Sum(F('sales__quantity') * F('sales__sale_price'))
-    ).filter(total_sold__gt=0).order_by('-total_sold')[:10]
+    top_bikes = list(Bike.objects.filter(units_sold__gt=0).order_by('-units_sold')[:5])
 
     # Top customers
-    top_customers = Customer.objects.annotate(
-        total_spent=Sum(F('sales__quantity') * F('sales__sale_price')),
-        total_bikes=Sum('sales__quantity')
-    ).filter(total_spent__gt=0).order_by('-total_spent')[:10]
-
-    # Low stock alerts
-    low_stock = Bike.objects.filter(stock_quantity__lt=5)
+    top_customers = Customer.objects.filter(lifetime_spend__gt=0).order_by('-lifetime_spend')[:10]
 
+    recent_sales = sales_in_range(start, end, **filters).select_related('customer', 'bike').order_by('-sale_date')[:10]
+    sales_by_type = store_stats()['sales_by_type']
+    labels = json.dumps([period_label(row['period'], granularity) for row in series])
     context = {
-        'monthly_sales': monthly_sales,
-        'top_bikes': top_bikes,
+        'form': form,
+        'granularity': dict(SalesPeriod.GRANULARITIES)[granularity],
+        'total_sales': totals['sale_count'],
+        'total_revenue': totals['revenue'],
+        'total_bikes_sold': totals['units_sold'],
+        'avg_sale': totals['avg_sale'],
+        'sales_growth': _growth(totals['sale_count'], previous['sale_count']),
+        'revenue_growth': _growth(totals['revenue'], previous['revenue']),
+        'avg_sale_change': _growth(totals['avg_sale'], previous['avg_sale']),
+        'units_growth': _growth(totals['units_sold'], previous['units_sold']),
+        'sales_trend_labels': labels,
+        'sales_trend_data': json.dumps([row['sale_count'] for row in series]),
+        'revenue_labels': labels,
+        'revenue_data': json.dumps([float(row['revenue']) for row in series]),
+        'top_bikes_labels': json.dumps([f'{bike.brand} {bike.model}' for bike in top_bikes]),
+        'top_bikes_data': json.dumps([bike.units_sold for bike in top_bikes]),
+        'bike_types_labels': json.dumps([row['type'] for row in sales_by_type]),
+        'bike_types_data': json.dumps([row['sale_count'] for row in sales_by_type]),
         'top_customers': top_customers,
-        'low_stock': low_stock,
-        'total_revenue': Sale.objects.aggregate(
-            revenue=Sum(F('quantity') * F('sale_price'))
-        )['revenue'] or Decimal('0.00'),
-        'total_bikes_sold': Sale.objects.aggregate(
-            total=Sum('quantity')
-        )['total'] or 0,
+        'low_stock_bikes': Bike.objects.filter(stock_quantity__lt=LOW_STOCK_LEVEL),
+        'recent_sales': recent_sales,
     }
     return render(request, 'store/reports.html', context)
 
 
 # API Views for AJAX requests
-def api_bike_price(request, bike_id):
+#
+# The read-only endpoints send a strong ETag built from the same topic
+# versions as their cache entries, and no-cache so browsers revalidate every
+# poll; a matching If-None-Match gets a 304 without touching the database.
+def _bike_price_topics(bike_id):
+    return (f'bike:{bike_id}',)
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=lambda request, bike_id: caching.etag('bike_price', _bike_price_topics(bike_id)))
+async def api_bike_price(request, bike_id):
     """Get bike price for sale form"""
-    try:
-        bike = Bike.objects.get(id=bike_id)
-        return JsonResponse({
-            'success': True,
-            'price': float(bike.price),
-            'stock': bike.stock_quantity
-        })
-    except Bike.DoesNotExist:
-        return JsonResponse({'success': False})
-
-
-def api_dashboard_data(request):
-    """API endpoint for dashboard statistics"""
-    data = {
-        'total_bikes': Bike.objects.count(),
-        'total_customers': Customer.objects.count(),
-        'total_sales': Sale.objects.count(),
-        'total_revenue': float(Sale.objects.aggregate(
-            revenue=Sum(F('quantity') * F('sale_price'))
-        )['revenue'] or Decimal('0.00')),
-        'low_stock_count': Bike.objects.filter(stock_quantity__lt=5).count(),
-        'sales_by_type': list(Bike.objects.values('type').annotate(
-            count=Count('sales'),
-            revenue=Sum(F('sales__quantity') * F('sales__sale_price'))
-        ).filter(count__gt=0))
+    async def price():
+        try:
+            bike = await Bike.objects.aget(id=bike_id)
+            return {
+                'success': True,
+                'price': float(bike.price),
+                'stock': bike.stock_quantity
+            }
+        except Bike.DoesNotExist:
+            return {'success': False}
+
+    return JsonResponse(await caching.acached('bike_price', _bike_price_topics(bike_id), price))
+
+
+async def _dashboard_data():
+    stats = await astore_stats()
+    return {
+        'total_bikes': stats['total_bikes'],
+        'total_customers': stats['total_customers'],
+        'total_sales': stats['total_sales'],
+        'total_revenue': float(stats['total_revenue']),
+        'low_stock_count': stats['low_stock_count'],
+        'sales_by_type': [
+            {
+                'type': row['type'],
+                'count': row['sale_count'],
+                'revenue': row['revenue'],
+            }
+            for row in stats['sales_by_type']
+        ]
     }
-    return JsonResponse(data)
 
 
-def api_sales_by_bike_type(request):
-    """API endpoint for sales by bike type chart"""
-    sales_data = Sale.objects.select_related('bike').values('bike__type').annotate(
-        total_sales=Count('id')
-    ).order_by('-total_sales')
+@cache_control(no_cache=True)
+@condition(etag_func=lambda request: caching.etag('api_dashboard', DASHBOARD_TOPICS))
+async def api_dashboard_data(request):
+    """API endpoint for dashboard statistics, polled by main.js"""
+    return JsonResponse(await caching.acached('api_dashboard', DASHBOARD_TOPICS, _dashboard_data))
+
+
+async def _sales_by_bike_type_data():
+    sales_data = BikeTypeSalesRollup.objects.filter(
+        sale_count__gt=0
+    ).values('bike_type', 'sale_count').order_by('-sale_count')
     
     # Convert to dictionary format expected by Chart.js
     chart_data = {}
-    for item in sales_data:
-        bike_type = item['bike__type']
-        chart_data[bike_type] = item['total_sales']
-    
-    return JsonResponse(chart_data)
+    async for item in sales_data:
+        bike_type = item['bike_type']
+        chart_data[bike_type] = item['sale_count']
+    return chart_data
 
 
-def api_bike_inventory(request):
-    """API endpoint for bike inventory by type chart"""
+@cache_control(no_cache=True)
+@condition(etag_func=lambda request: caching.etag('sales_by_bike_type', ('rollups',)))
+async def api_sales_by_bike_type(request):
+    """API endpoint for sales by bike type chart"""
+    return JsonResponse(
+        await caching.acached('sales_by_bike_type', ('rollups',), _sales_by_bike_type_data)
+    )
+
+
+def _sales_series_data(start, end, granularity, filters):
+    series = sales_series(start, end, granularity, **filters)
+    return {
+        'granularity': granularity,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'periods': [row['period'].isoformat() for row in series],
+        'labels': [period_label(row['period'], granularity) for row in series],
+        'sale_count': [row['sale_count'] for row in series],
+        'units_sold': [row['units_sold'] for row in series],
+        'revenue': [float(row['revenue']) for row in series],
+    }
+
+
+async def api_sales_series(request):
+    """API endpoint for sales per day, week, month or quarter over a date range.
+
+    Takes the reports page's parameters; without dates it covers this year
+    so far by month.
+    """
+    form = ReportForm(request.GET)
+    # Validating the supplier and customer reads the database
+    if not await sync_to_async(form.is_valid)():
+        return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+    options = _report_options(form.cleaned_data)
+    # Today is part of the key: the open period moves on at midnight
+    return JsonResponse(await caching.acached(
+        'sales_series', ('sale', 'bike', 'supplier'),
+        lambda: sync_to_async(_sales_series_data)(*options),
+        options, timezone.localdate(),
+    ))
+
+
+async def _bike_inventory_data():
     inventory_data = Bike.objects.values('type').annotate(
         total_stock=Sum('stock_quantity')
     ).order_by('-total_stock')
     
     # Convert to dictionary format expected by Chart.js
     chart_data = {}
-    for item in inventory_data:
+    async for item in inventory_data:
         bike_type = item['type']
         chart_data[bike_type] = item['total_stock'] or 0
-    
-    return JsonResponse(chart_data)
+    return chart_data
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=lambda request: caching.etag('bike_inventory', ('bike',)))
+async def api_bike_inventory(request):
+    """API endpoint for bike inventory by type chart"""
+    return JsonResponse(await caching.acached('bike_inventory', ('bike',), _bike_inventory_data))
+
+
+def prometheus_metrics(request):
+    """Request, SQL and connection pool metrics in the Prometheus text format.
+
+    With STORE_METRICS_TOKEN set, scrapers must send it as a bearer token.
+    """
+    token = getattr(settings, 'STORE_METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render() + pooling.render(connections),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def api_events(request):
+    """Server-sent events stream of dashboard changes, consumed by main.js.
+
+    Held open under ASGI. Under WSGI it would tie up a worker, so it sends a
+    snapshot when the dashboard changed since the client's last one and
+    ends, and EventSource polls by reconnecting.
+    """
+    async def snapshot():
+        return await caching.acached('api_dashboard', DASHBOARD_TOPICS, _dashboard_data)
+
+    if isinstance(request, ASGIRequest):
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_event_id = None
+        response = StreamingHttpResponse(
+            events.stream(snapshot, last_event_id), content_type='text/event-stream'
+        )
+    else:
+        # Read before the snapshot, so a write in between is sent again next time
+        version = '.'.join(map(str, await caching.aversions(DASHBOARD_TOPICS)))
+        body = await events.poll(snapshot, version, request.headers.get('Last-Event-ID'))
+        response = HttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_POST
+def api_create_order(request):
+    """API endpoint recording a multi-line order in one transaction.
+
+    Expects a JSON body of the form
+    {"lines": [{"customer": id, "bike": id, "quantity": n, "sale_price": "..."}],
+     "allow_partial": false}
+    and returns a result for every line.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Request body must be valid JSON.'}, status=400)
+
+    lines = payload.get('lines') if isinstance(payload, dict) else None
+    if not isinstance(lines, list) or not lines:
+        return JsonResponse({'success': False, 'error': '"lines" must be a non-empty list.'}, status=400)
+    if len(lines) > MAX_ORDER_LINES:
+        return JsonResponse(
+            {'success': False, 'error': f'Orders are limited to {MAX_ORDER_LINES} lines.'},
+            status=400
+        )
+
+    results = place_order(lines, allow_partial=bool(payload.get('allow_partial')))
+    created = sum(1 for result in results if result['success'])
+    return JsonResponse({
+        'success': created == len(results),
+        'created': created,
+        'results': results,
+    }, status=201 if created else 400)
+
+
+@require_POST
+async def api_search(request, search_type):
+    """Typeahead search used by static/js/search.js.
+
+    Expects a JSON body {"query": "...", "filters": {...},
+    "sort": {"field": "name", "order": "asc"}, "limit": 10}.
+    """
+    if search_type not in SEARCH_TYPES:
+        return JsonResponse({'success': False, 'message': f'Unknown search type "{search_type}".'}, status=404)
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Request body must be valid JSON.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'success': False, 'message': 'Request body must be a JSON object.'}, status=400)
+
+    filters = payload.get('filters') or {}
+    sort = payload.get('sort') or {}
+    if not isinstance(filters, dict) or not isinstance(sort, dict):
+        return JsonResponse({'success': False, 'message': '"filters" and "sort" must be objects.'}, status=400)
+    try:
+        data = await sync_to_async(typeahead)(
+            search_type, str(payload.get('query') or ''), filters, sort,
+            payload.get('limit') or 10,
+        )
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    return JsonResponse({'success': True, **data})